@@ -0,0 +1,6 @@
+"""
+Shared building blocks for the Kitchen Brigade scripts.
+
+``Kitchen_Brigade.py`` and ``Kitchen_Brigade_ingredients.py`` remain the entry
+points; the modules in this package hold the pieces both of them use.
+"""
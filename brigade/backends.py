@@ -0,0 +1,401 @@
+"""
+FAISS index backends.
+
+The backend is chosen by an index config: a dict (or a JSON file holding one)
+such as
+
+    {"backend": "ivf-pq", "nlist": 1024, "pq_m": 32, "nprobe": 16}
+
+Supported backends are ``flat`` (exact search, the original behaviour),
+``ivf-flat``, ``ivf-pq`` and ``hnsw``. Everything learned while building the
+index (coarse centroids, PQ codebooks, the HNSW graph) and the search-time
+settings are stored in the FAISS index file itself, so a saved index is
+self-describing. All backends use inner product over normalized embeddings,
+so ``index.search`` and ``Retriever.retrieve()`` behave the same whichever is
+active.
+
+``storage`` sets how vectors are stored: ``float32``, ``float16`` or ``int8``.
+It applies to ``embeddings.npy``, which the index is built and rebuilt from
+(int8 stores the components of the normalized embeddings times 127), and to
+the vectors the flat, IVF-Flat and HNSW indexes keep, which become FAISS
+scalar-quantized codes. Those codes are the stored vectors themselves: fp16
+codes are float16 values, and int8 indexes use a uniform 8 bit quantizer
+pinned to the grid of the stored bytes (code = byte + 127) instead of a range
+trained per dimension, so search and context selection see the same vectors.
+IVF-PQ has its own codes. float16 halves the size of both files and int8
+quarters it; the recall report measures what that costs.
+
+faiss is imported by the functions that need it, so the scripts can list the
+backends in their command line options without loading it.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+BACKENDS = ("flat", "ivf-flat", "ivf-pq", "hnsw")
+STORAGES = ("float32", "float16", "int8")
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+INT8_SCALE = 127.0
+# (min, width) of the uniform 8 bit quantizer that decodes code c to (c - 127) / 127
+INT8_CODE_RANGE = (-127.5 / INT8_SCALE, 255.0 / INT8_SCALE)
+
+DEFAULT_INDEX_CONFIG = {
+    "backend": None,        # None keeps whatever index is on disk; "flat" when building from scratch
+    "storage": None,        # None keeps the embeddings on disk as they are; "float32" when building from scratch
+    "nlist": 1024,          # IVF: number of coarse clusters (capped by the corpus size)
+    "nprobe": 16,           # IVF: clusters visited per query
+    "pq_m": 32,             # IVF-PQ: sub-quantizers; must divide the embedding dimension
+    "pq_nbits": 8,          # IVF-PQ: bits per sub-quantizer code
+    "hnsw_m": 32,           # HNSW: neighbours per node
+    "ef_construction": 200, # HNSW: candidate list size while building
+    "ef_search": 64,        # HNSW: candidate list size while searching
+    "train_size": 100000,   # rows sampled to train IVF/PQ
+}
+
+# Search-time settings swept by the recall-vs-latency report when no config file is given
+DEFAULT_SWEEP = [
+    {"backend": "flat"},
+    {"backend": "flat", "storage": "float16"},
+    {"backend": "flat", "storage": "int8"},
+    {"backend": "ivf-flat", "nprobe": [1, 4, 16, 64]},
+    {"backend": "ivf-pq", "nprobe": [4, 16, 64]},
+    {"backend": "hnsw", "ef_search": [16, 64, 256]},
+    {"backend": "hnsw", "storage": "int8", "ef_search": [16, 64, 256]},
+]
+
+
+def load_index_config(path: str = None, **overrides) -> dict:
+    """
+    Default index config, updated from the JSON file at path (if any) and then
+    from any overrides that are not None, e.g. a --index-backend option.
+    """
+    config = dict(DEFAULT_INDEX_CONFIG)
+    if path:
+        with open(path, "r") as f:
+            config.update(json.load(f))
+    config.update({key: value for (key, value) in overrides.items() if value is not None})
+
+    if config["backend"] is not None and config["backend"] not in BACKENDS:
+        raise ValueError(f"Index backend must be one of: {', '.join(BACKENDS)}")
+    if config["storage"] is not None and config["storage"] not in STORAGES:
+        raise ValueError(f"Index storage must be one of: {', '.join(STORAGES)}")
+    return config
+
+
+# ------------------------------------------------
+# Vector storage
+# ------------------------------------------------
+def storage_of(embeddings) -> str:
+    """Storage of an embeddings array, from its dtype."""
+    for (storage, dtype) in STORAGE_DTYPES.items():
+        if embeddings.dtype == dtype:
+            return storage
+    raise ValueError(f"Unsupported embeddings dtype {embeddings.dtype}")
+
+
+def quantize(vectors, storage: str):
+    """Normalized float32 vectors in the given storage."""
+    if storage == "int8":
+        return np.clip(np.rint(vectors * INT8_SCALE), -127, 127).astype(np.int8)
+    return np.asarray(vectors, dtype=STORAGE_DTYPES[storage])
+
+
+def dequantize(vectors):
+    """Stored vectors (a slice of an embeddings array of any storage) as float32."""
+    if vectors.dtype == np.int8:
+        return vectors.astype(np.float32) / INT8_SCALE
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def convert_embeddings(path: str, storage: str, chunk_size: int = 65536):
+    """
+    Rewrite the .npy file at path in storage, chunk by chunk, and return it
+    memory-mapped. The new file is moved into place when complete, so readers
+    never see a partial one.
+    """
+    embeddings = np.load(path, mmap_mode="r")
+    partial_path = f"{path}.partial.npy"
+    out = np.lib.format.open_memmap(partial_path, mode="w+", dtype=STORAGE_DTYPES[storage], shape=embeddings.shape)
+    for first in range(0, len(embeddings), chunk_size):
+        out[first:first + chunk_size] = quantize(dequantize(embeddings[first:first + chunk_size]), storage)
+    out.flush()
+    del out, embeddings
+    os.replace(partial_path, path)
+    return np.load(path, mmap_mode="r")
+
+
+def index_backend(index) -> str:
+    """Name of the backend a loaded FAISS index was built with."""
+    import faiss
+
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf-pq"
+    if isinstance(index, (faiss.IndexIVFFlat, faiss.IndexIVFScalarQuantizer)):
+        return "ivf-flat"
+    if isinstance(index, (faiss.IndexFlat, faiss.IndexScalarQuantizer)):
+        return "flat"
+    return type(index).__name__
+
+
+def scalar_quantizer(index):
+    """The FAISS scalar quantizer of a loaded flat, IVF or HNSW index, or None if it keeps float32 vectors or PQ codes."""
+    import faiss
+
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return index.sq
+    return None
+
+
+def pin_int8_grid(index):
+    """
+    Set the range of an int8 index's quantizer so its codes are the stored
+    int8 bytes plus 127. That is all a flat or HNSW index needs, so they count
+    as trained; IVF indexes still train their coarse quantizer.
+    """
+    import faiss
+
+    sq = scalar_quantizer(index)
+    if sq is not None and sq.qtype == faiss.ScalarQuantizer.QT_8bit_uniform:
+        faiss.copy_array_to_vector(np.array(INT8_CODE_RANGE, dtype=np.float32), sq.trained)
+        if not isinstance(index, faiss.IndexIVF):
+            if isinstance(index, faiss.IndexHNSW):
+                index.storage.is_trained = True
+            index.is_trained = True
+    return index
+
+
+def index_storage(index):
+    """
+    Storage of the vectors a loaded FAISS index keeps, or None for IVF-PQ
+    codes. An 8 bit index whose codes are not on the stored int8 grid (one
+    built with a trained range) is "int8-trained", so it gets rebuilt.
+    """
+    import faiss
+
+    if isinstance(index, faiss.IndexIVFPQ):
+        return None
+    sq = scalar_quantizer(index)
+    if sq is None:
+        return "float32"
+    if sq.qtype == faiss.ScalarQuantizer.QT_fp16:
+        return "float16"
+    on_grid = (sq.qtype == faiss.ScalarQuantizer.QT_8bit_uniform
+               and np.allclose(faiss.vector_to_array(sq.trained), INT8_CODE_RANGE))
+    return "int8" if on_grid else "int8-trained"
+
+
+def apply_search_params(index, config: dict):
+    """Set the search-time knobs of index from config; a no-op for flat indexes."""
+    import faiss
+
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = config["nprobe"]
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = config["ef_search"]
+    return index
+
+
+def make_index(config: dict, dim: int, rows: int):
+    """An empty, untrained index of the configured backend."""
+    import faiss
+
+    backend = config["backend"] or "flat"
+    qtype = {
+        "float16": faiss.ScalarQuantizer.QT_fp16,
+        "int8": faiss.ScalarQuantizer.QT_8bit_uniform,
+    }.get(config["storage"])
+
+    if backend == "flat":
+        if qtype is not None:
+            return pin_int8_grid(faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT))
+        return faiss.IndexFlatIP(dim)
+
+    if backend == "hnsw":
+        if qtype is not None:
+            index = faiss.IndexHNSWSQ(dim, qtype, config["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexHNSWFlat(dim, config["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = config["ef_construction"]
+        return pin_int8_grid(index)
+
+    # k-means wants ~39 training points per centroid; small corpora get fewer lists
+    nlist = max(1, min(config["nlist"], rows // 39))
+    quantizer = faiss.IndexFlatIP(dim)
+
+    if backend == "ivf-flat":
+        if qtype is not None:
+            # Encode the vectors themselves, not their residuals, so the codes are the stored vectors
+            return faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, qtype, faiss.METRIC_INNER_PRODUCT, False)
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+
+    if dim % config["pq_m"] != 0:
+        raise ValueError(f"pq_m={config['pq_m']} must divide the embedding dimension {dim}")
+    return faiss.IndexIVFPQ(quantizer, dim, nlist, config["pq_m"], config["pq_nbits"], faiss.METRIC_INNER_PRODUCT)
+
+
+def train_sample(embeddings, size: int, seed: int = 0):
+    """Up to size rows of embeddings picked at random, read in row order, as float32."""
+    rows = embeddings.shape[0]
+    if rows <= size:
+        return dequantize(np.asarray(embeddings))
+    picks = np.sort(np.random.default_rng(seed).choice(rows, size, replace=False))
+    return dequantize(embeddings[picks])
+
+
+def build_backend_index(embeddings, config: dict, chunk_size: int = 65536):
+    """Train (if needed) and fill an index of the configured backend and storage from embeddings."""
+    rows, dim = embeddings.shape
+    index = make_index(config, dim, rows)
+
+    if not index.is_trained:
+        print(f"  [⚙️] Training {config['backend'] or 'flat'} index on up to {config['train_size']} vectors")
+        index.train(train_sample(embeddings, config["train_size"]))
+    pin_int8_grid(index)
+
+    for first in range(0, rows, chunk_size):
+        index.add(dequantize(embeddings[first:first + chunk_size]))
+
+    return apply_search_params(index, config)
+
+
+# ------------------------------------------------
+# Delta index of ingested rows
+# ------------------------------------------------
+def make_delta_index(dim: int):
+    """An empty exact index for the rows brigade.ingest adds after the main index, added under their row ids."""
+    import faiss
+
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+
+class SegmentedIndex:
+    """
+    A main index and its delta searched as one: each query's hits from both
+    are merged by score. Everything else (ntotal aside) is the main index's,
+    so search parameters and index_fingerprint() see the main index.
+    """
+    def __init__(self, index, delta):
+        self.index = index
+        self.delta = delta
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal + self.delta.ntotal
+
+    def search(self, queries, k: int):
+        (D, I) = self.index.search(queries, k)
+        (delta_D, delta_I) = self.delta.search(queries, k)
+        D = np.hstack([D, delta_D])
+        I = np.hstack([I, delta_I])
+        # Best first; on equal scores the main index's hit comes first
+        order = np.argsort(-D, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+
+def load_delta_index(index, path: str, rows: int):
+    """
+    index, with the delta index at path if index stops short of the corpus's
+    rows. The two have to cover every row between them.
+    """
+    import faiss
+
+    if index.ntotal == rows:
+        return index
+    delta = faiss.read_index(path) if os.path.exists(path) else None
+    if delta is None or index.ntotal + delta.ntotal != rows:
+        raise ValueError(f"The index has {index.ntotal} of {rows} recipes and {path} doesn't hold the rest; "
+                         "run `python -m brigade.ingest compact` to rebuild it from the stored embeddings")
+    print(f"[💾] Loaded {delta.ntotal} added recipes from {path}")
+    return SegmentedIndex(index, delta)
+
+
+# ------------------------------------------------
+# Recall vs latency report
+# ------------------------------------------------
+def _sweep(entry: dict):
+    """Expand list-valued search settings of a sweep entry into single configs."""
+    swept = [(key, value) for (key, value) in entry.items() if isinstance(value, list)]
+    configs = [{}]
+    for (key, values) in swept:
+        configs = [dict(config, **{key: value}) for config in configs for value in values]
+    return [dict(entry, **config) for config in configs]
+
+
+def _timed_search(index, queries, k: int):
+    start = time.perf_counter()
+    _, ids = index.search(queries, k)
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall_report(embeddings, sweep=DEFAULT_SWEEP, queries: int = 1000, k: int = 10,
+                  noise: float = 0.05, seed: int = 0):
+    """
+    Compare each backend, storage and search setting of sweep against exact
+    flat search over float32 vectors. Queries are corpus vectors with a little
+    Gaussian noise, so they behave like paraphrased dish requests rather than
+    exact duplicates of indexed recipes. Returns one row per setting with
+    recall@k, its delta against the same backend and settings stored as
+    float32 (if swept), latency and index size. Measure on float32
+    embeddings: on compressed ones the baseline is compressed too.
+    """
+    import faiss
+
+    rng = np.random.default_rng(seed)
+    sample = train_sample(embeddings, queries, seed)
+    q = sample + rng.normal(scale=noise, size=sample.shape).astype(np.float32)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+
+    flat = build_backend_index(embeddings, load_index_config(backend="flat", storage="float32"))
+    truth, _ = _timed_search(flat, q, k)
+
+    rows = []
+    for entry in sweep:
+        configs = [load_index_config(**config) for config in _sweep(entry)]
+
+        start = time.perf_counter()
+        index = build_backend_index(embeddings, configs[0])
+        build_seconds = time.perf_counter() - start
+        size = faiss.serialize_index(index).nbytes
+
+        for config in configs:
+            apply_search_params(index, config)
+            ids, ms_per_query = _timed_search(index, q, k)
+            hits = sum(len(set(found) & set(expected)) for (found, expected) in zip(ids, truth))
+            settings = {key: config[key] for key in entry if key not in ("backend", "storage")}
+            rows.append({
+                "backend": config["backend"],
+                "storage": config["storage"] or "float32",
+                "settings": settings,
+                "recall": hits / truth.size,
+                "ms_per_query": ms_per_query,
+                "build_seconds": build_seconds,
+                "size_mb": size / 2**20,
+            })
+
+    # Recall lost to compressed storage, against the same backend and settings stored as float32
+    baseline = {(row["backend"], str(row["settings"])): row["recall"] for row in rows if row["storage"] == "float32"}
+    for row in rows:
+        found = baseline.get((row["backend"], str(row["settings"])))
+        row["recall_delta"] = row["recall"] - found if found is not None else None
+    return rows
+
+
+def print_recall_report(rows, k: int):
+    print(f"{'backend':<10} {'storage':<8} {'settings':<22} {f'recall@{k}':>10} {'vs f32':>7} "
+          f"{'ms/query':>10} {'build s':>9} {'size MB':>9}")
+    for row in rows:
+        settings = ", ".join(f"{key}={value}" for (key, value) in row["settings"].items())
+        delta = f"{row['recall_delta']:+.3f}" if row["recall_delta"] is not None else "-"
+        print(
+            f"{row['backend']:<10} {row['storage']:<8} {settings:<22} {row['recall']:>10.3f} {delta:>7} "
+            f"{row['ms_per_query']:>10.3f} {row['build_seconds']:>9.2f} {row['size_mb']:>9.1f}"
+        )
@@ -0,0 +1,290 @@
+"""
+Batch runner: run many dish x crew x ingredients x recipe combinations from
+one manifest across a pool of worker processes.
+
+The embedder, FAISS index and corpus snapshot are loaded once, in the parent,
+for every set of index and retrieval options (--retrieval, --index-backend,
+--index-storage, --index-config, --retrieval-cache) the runs use. The recipes
+for every dish without a recipe file are retrieved there, in one batch per
+set of context options (--context-docs, --context-tokens, --mmr-lambda and
+the provider and model counting the tokens); when every run has a recipe
+file nothing is loaded at all. Each run is parsed by the script that
+executes it, so these are the run's own options. Retrieval is finished, and
+the index released, before any worker starts: each worker is handed the
+texts of its run's recipes and never loads the embedder, the index or the
+corpus. Workers are started with "spawn" rather than forked, so they don't
+inherit the parent's torch and tokenizer threads or its memory.
+
+Each combination writes its output files, plus a ``run.log`` with what the
+script would have printed, into its own directory:
+``<output_root>/<dish>/<crew>/`` and, when given, ``<ingredients>/`` and
+``<recipe>/`` below that, e.g. ``results/grilled-cheese/short-order/``.
+
+Manifest (JSON)::
+
+    {
+        "output_root": "results",
+        "options": ["--provider", "openai", "--llm-cache", ".cache/llm.sqlite"],
+        "matrix": {
+            "dishes": ["Make me a Hamburger", {"label": "custom-hamburger", "dish": "Make me a Hamburger with ..."}],
+            "crews": ["crew.json", "results/grilled-cheese/short-order/short-order.json"],
+            "ingredients": ["results/ingredients-and-utensils/baseline-resources.txt"],
+            "recipes": ["results/ingredients-and-utensils/roast-chicken.txt"]
+        },
+        "runs": [
+            {"dish": "Make me a grilled cheese sandwich", "crew": "crew.json", "options": ["--stream"]}
+        ]
+    }
+
+Every combination of the "matrix" lists is run ("ingredients" and "recipes"
+are optional), followed by the explicit "runs". "options" are extra command
+line arguments passed to every run; a run's own "options" come after them.
+Combinations with ingredients run Kitchen_Brigade_ingredients, the others
+Kitchen_Brigade.
+
+--llm-rpm and --llm-tpm are the provider's budgets for the whole batch. Each
+worker process has its own request scheduler (brigade/ratelimit.py), so
+every worker gets an equal share of them.
+"""
+import argparse
+import contextlib
+import gc
+import hashlib
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from brigade.context import token_counter
+from brigade.pipeline import Retriever
+
+SCRIPT = "Kitchen_Brigade"
+INGREDIENTS_SCRIPT = "Kitchen_Brigade_ingredients"
+RUN_LOG = "run.log"
+
+
+def slug(text: str, max_length: int = 48) -> str:
+    """Directory name for a dish: 'Make me a Hamburger' -> 'make-me-a-hamburger'."""
+    name = re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "dish"
+    if len(name) > max_length:
+        # Keep long, similar dishes apart
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+        name = f"{name[:max_length].rstrip('-')}-{digest}"
+    return name
+
+
+def stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _dish(entry):
+    """(dish, label) from a manifest dish entry: a string, or {"dish": ..., "label": ...}."""
+    if isinstance(entry, dict):
+        return (entry["dish"], entry.get("label") or slug(entry["dish"]))
+    return (entry, slug(entry))
+
+
+def load_manifest(path: str) -> list[dict]:
+    """
+    The runs of a manifest, each a dict with dish, crew, ingredients, recipe
+    (None if not given), options and output_directory.
+    """
+    with open(path, "r") as f:
+        manifest = json.load(f)
+
+    root = manifest.get("output_root", "results")
+    options = list(manifest.get("options", []))
+    runs = []
+
+    matrix = manifest.get("matrix")
+    if matrix:
+        if not matrix.get("dishes") or not matrix.get("crews"):
+            raise ValueError(f"{path}: the matrix needs at least one entry in 'dishes' and in 'crews'")
+        recipes = matrix.get("recipes") or [None]
+        for (dish, crew, ingredients, recipe) in itertools.product(
+            matrix["dishes"], matrix["crews"], matrix.get("ingredients") or [None], recipes
+        ):
+            runs.append({
+                "dish": dish, "crew": crew, "ingredients": ingredients, "recipe": recipe,
+                # A single recipe is shared by every run; several get a directory each
+                "recipe_dir": len(recipes) > 1,
+            })
+
+    for entry in manifest.get("runs", []):
+        if "dish" not in entry or "crew" not in entry:
+            raise ValueError(f"{path}: every run needs a 'dish' and a 'crew'")
+        runs.append(dict(entry, recipe_dir=bool(entry.get("recipe"))))
+
+    resolved = []
+    for run in runs:
+        (dish, label) = _dish(run["dish"])
+        parts = [root, label, stem(run["crew"])]
+        if run.get("ingredients"):
+            parts.append(stem(run["ingredients"]))
+        if run.get("recipe") and run["recipe_dir"]:
+            parts.append(stem(run["recipe"]))
+        resolved.append({
+            "dish": dish,
+            "crew": run["crew"],
+            "ingredients": run.get("ingredients"),
+            "recipe": run.get("recipe"),
+            "options": options + list(run.get("options", [])),
+            "output_directory": run.get("output_directory") or os.path.join(*parts),
+        })
+
+    if not resolved:
+        raise ValueError(f"{path}: no 'matrix' or 'runs' to run")
+
+    directories = [run["output_directory"] for run in resolved]
+    duplicates = sorted({d for d in directories if directories.count(d) > 1})
+    if duplicates:
+        raise ValueError(f"{path}: several runs would write to {', '.join(duplicates)}")
+    return resolved
+
+
+def run_argv(run: dict) -> list[str]:
+    """Command line of the brigade script for one run."""
+    argv = ["--dish", run["dish"], "--crew", run["crew"], "--output-directory", run["output_directory"]]
+    if run["ingredients"]:
+        argv += ["--ingredients", run["ingredients"]]
+    if run["recipe"]:
+        argv += ["--recipe", run["recipe"]]
+    return argv + run["options"]
+
+
+def script_name(run: dict) -> str:
+    return INGREDIENTS_SCRIPT if run["ingredients"] else SCRIPT
+
+
+def _run_one(run: dict, docs):
+    """Worker: run one combination, with its output in run.log. Returns (directory, seconds, error)."""
+    started = time.perf_counter()
+    os.makedirs(run["output_directory"], exist_ok=True)
+    with open(os.path.join(run["output_directory"], RUN_LOG), "w") as log:
+        with contextlib.redirect_stdout(log):
+            try:
+                pipeline = importlib.import_module(script_name(run)).pipeline
+                pipeline.run(pipeline.parse_args(run_argv(run)), docs)
+                error = None
+            except Exception:
+                error = traceback.format_exc()
+                print(error)
+    return (run["output_directory"], time.perf_counter() - started, error)
+
+
+def retrieval_options(args) -> tuple:
+    """The options of a run that decide which index and retrieval files are loaded."""
+    return (args.retrieval, args.index_backend, args.index_storage, args.index_config, args.retrieval_cache)
+
+
+def context_options(args) -> tuple:
+    """The options of a run that decide which recipes end up in its context."""
+    return (args.context_docs, args.context_tokens, args.mmr_lambda, args.provider, args.model)
+
+
+def retrieve_docs(runs: list[dict]) -> list:
+    """
+    The retrieved recipes of every run, or None for runs with a recipe file.
+    Each run is parsed by the script that will execute it. Runs with the same
+    index and retrieval options share one loaded index, and their dishes are
+    retrieved in one batch per set of context options.
+    """
+    groups = {}  # retrieval options -> (args, {context options -> (args, {dish: [run number, ...]})})
+    for (n, run) in enumerate(runs):
+        if run["recipe"]:
+            continue
+        pipeline = importlib.import_module(script_name(run)).pipeline
+        args = pipeline.parse_args(run_argv(run))
+        (_, contexts) = groups.setdefault(retrieval_options(args), (args, {}))
+        (_, dishes) = contexts.setdefault(context_options(args), (args, {}))
+        dishes.setdefault(run["dish"], []).append(n)
+
+    docs = [None] * len(runs)
+    for (args, contexts) in groups.values():
+        retriever = Retriever()
+        retriever.prepare(args)
+        for (args, dishes) in contexts.values():
+            hits = retriever.retrieve_many(list(dishes), args.context_docs, args.context_tokens,
+                                           token_counter(args.provider, args.model), args.mmr_lambda)
+            for (numbers, context) in zip(dishes.values(), hits):
+                for n in numbers:
+                    docs[n] = [text for (text, _) in context]
+        # One index at a time: release this one before loading the next
+        del retriever
+    return docs
+
+
+def run_batch(runs: list[dict], workers: int = None, rpm: float = None, tpm: float = None) -> list:
+    """
+    Run every combination in runs, sharing the LLM budgets rpm and tpm
+    between the workers; returns [(output directory, seconds, error or
+    None), ...] in completion order.
+    """
+    # Runs with a recipe file skip retrieval; if they all have one, the index is never loaded
+    docs = retrieve_docs(runs)
+    gc.collect()
+
+    workers = workers or min(len(runs), os.cpu_count() or 1)
+    print(f"[🍽️] Running {len(runs)} combinations on {workers} workers")
+
+    # A run's own options come later and take precedence
+    budgets = []
+    if rpm:
+        budgets += ["--llm-rpm", str(rpm / workers)]
+    if tpm:
+        budgets += ["--llm-tpm", str(tpm / workers)]
+    runs = [dict(run, options=budgets + run["options"]) for run in runs]
+
+    outcomes = []
+    # spawn: workers only need the retrieved texts, not a copy of a process that loaded torch
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(_run_one, run, run_docs) for (run, run_docs) in zip(runs, docs)]
+        for future in as_completed(futures):
+            (directory, seconds, error) = future.result()
+            status = "failed, see run.log" if error else "done"
+            print(f"  [🍽️] {directory}: {status} in {seconds:.1f}s")
+            outcomes.append((directory, seconds, error))
+    return outcomes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser("brigade.batch", description="Run the kitchen brigade for every combination in a manifest.")
+    parser.add_argument("manifest",
+                        help="JSON manifest of dish x crew x ingredients x recipe combinations.")
+    parser.add_argument("--workers", "-w",
+                        type=int,
+                        default=None,
+                        help="Number of combinations running at the same time. Default: number of CPUs, at most one per combination")
+    parser.add_argument("--llm-rpm",
+                        type=float,
+                        default=None,
+                        help="LLM requests per minute for the whole batch, shared equally by the workers. Default: no limit")
+    parser.add_argument("--llm-tpm",
+                        type=float,
+                        default=None,
+                        help="LLM tokens per minute for the whole batch, shared equally by the workers. Default: no limit")
+    parser.add_argument("--list",
+                        action="store_true",
+                        help="Only print the command line of each combination.")
+    args = parser.parse_args(argv)
+
+    runs = load_manifest(args.manifest)
+    if args.list:
+        for run in runs:
+            print(" ".join([f"{script_name(run)}.py"] + [json.dumps(a) if " " in a else a for a in run_argv(run)]))
+        return 0
+
+    outcomes = run_batch(runs, args.workers, args.llm_rpm, args.llm_tpm)
+    failed = [directory for (directory, _, error) in outcomes if error]
+    print(f"[🍽️] {len(outcomes) - len(failed)} of {len(outcomes)} combinations completed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
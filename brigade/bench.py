@@ -0,0 +1,197 @@
+"""
+Offline end-to-end benchmark of the brigade pipeline.
+
+    python -m brigade.bench --recipes 1000,100000,1000000 --crews 15,50,150,500
+
+The whole ``build_workflow`` pipeline runs with no network access: the LLM is
+the mock provider (brigade/mock.py), replaying its recorded responses with a
+configurable simulated latency, and retrieval runs against a synthetic
+corpus and index of the requested size with the hashing embedder
+(brigade/synthetic.py) and, unless --retrieval is dense, a lexical index
+over the same corpus, as the scripts would. Synthetic corpora and their
+lexical indexes are kept in the work directory and reused by later runs with
+the same parameters.
+
+For every corpus size and crew size the pipeline runs --runs times with
+--trace. For each stage (workflow node or LLM call) the report gives the
+number of calls, the p50/p95 latency, the mean and the throughput (calls per
+second of stage time). It also gives a batched
+retrieval throughput in queries per second for each corpus size. Results are
+printed as tables and written as JSON. Options the benchmark does not know
+are passed on to the script, e.g. ``--plan-format json``.
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import time
+
+import numpy as np
+
+from brigade.backends import BACKENDS, load_index_config
+from brigade.lexical import LEXICAL_FILE, load_lexical_index
+from brigade.mock import DEFAULT_RESPONSES
+from brigade.retrieval import RETRIEVAL_MODES, search_many
+from brigade.synthetic import PROTEINS, VEGETABLES, build_synthetic_index, synthetic_crew
+from brigade.trace import percentile
+
+DEFAULT_RECIPES = (1000, 100000, 1000000)
+DEFAULT_CREWS = (15, 50, 150, 500)
+WORKDIR = ".bench"
+REPORT_FILE = "bench-report.json"
+
+
+def sizes(text: str) -> list[int]:
+    return [int(size) for size in text.split(",") if size]
+
+
+def stage_rows(spans) -> list[dict]:
+    """Per span name: calls, p50/p95/mean latency in seconds and calls per second of stage time."""
+    walls = {}
+    for span in spans:
+        walls.setdefault(span.name, []).append(span.wall_seconds)
+    return [
+        {
+            "stage": name,
+            "calls": len(values),
+            "p50_seconds": percentile(values, 50),
+            "p95_seconds": percentile(values, 95),
+            "mean_seconds": sum(values) / len(values),
+            "throughput_per_second": len(values) / sum(values) if sum(values) else float("inf"),
+            "peak_rss_bytes": max(span.peak_rss_bytes for span in spans if span.name == name),
+        }
+        for (name, values) in walls.items()
+    ]
+
+
+def retrieval_throughput(embedder, index, texts, queries: int, k: int = 5, lexical=None) -> float:
+    """Queries per second of one batched search_many call over queries synthetic dish requests."""
+    requests = [f"Make me {PROTEINS[n % len(PROTEINS)]} with {VEGETABLES[n // len(PROTEINS) % len(VEGETABLES)]}"
+                for n in range(queries)]
+    started = time.perf_counter()
+    search_many(embedder, index, texts, requests, k, lexical=lexical)
+    return queries / (time.perf_counter() - started)
+
+
+def run_pipeline(pipeline, argv: list[str]):
+    """Run the script's pipeline once, silently; returns its recorded spans."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        pipeline.run(pipeline.parse_args(argv))
+    return list(pipeline.tracer.spans)
+
+
+def print_cell(cell: dict):
+    print(f"\n=== {cell['recipes']} recipes, crew of {cell['crew']}, {cell['runs']} runs ===")
+    print(f"retrieval: {cell['retrieval_qps']:.0f} queries/s batched")
+    print(f"{'stage':<22} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'per s':>9} {'peak MB':>8}")
+    for row in cell["stages"]:
+        print(f"{row['stage']:<22} {row['calls']:>6} {row['p50_seconds'] * 1000:>9.1f} "
+              f"{row['p95_seconds'] * 1000:>9.1f} {row['mean_seconds'] * 1000:>9.1f} "
+              f"{row['throughput_per_second']:>9.1f} {row['peak_rss_bytes'] / 2**20:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser("brigade.bench", description="Offline benchmark of the whole pipeline.")
+    parser.add_argument("--recipes", "-n",
+                        type=sizes,
+                        default=DEFAULT_RECIPES,
+                        help="Comma-separated synthetic corpus sizes. Default: 1000,100000,1000000")
+    parser.add_argument("--crews", "-c",
+                        type=sizes,
+                        default=DEFAULT_CREWS,
+                        help="Comma-separated crew sizes (team members). Default: 15,50,150,500")
+    parser.add_argument("--runs", "-r",
+                        type=int,
+                        default=3,
+                        help="Pipeline runs per corpus and crew size. Default: 3")
+    parser.add_argument("--dish", "-d",
+                        default="Make me a Hamburger",
+                        help="Dish requested in every run. Default: 'Make me a Hamburger'")
+    parser.add_argument("--ingredients", "-i",
+                        default=None,
+                        help="Run Kitchen_Brigade_ingredients with this ingredients file instead of Kitchen_Brigade.")
+    parser.add_argument("--latency",
+                        type=float,
+                        default=0.0,
+                        help="Simulated seconds per LLM call. Default: 0")
+    parser.add_argument("--jitter",
+                        type=float,
+                        default=0.0,
+                        help="Simulated latency varies by up to this fraction, reproducibly. Default: 0")
+    parser.add_argument("--responses",
+                        default=DEFAULT_RESPONSES,
+                        help="Directory of recorded runs the mock provider replays. Default: brigade/fixtures/responses")
+    parser.add_argument("--retrieval",
+                        choices=RETRIEVAL_MODES,
+                        default="hybrid",
+                        help="Search the synthetic corpora with the hashing embedder and FAISS index, a lexical "
+                             "index, or both fused, as the scripts' --retrieval does. Default: hybrid")
+    parser.add_argument("--queries", "-q",
+                        type=int,
+                        default=256,
+                        help="Queries in the batched retrieval measurement. Default: 256")
+    parser.add_argument("--backend", "-b",
+                        choices=BACKENDS,
+                        default=None,
+                        help="Index backend of the synthetic corpora. Default: flat")
+    parser.add_argument("--index-config",
+                        default=None,
+                        help="JSON file with the index backend and its parameters.")
+    parser.add_argument("--workdir", "-w",
+                        default=WORKDIR,
+                        help=f"Directory for synthetic corpora, crews and run outputs. Default: {WORKDIR}")
+    parser.add_argument("--report",
+                        default=REPORT_FILE,
+                        help=f"JSON file for the results. Default: {REPORT_FILE}")
+    args, options = parser.parse_known_args(argv)
+
+    os.environ["MOCK_LLM_RESPONSES"] = args.responses
+    os.environ["MOCK_LLM_LATENCY"] = str(args.latency)
+    os.environ["MOCK_LLM_JITTER"] = str(args.jitter)
+    pipeline = importlib.import_module("Kitchen_Brigade_ingredients" if args.ingredients else "Kitchen_Brigade").pipeline
+    config = load_index_config(args.index_config, backend=args.backend)
+
+    report = {"latency": args.latency, "jitter": args.jitter, "retrieval": args.retrieval, "options": options,
+              "corpora": [], "cells": []}
+    for recipes in args.recipes:
+        started = time.perf_counter()
+        directory = os.path.join(args.workdir, f"recipes-{recipes}")
+        (index, texts, embedder) = build_synthetic_index(directory, recipes, config)
+        lexical = load_lexical_index(os.path.join(directory, LEXICAL_FILE), texts) if args.retrieval != "dense" else None
+        if args.retrieval == "lexical":
+            (index, embedder) = (None, None)
+        report["corpora"].append({"recipes": recipes, "load_or_build_seconds": time.perf_counter() - started})
+        retriever = pipeline.retriever
+        (retriever.embedder, retriever.index, retriever.texts, retriever.lexical, retriever.cache) = (
+            embedder, index, texts, lexical, None)
+        retriever.embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r")
+        qps = retrieval_throughput(embedder, index, texts, args.queries, lexical=lexical)
+
+        for crew_size in args.crews:
+            crew_path = os.path.join(args.workdir, f"crew-{crew_size}.json")
+            with open(crew_path, "w") as f:
+                json.dump(synthetic_crew(crew_size), f, indent=2)
+
+            spans = []
+            for run in range(args.runs):
+                output_directory = os.path.join(args.workdir, "runs", f"{recipes}-{crew_size}-{run}")
+                os.makedirs(output_directory, exist_ok=True)
+                run_argv = ["--dish", args.dish, "--crew", crew_path, "--provider", "mock", "--model", "mock",
+                            "--retrieval", args.retrieval, "--trace", "--output-directory", output_directory]
+                if args.ingredients:
+                    run_argv += ["--ingredients", args.ingredients]
+                spans += run_pipeline(pipeline, run_argv + options)
+
+            cell = {"recipes": recipes, "crew": crew_size, "runs": args.runs,
+                    "retrieval_qps": qps, "stages": stage_rows(spans)}
+            report["cells"].append(cell)
+            print_cell(cell)
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[💾] Saved benchmark report to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
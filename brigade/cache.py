@@ -0,0 +1,291 @@
+"""
+Caches for retrieval and for LLM responses.
+
+Retrieval uses two levels: an in-process LRU in front of an on-disk SQLite
+store.
+
+Two kinds of entries are kept:
+
+- hits: the (document id, score) list for a normalized query, keyed by
+  embedding model, index fingerprint and k. A hit skips the embedder and the
+  index search entirely. Hybrid retrieval caches its fused list too, under
+  its own key, so a hit skips the lexical search and the fusion as well.
+- query embeddings, keyed by normalized query and embedding model, so a
+  repeated dish asked for with a different k, or against a rebuilt index,
+  still skips the embedder.
+
+Both levels enforce an entry limit (least recently used entries go first) and
+a time-to-live. Hit and miss counters are available from ``stats()`` and can
+be written out with ``export_stats()``.
+
+LLM responses are content-addressed: the key is a hash of the provider, the
+model, the prompt and the generation parameters. The store is bounded by its
+total size in bytes and can be opened read-only to replay recorded runs
+without any provider access.
+"""
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+RETRIEVAL_CACHE_FILE = os.path.join(".cache", "retrieval.sqlite")
+LLM_CACHE_FILE = os.path.join(".cache", "llm.sqlite")
+
+
+def normalize_query(query: str) -> str:
+    """Case-, width- and whitespace-insensitive form of a query."""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+def index_fingerprint(index_digest: bytes, index) -> str:
+    """
+    Identify an index by its file digest and size (brigade.ingest adds rows
+    without changing the file) plus the search settings that change its results.
+    """
+    nprobe = getattr(index, "nprobe", None)
+    ef_search = getattr(getattr(index, "hnsw", None), "efSearch", None)
+    return f"{index_digest.hex()}:{index.ntotal}:{nprobe}:{ef_search}"
+
+
+class LRUCache:
+    """In-process LRU map with an entry limit and an optional time-to-live in seconds."""
+    def __init__(self, max_entries: int = 1024, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            (stored, value) = entry
+            if self.ttl is not None and time.time() - stored > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache:
+    """
+    SQLite-backed key/value store with the same limits as LRUCache, plus an
+    optional limit on the total size of the stored values in bytes. Expired
+    and excess entries are evicted on write. A read-only store never writes,
+    not even access times.
+    """
+    def __init__(self, path: str, max_entries: int = 100000, ttl: float = None,
+                 max_bytes: int = None, read_only: bool = False):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self._lock = threading.Lock()
+
+        if read_only:
+            self._db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            return
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, stored REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._db.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, stored FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            (value, stored) = row
+            if self.ttl is not None and now - stored > self.ttl:
+                if not self.read_only:
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._db.commit()
+                return None
+            if not self.read_only:
+                self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                self._db.commit()
+            return value
+
+    def put(self, key: str, value: bytes):
+        if self.read_only:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, stored, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if self.ttl is not None:
+                self._db.execute("DELETE FROM entries WHERE stored < ?", (now - self.ttl,))
+            if self.max_entries is not None:
+                self._db.execute(
+                    "DELETE FROM entries WHERE key IN ("
+                    " SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            if self.max_bytes is not None:
+                # Keep the most recently used entries whose sizes add up to at most max_bytes
+                self._db.execute(
+                    "DELETE FROM entries WHERE key IN ("
+                    " SELECT key FROM ("
+                    "  SELECT key, SUM(length(value)) OVER (ORDER BY accessed DESC, key) AS running FROM entries)"
+                    " WHERE running > ?)",
+                    (self.max_bytes,),
+                )
+            self._db.commit()
+
+    def size(self) -> int:
+        """Total size of the stored values in bytes."""
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(length(value)), 0) FROM entries").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+
+class RetrievalCache:
+    """
+    Query-embedding and retrieval-result cache for one embedding model and one
+    index. Pass path=None for a memory-only cache.
+    """
+    def __init__(self, model_name: str, index_key: str, path: str = RETRIEVAL_CACHE_FILE,
+                 memory_entries: int = 1024, disk_entries: int = 100000,
+                 ttl: float = 7 * 24 * 3600):
+        self.model_name = model_name
+        self.index_key = index_key
+        self.memory = LRUCache(memory_entries, ttl)
+        self.disk = DiskCache(path, disk_entries, ttl) if path else None
+        self.counters = collections.Counter()
+
+    def _lookup(self, kind: str, key: str, decode):
+        value = self.memory.get(key)
+        if value is not None:
+            self.counters[f"{kind}_memory_hits"] += 1
+            return value
+
+        if self.disk is not None:
+            raw = self.disk.get(key)
+            if raw is not None:
+                self.counters[f"{kind}_disk_hits"] += 1
+                value = decode(raw)
+                self.memory.put(key, value)
+                return value
+
+        self.counters[f"{kind}_misses"] += 1
+        return None
+
+    def _store(self, key: str, value, encode):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, encode(value))
+
+    def _hits_key(self, query: str, k: int, fused: bool) -> str:
+        return json.dumps(["fused" if fused else "hits", normalize_query(query), self.model_name, self.index_key, k])
+
+    def _embedding_key(self, query: str) -> str:
+        return json.dumps(["embedding", normalize_query(query), self.model_name])
+
+    def get_hits(self, query: str, k: int, fused: bool = False):
+        """Cached [(document id, score), ...] for query, dense or fused with lexical hits, or None."""
+        return self._lookup("fused" if fused else "hits", self._hits_key(query, k, fused),
+                            lambda raw: [tuple(hit) for hit in json.loads(raw)])
+
+    def put_hits(self, query: str, k: int, hits, fused: bool = False):
+        self._store(self._hits_key(query, k, fused), hits, lambda value: json.dumps(value).encode("utf-8"))
+
+    def get_embedding(self, query: str):
+        """Cached float32 query embedding, or None."""
+        return self._lookup("embedding", self._embedding_key(query), lambda raw: np.frombuffer(raw, dtype=np.float32))
+
+    def put_embedding(self, query: str, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self._store(self._embedding_key(query), embedding, lambda value: value.tobytes())
+
+    def stats(self) -> dict:
+        """Hit and miss counters for each kind of entry, plus hit rates."""
+        stats = dict(self.counters)
+        for kind in ("hits", "fused", "embedding"):
+            hits = stats.get(f"{kind}_memory_hits", 0) + stats.get(f"{kind}_disk_hits", 0)
+            lookups = hits + stats.get(f"{kind}_misses", 0)
+            stats[f"{kind}_hit_rate"] = hits / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        return stats
+
+    def export_stats(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.stats(), f, indent=2)
+
+
+class ReplayMissError(LookupError):
+    """A replay-only ResponseCache was asked for a response it has not recorded."""
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of LLM completions.
+
+    mode is "read-write" (serve hits, record misses) or "replay" (serve hits,
+    raise ReplayMissError on a miss, never write).
+    """
+    MODES = ("read-write", "replay")
+
+    def __init__(self, path: str = LLM_CACHE_FILE, mode: str = "read-write",
+                 max_bytes: int = 512 * 2**20):
+        if mode not in self.MODES:
+            raise ValueError(f"LLM cache mode must be one of: {', '.join(self.MODES)}")
+        self.mode = mode
+        self.disk = DiskCache(path, max_entries=None, max_bytes=max_bytes, read_only=self.replay)
+        self.counters = collections.Counter()
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def key(provider: str, model: str, prompt: str, params: dict) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        material = json.dumps([provider, model, prompt_hash, params], sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, provider: str, model: str, prompt: str, params: dict):
+        """The recorded response, or None (ReplayMissError in replay mode)."""
+        raw = self.disk.get(self.key(provider, model, prompt, params))
+        if raw is not None:
+            self.counters["hits"] += 1
+            return raw.decode("utf-8")
+
+        self.counters["misses"] += 1
+        if self.replay:
+            raise ReplayMissError(f"No recorded {provider}/{model} response for prompt: {prompt[:80]!r}...")
+        return None
+
+    def put(self, provider: str, model: str, prompt: str, params: dict, response: str):
+        self.disk.put(self.key(provider, model, prompt, params), response.encode("utf-8"))
+
+    def stats(self) -> dict:
+        return dict(self.counters, bytes=self.disk.size())
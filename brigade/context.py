@@ -0,0 +1,137 @@
+"""
+RAG context assembly for the recipe prompt.
+
+Retrieval fetches more candidates than the prompt needs; ``select_context``
+then turns them into the context actually sent to the model:
+
+1. Near-duplicates are dropped: a candidate whose stored embedding has a
+   cosine similarity of ``DUPLICATE_SIMILARITY`` or more with a better
+   ranked candidate (or the same text) adds nothing. formido/recipes has
+   many such near-identical recipes.
+2. The rest are ranked by maximal marginal relevance (MMR): each pick
+   maximizes ``lambda * relevance - (1 - lambda) * similarity to the
+   candidates already picked``, so the context covers different takes on the
+   dish instead of the same recipe k times. Relevance is the retrieval score
+   rescaled to [0, 1] among the query's candidates (min-max), since BM25,
+   cosine and fused scores have different ranges and the trade-off with the
+   cosine similarity would otherwise depend on the retrieval mode.
+3. Candidates are added in MMR order, up to k, as long as they fit the token
+   budget; one that doesn't fit is skipped in favour of shorter ones. If not
+   even the first fits, it is cut to the budget.
+
+Tokens are counted with the target model's tokenizer where one is available
+locally (tiktoken for OpenAI models, if installed), and estimated otherwise.
+"""
+import numpy as np
+
+DUPLICATE_SIMILARITY = 0.95
+MMR_LAMBDA = 0.5
+CONTEXT_TOKENS = 1500
+# Candidates fetched per document that ends up in the context
+CANDIDATES_PER_DOC = 4
+
+
+def approximate_tokens(text: str) -> int:
+    """About 4 characters per token, as for the request scheduler's estimates."""
+    return -(-len(text) // 4)
+
+
+def token_counter(provider: str, model: str):
+    """A function counting the tokens of a text for model."""
+    if provider == "mock":
+        # The mock provider counts words
+        return lambda text: len(text.split())
+    if provider == "openai":
+        try:
+            import tiktoken
+        except ImportError:
+            return approximate_tokens
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    # No local tokenizer for watsonx models
+    return approximate_tokens
+
+
+def truncate(text: str, max_tokens: int, count) -> str:
+    """text cut down until it has at most max_tokens tokens."""
+    while text and count(text) > max_tokens:
+        text = text[:int(len(text) * max_tokens / count(text) * 0.95)]
+    return text
+
+
+def min_max(scores) -> np.ndarray:
+    """scores rescaled to [0, 1], the best being 1; all 1 if they are equal."""
+    scores = np.asarray(scores, dtype=np.float64)
+    spread = scores.max() - scores.min() if len(scores) else 0.0
+    if spread == 0:
+        return np.ones(len(scores))
+    return (scores - scores.min()) / spread
+
+
+def mmr_order(scores, similarities, lambda_: float = MMR_LAMBDA) -> list[int]:
+    """Indices of the candidates in maximal marginal relevance order, for retrieval scores of any range."""
+    scores = min_max(scores)
+    remaining = list(range(len(scores)))
+    order = []
+    redundancy = np.full(len(scores), -np.inf)
+    while remaining:
+        values = [lambda_ * scores[i] - (1 - lambda_) * (redundancy[i] if order else 0.0) for i in remaining]
+        best = remaining.pop(int(np.argmax(values)))
+        order.append(best)
+        redundancy = np.maximum(redundancy, similarities[best])
+    return order
+
+
+def select_context(hits, vectors=None, k: int = 5, max_tokens: int = None, count=approximate_tokens,
+                   lambda_: float = MMR_LAMBDA, duplicate_similarity: float = DUPLICATE_SIMILARITY):
+    """
+    The context for hits ([(text, score), ...], best first) with their stored
+    embeddings vectors (one row per hit, or None to only drop identical
+    texts and keep the ranking). Returns (selected [(text, score), ...],
+    stats).
+    """
+    stats = {"candidates": len(hits), "duplicates": 0, "selected": 0, "tokens": 0, "truncated": False}
+    if not hits:
+        return [], stats
+
+    if vectors is not None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        similarities = vectors @ vectors.T
+    else:
+        similarities = np.zeros((len(hits), len(hits)), dtype=np.float32)
+
+    kept = []
+    texts = set()
+    for (n, (text, _)) in enumerate(hits):
+        if text in texts or any(similarities[n, m] >= duplicate_similarity for m in kept):
+            stats["duplicates"] += 1
+            continue
+        texts.add(text)
+        kept.append(n)
+
+    scores = np.array([hits[n][1] for n in kept])
+    order = [kept[i] for i in mmr_order(scores, similarities[np.ix_(kept, kept)], lambda_)] if vectors is not None else kept
+
+    selected = []
+    for n in order:
+        if len(selected) == k:
+            break
+        (text, score) = hits[n]
+        tokens = count(text)
+        if max_tokens is not None and stats["tokens"] + tokens > max_tokens:
+            continue
+        selected.append((text, score))
+        stats["tokens"] += tokens
+
+    if not selected and max_tokens is not None:
+        (text, score) = hits[order[0]]
+        text = truncate(text, max_tokens, count)
+        selected.append((text, score))
+        stats["tokens"] = count(text)
+        stats["truncated"] = True
+
+    stats["selected"] = len(selected)
+    return selected, stats
@@ -0,0 +1,319 @@
+"""
+Corpus snapshot: the recipe texts behind the FAISS index, stored on disk.
+
+The snapshot is a single memory-mapped file laid out as
+
+    header   magic, format version, document count, index digest, capacity
+    offsets  (capacity + 1) little-endian uint64 byte offsets into the blob,
+             of which the first (count + 1) are in use
+    blob     the UTF-8 encoded documents, back to back
+
+so a lookup only touches the offsets it needs and the bytes of the documents
+it returns. The header records the SHA-256 digest of the index file the texts
+belong to, which lets startup detect a stale snapshot and rebuild it.
+
+Hashing a large index file at every startup would cost as much as reading
+it, so the digest is recorded when the index is written, in a sidecar
+(``faiss.index.sha256``) along with the file's size and modification time.
+``recorded_digest`` trusts the sidecar while those still match, and hashes
+the file again (and records it) only when they don't.
+
+The spare offsets let brigade.ingest append documents in place:
+``append_snapshot`` writes their bytes after the blob and their offsets into
+the spare slots, and ``commit_snapshot`` makes them visible by updating the
+count in the header. Readers that opened the file before never look past
+their own count. Version 1 snapshots, which have no spare offsets, are still
+read; appending to one rewrites it.
+"""
+import array
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+
+DATASET_NAME = "formido/recipes"
+DATASET_SPLIT = "train[:1000]"
+
+MAGIC = b"KBCORPUS"
+VERSION = 2
+HEADER = struct.Struct("<8sIQ32sQ")
+HEADER_V1 = struct.Struct("<8sIQ32s")
+OFFSET = struct.Struct("<Q")
+# Spare offsets reserved when a snapshot is written: an eighth of its documents, and at least this many
+MIN_SPARE = 1024
+
+
+def file_digest(path: str) -> bytes:
+    """SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def digest_path(index_path: str) -> str:
+    """The sidecar recording the digest of the index file at index_path."""
+    return f"{index_path}.sha256"
+
+
+def record_digest(index_path: str, path: str = None) -> bytes:
+    """
+    Hash the index file at index_path and record the digest, size and
+    modification time in the sidecar at path (digest_path(index_path) by
+    default). Returns the digest.
+    """
+    path = path or digest_path(index_path)
+    digest = file_digest(index_path)
+    stat = os.stat(index_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"sha256": digest.hex(), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}, f)
+    os.replace(tmp_path, path)
+    return digest
+
+
+def recorded_digest(index_path: str) -> bytes:
+    """The digest of the index file at index_path, from its sidecar if the file hasn't changed since it was recorded."""
+    try:
+        with open(digest_path(index_path), "r") as f:
+            recorded = json.load(f)
+        stat = os.stat(index_path)
+        if (recorded["size"], recorded["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            return bytes.fromhex(recorded["sha256"])
+    except (OSError, ValueError, KeyError):
+        pass
+    return record_digest(index_path)
+
+
+def recipe_text(example: dict):
+    """The text indexed for one dataset row, or None if the row is incomplete."""
+    (instruction, output) = (example.get('instruction'), example.get('output'))
+    if instruction is None or output is None:
+        return None
+    return f"{instruction} {output}"
+
+
+def load_recipe_dataset(split: str = DATASET_SPLIT):
+    """
+    Download (or open from the HF cache) the memory-mapped recipe dataset,
+    without its incomplete rows, so every row has a text and row numbers are
+    the same in the embeddings, the index and the corpus snapshot.
+    """
+    from datasets import load_dataset
+
+    dataset = load_dataset(DATASET_NAME, split=split)
+    return dataset.filter(lambda example: recipe_text(example) is not None)
+
+
+def load_recipe_texts(split: str = DATASET_SPLIT) -> list[str]:
+    """The recipe dataset as a list of texts."""
+    return [text for (_, chunk) in iter_recipe_texts(load_recipe_dataset(split)) for text in chunk]
+
+
+def iter_recipe_texts(dataset, chunk_size: int = 4096, start: int = 0, stop: int = None):
+    """
+    Stream the texts of rows [start, stop) of a dataset from
+    load_recipe_dataset() in chunks of chunk_size rows, yielding (first row,
+    texts). Every row yields a text, so positions line up with the dataset
+    rows and the embedding matrix built from them.
+    """
+    stop = len(dataset) if stop is None else stop
+    for first in range(start, stop, chunk_size):
+        batch = dataset[first:min(first + chunk_size, stop)]
+        texts = [recipe_text({"instruction": i, "output": o}) for (i, o) in zip(batch["instruction"], batch["output"])]
+        if None in texts:
+            raise ValueError(f"Recipe dataset rows {first}-{first + len(texts) - 1} include incomplete rows; "
+                             "load the dataset with load_recipe_dataset()")
+        yield first, texts
+
+
+def write_snapshot(path: str, texts, index_digest: bytes) -> "CorpusSnapshot":
+    """
+    Write texts to a snapshot file bound to index_digest and return it opened.
+    texts may be any iterable, so large corpora can be streamed: the blob is
+    spooled to a side file while the offsets are collected, then both are
+    assembled next to the final location and moved into place, so readers
+    never see a partial snapshot. Spare offsets are reserved for appending.
+    """
+    tmp_path = f"{path}.tmp"
+    blob_path = f"{path}.blob"
+    offsets = array.array("Q", [0])
+
+    with open(blob_path, "wb") as blob:
+        for text in texts:
+            offsets.append(offsets[-1] + blob.write(text.encode("utf-8")))
+
+    count = len(offsets) - 1
+    capacity = count + max(MIN_SPARE, count // 8)
+    offsets.extend([offsets[-1]] * (capacity - count))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, count, index_digest, capacity))
+        offsets.tofile(f)
+        with open(blob_path, "rb") as blob:
+            shutil.copyfileobj(blob, f, 1 << 20)
+
+    os.remove(blob_path)
+    os.replace(tmp_path, path)
+    return CorpusSnapshot(path)
+
+
+def _read_header(f, path: str):
+    """(version, count, index digest, capacity) of an open snapshot file."""
+    head = f.read(HEADER.size)
+    if len(head) < HEADER_V1.size or head[:8] != MAGIC:
+        raise ValueError(f"{path} is not a corpus snapshot")
+    (_, version) = struct.unpack_from("<8sI", head)
+    if version == 1:
+        (_, _, count, index_digest) = HEADER_V1.unpack_from(head)
+        return (version, count, index_digest, count)
+    if version != VERSION or len(head) < HEADER.size:
+        raise ValueError(f"{path} has unsupported snapshot version {version}")
+    (_, _, count, index_digest, capacity) = HEADER.unpack(head)
+    return (version, count, index_digest, capacity)
+
+
+def _write_header(f, version: int, count: int, index_digest: bytes, capacity: int):
+    f.seek(0)
+    if version == 1:
+        f.write(HEADER_V1.pack(MAGIC, version, count, index_digest))
+    else:
+        f.write(HEADER.pack(MAGIC, version, count, index_digest, capacity))
+
+
+def rebind_snapshot(path: str, index_digest: bytes):
+    """
+    Bind an existing snapshot to a new index file whose documents are unchanged,
+    e.g. after rebuilding the index with a different backend.
+    """
+    with open(path, "r+b") as f:
+        (version, count, _, capacity) = _read_header(f, path)
+        _write_header(f, version, count, index_digest, capacity)
+
+
+def append_snapshot(path: str, texts: list[str]):
+    """
+    Write texts after the last document of the snapshot at path, without
+    changing its header: readers still see the old count until
+    commit_snapshot(). Returns the number of documents the snapshot will
+    have, or None if it has no room for their offsets and has to be rewritten.
+    """
+    with open(path, "r+b") as f:
+        (version, count, _, capacity) = _read_header(f, path)
+        if version != VERSION or count + len(texts) > capacity:
+            return None
+        offsets_start = HEADER.size + (count + 1) * OFFSET.size
+        blob_start = HEADER.size + (capacity + 1) * OFFSET.size
+        f.seek(offsets_start - OFFSET.size)
+        (end,) = OFFSET.unpack(f.read(OFFSET.size))
+
+        offsets = array.array("Q")
+        # Anything past the last document is left over from an interrupted ingest
+        f.truncate(blob_start + end)
+        f.seek(blob_start + end)
+        for text in texts:
+            end += f.write(text.encode("utf-8"))
+            offsets.append(end)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        f.seek(offsets_start)
+        offsets.tofile(f)
+    return count + len(texts)
+
+
+def commit_snapshot(path: str, count: int):
+    """Make the first count documents of the snapshot at path visible by updating its header's count."""
+    with open(path, "r+b") as f:
+        (version, _, index_digest, capacity) = _read_header(f, path)
+        f.flush()
+        os.fsync(f.fileno())
+        _write_header(f, version, count, index_digest, capacity)
+
+
+class CorpusSnapshot:
+    """
+    Read-only, memory-mapped view of a snapshot file. Behaves like a sequence
+    of strings, decoding a document only when it is indexed.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mm) < HEADER_V1.size or self._mm[:8] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a corpus snapshot")
+
+        (_, version) = struct.unpack_from("<8sI", self._mm, 0)
+        if version == 1:
+            (_, _, count, index_digest) = HEADER_V1.unpack_from(self._mm, 0)
+            (header_size, capacity) = (HEADER_V1.size, count)
+        elif version == VERSION and len(self._mm) >= HEADER.size:
+            (_, _, count, index_digest, capacity) = HEADER.unpack_from(self._mm, 0)
+            header_size = HEADER.size
+        else:
+            self.close()
+            raise ValueError(f"{path} has unsupported snapshot version {version}")
+
+        self.count = count
+        self.capacity = capacity
+        self.index_digest = index_digest
+        self._offsets_start = header_size
+        self._blob_start = header_size + (capacity + 1) * OFFSET.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(f"document {i} out of range")
+
+        start, end = struct.unpack_from("<QQ", self._mm, self._offsets_start + i * OFFSET.size)
+        return self._mm[self._blob_start + start:self._blob_start + end].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def close(self):
+        self._mm.close()
+
+
+def load_snapshot(path: str, index_path: str, load_texts=load_recipe_texts) -> CorpusSnapshot:
+    """
+    Open the snapshot at path if it was written for the index at index_path.
+    Otherwise rebuild it from load_texts() and bind it to the current index.
+    Without load_texts, e.g. when the snapshot holds recipes added by
+    brigade.ingest that no dataset has, a stale snapshot is an error.
+    """
+    index_digest = recorded_digest(index_path)
+
+    if os.path.exists(path):
+        try:
+            snapshot = CorpusSnapshot(path)
+        except ValueError as e:
+            print(f"[♻️] Ignoring unreadable corpus snapshot: {e}")
+        else:
+            if snapshot.index_digest == index_digest:
+                print(f"[💾] Loaded corpus snapshot of {len(snapshot)} recipes from {path}")
+                return snapshot
+            print(f"[♻️] Corpus snapshot {path} does not match {index_path}")
+            snapshot.close()
+
+    if load_texts is None:
+        raise ValueError(f"Corpus snapshot {path} does not match {index_path} and can't be rebuilt from the "
+                         "recipe dataset without losing recipes added by brigade.ingest; restore the files "
+                         "that belong together, or rebuild the index and ingest the recipes again")
+
+    print("[📚] Rebuilding corpus snapshot from recipe dataset...")
+    snapshot = write_snapshot(path, load_texts(), index_digest)
+    print(f"[💾] Saved corpus snapshot of {len(snapshot)} recipes to {path}")
+    return snapshot
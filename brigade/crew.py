@@ -0,0 +1,112 @@
+"""
+Crew registry.
+
+A crew file maps each role to [number of members, description], optionally
+followed by the list of other roles whose tasks members of the role are
+qualified to take over, e.g.
+
+    "Tournant": [1, "Tournant (Swing Cook): ...", ["Saucier", "Grillardin", "Entremetier"]]
+
+``Crew``
+keeps only that: team member IDs ('Sous Chef 2') are derived from the role
+and a number, interned when first produced, and never stored as a full
+list. Membership tests, role lookups and alias resolution are O(1) in the
+size of the crew. As a mapping from team member to agent, a crew creates each
+member's agent on first access, i.e. when the member is first assigned a
+task, so a banquet-size crew costs nothing for the members who never work.
+"""
+import collections
+import sys
+from collections.abc import Mapping
+
+
+class Crew(Mapping):
+    """
+    Team members of roles ({role: [count, description], ...}) mapped to the
+    agents make_agent(member) creates for them on first access.
+    """
+    def __init__(self, roles: dict, make_agent=None):
+        self.roles = {sys.intern(role): count for (role, (count, *_)) in roles.items()}
+        self.descriptions = {role: description for (role, (_, description, *_)) in roles.items()}
+        # Covered role -> the other roles qualified to do its tasks
+        self.stand_ins = collections.defaultdict(list)
+        for (role, (_, _, *qualified)) in roles.items():
+            for covered in (qualified[0] if qualified else ()):
+                self.stand_ins[covered].append(role)
+        self.make_agent = make_agent
+        self._agents = {}
+        self._size = sum(self.roles.values())
+
+    # ------------------------------------------------
+    # Members
+    # ------------------------------------------------
+    @staticmethod
+    def split(member: str):
+        """(role, number) of a 'Role <n>' member ID, or (member, None) if it has no number."""
+        (role, _, number) = member.rpartition(" ")
+        if role and number.isdigit():
+            return (role, int(number))
+        return (member, None)
+
+    def __contains__(self, member) -> bool:
+        if not isinstance(member, str):
+            return False
+        (role, number) = self.split(member)
+        return number is not None and 1 <= number <= self.roles.get(role, 0) and member == f"{role} {number}"
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self):
+        for role in self.roles:
+            yield from self.members_of(role)
+
+    def members_of(self, role: str):
+        """The team members of role, in number order."""
+        return (sys.intern(f"{role} {n}") for n in range(1, self.roles.get(role, 0) + 1))
+
+    def role_of(self, member: str):
+        """The role of member, or None if it is not in the crew."""
+        return self.split(member)[0] if member in self else None
+
+    def qualified_members(self, role: str):
+        """Members qualified to do role's tasks: its own members, then those of roles covering it."""
+        for qualified in [role] + self.stand_ins.get(role, []):
+            yield from self.members_of(qualified)
+
+    def resolve(self, name: str):
+        """
+        The member ID name refers to, or None: a member ID itself, or a bare
+        role name for a role with a single member ('Saucier' for 'Saucier 1').
+        """
+        if name in self:
+            return sys.intern(name)
+        if self.roles.get(name) == 1:
+            return sys.intern(f"{name} 1")
+        return None
+
+    # ------------------------------------------------
+    # Agents
+    # ------------------------------------------------
+    def __getitem__(self, member: str):
+        agent = self._agents.get(member)
+        if agent is None:
+            if member not in self:
+                raise KeyError(member)
+            agent = self._agents[sys.intern(member)] = self.make_agent(member)
+        return agent
+
+    @property
+    def agents_created(self) -> int:
+        return len(self._agents)
+
+    # ------------------------------------------------
+    # Descriptions for prompts and logs
+    # ------------------------------------------------
+    def describe(self) -> str:
+        """One 'Role [count]' line per role, as the planner prompt lists the team."""
+        return "\n".join(f"{role} [{count}]" for (role, count) in self.roles.items())
+
+    def roster(self) -> list[str]:
+        """One line per role naming its members compactly: 'Sous Chef 1-34', 'Saucier 1'."""
+        return [f"{role} 1-{count}" if count > 1 else f"{role} 1" for (role, count) in self.roles.items() if count]
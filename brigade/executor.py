@@ -0,0 +1,88 @@
+"""
+Step-wise parallel execution of a routed plan.
+
+The plan's T<n> steps run in order with a barrier between them; the tasks of
+one step run concurrently on a bounded thread pool. A team member with
+several tasks in the same step works through them one after another, as a
+cook would. Agents are any callables taking a task string and returning
+{"result": str}, so stub, LLM-backed or tool-backed agents plug in without
+changes here; an agent may also be a coroutine function.
+
+With resources (brigade.resources.ResourceLocks), a task first waits for
+the ingredients and utensils it uses, so tasks that compete for them are
+serialized while the rest of the step keeps running in parallel.
+"""
+import asyncio
+import collections
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _run_member(agent, tasks: list[str], resources=None):
+    """Run one member's tasks of a step in order; returns [(result, seconds, seconds waited), ...]."""
+    outcomes = []
+    for task in tasks:
+        waited = resources.acquire(task) if resources is not None else 0.0
+        try:
+            started = time.perf_counter()
+            res_dict = agent(task)
+            if inspect.isawaitable(res_dict):
+                res_dict = asyncio.run(res_dict)
+        finally:
+            if resources is not None:
+                resources.release(task)
+        outcomes.append((res_dict["result"], time.perf_counter() - started, waited))
+    return outcomes
+
+
+def run_schedule(schedule, staff, max_workers: int = 8, resources=None):
+    """
+    Execute schedule ([(step, [(team member, task), ...]), ...]) with the
+    agents in staff, holding each task's resources while it runs if given.
+    Returns (results, timings): results maps each team member to their joined
+    results in step order; timings records the wall time (and time spent
+    waiting for resources) of every task and, per step, the wall time and the
+    critical path (the busiest member's total time, waits included).
+    """
+    results = collections.defaultdict(list)
+    timings = {"tasks": [], "steps": []}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for (step, tasks) in schedule:
+            by_member = collections.defaultdict(list)
+            for (team_member, task) in tasks:
+                by_member[team_member].append(task)
+
+            started = time.perf_counter()
+            futures = {
+                team_member: pool.submit(_run_member, staff[team_member], member_tasks, resources)
+                for (team_member, member_tasks) in by_member.items()
+            }
+
+            # Barrier: the next step starts only when every task of this one is done
+            critical_path = 0.0
+            waited = 0.0
+            for (team_member, future) in futures.items():
+                outcomes = future.result()
+                for (task, (result, seconds, wait)) in zip(by_member[team_member], outcomes):
+                    results[team_member].append(result)
+                    timings["tasks"].append({"step": step, "member": team_member, "task": task, "seconds": seconds,
+                                             "resource_wait_seconds": wait})
+                critical_path = max(critical_path, sum(seconds + wait for (_, seconds, wait) in outcomes))
+                waited += sum(wait for (_, _, wait) in outcomes)
+
+            wall = time.perf_counter() - started
+            timings["steps"].append({
+                "step": step,
+                "tasks": len(tasks),
+                "members": len(by_member),
+                "wall_seconds": wall,
+                "critical_path_seconds": critical_path,
+                "resource_wait_seconds": waited,
+            })
+            print(f"  [⚙️] T{step}: {len(tasks)} tasks across {len(by_member)} members in {wall:.2f}s "
+                  f"(critical path {critical_path:.2f}s"
+                  + (f", {waited:.2f}s waiting for resources)" if waited >= 0.005 else ")"))
+
+    return {team_member: "\n".join(member_results) for (team_member, member_results) in results.items()}, timings
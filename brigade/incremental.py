@@ -0,0 +1,157 @@
+"""
+Incremental re-planning: reuse what the last run in an output directory
+already produced.
+
+Every run saves its inputs and results to ``run-state.json`` in the output
+directory: dish, provider and model, crew, ingredients, retrieved documents
+and the context options they were selected with (--context-docs,
+--context-tokens, --mmr-lambda), recipe and the executed plan. With
+``--incremental`` the next run diffs its inputs against that state:
+
+- Same dish, provider and model: the retrieved documents are reused if the
+  context options are the same too, and the recipe if the documents are the
+  same, so neither the embedder nor the recipe generation runs.
+- Same recipe: the previous plan is kept, except for the steps the change
+  affects. Those are steps with a task assigned to a team member who is no
+  longer in the crew, and steps with a task using an ingredient or utensil
+  that was added, removed or changed in count (brigade/resources.py). Only
+  those steps are sent back to the planner, together with the rest of the
+  plan for context; if no step is affected the planner is not called at all.
+- Anything else, e.g. a new recipe: the whole pipeline runs as usual.
+
+Adding members or roles affects no step: the previous plan is still valid,
+and the optimizer can move work onto the new members.
+"""
+import json
+import os
+
+from brigade.crew import Crew
+from brigade.plan import Plan, Step, Task, Unparsed, link_steps
+
+
+def plan_to_json(plan: Plan) -> list:
+    return [
+        {"step": step.number, "title": step.title, "after": list(step.depends_on),
+         "tasks": [{"member": task.member, "task": task.text, "line": task.line} for task in step.tasks]}
+        for step in plan.steps
+    ]
+
+
+def plan_from_json(steps: list) -> Plan:
+    plan = Plan([
+        Step(step["step"], step["title"],
+             [Task(step["step"], task["member"], task["task"], task["line"]) for task in step["tasks"]])
+        for step in steps
+    ])
+    link_steps(plan.steps, {step["step"]: tuple(step.get("after", ())) for step in steps})
+    return plan
+
+
+def save_state(path: str, args, kitchen_roles: dict, final_state: dict, ingredients: str = None):
+    state = {
+        "dish": args.dish,
+        "provider": args.provider,
+        "model": args.model,
+        "crew": kitchen_roles,
+        "ingredients": ingredients,
+        "docs": final_state.get("docs"),
+        "context": context_options(args),
+        "recipe": final_state.get("recipe"),
+        "plan": plan_to_json(final_state["parsed_plan"]) if "parsed_plan" in final_state else None,
+    }
+    with open(path, "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def load_state(path: str, args):
+    """The state of the previous run, or None if there is none or it was for another dish or model."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        state = json.load(f)
+    if (state["dish"], state["provider"], state["model"]) != (args.dish, args.provider, args.model):
+        return None
+    return state
+
+
+def context_options(args) -> dict:
+    """The options that decide which retrieved documents make up the context."""
+    return {"context_docs": args.context_docs, "context_tokens": args.context_tokens, "mmr_lambda": args.mmr_lambda}
+
+
+def reusable_docs(state, args):
+    """The documents the previous run retrieved, or None if there are none or the context options changed since."""
+    if state is None or state["docs"] is None or state.get("context") != context_options(args):
+        return None
+    return state["docs"]
+
+
+def crew_changes(previous: Crew, crew: Crew) -> list[str]:
+    """Descriptions of the roles whose counts changed."""
+    changes = []
+    for role in dict.fromkeys([*previous.roles, *crew.roles]):
+        (before, after) = (previous.roles.get(role, 0), crew.roles.get(role, 0))
+        if before != after:
+            changes.append(f"{role} {before} → {after}")
+    return changes
+
+
+def inventory_changes(previous, inventory) -> set:
+    """Keys of the resources added, removed or changed in count between two inventories."""
+    keys = set(previous.capacity) | set(inventory.capacity)
+    return {key for key in keys if previous.capacity.get(key, 0) != inventory.capacity.get(key, 0)}
+
+
+def affected_steps(plan: Plan, crew: Crew, previous_inventory=None, inventory=None) -> dict:
+    """{step number: [reason, ...]} for the steps of plan the new crew or inventory invalidates."""
+    changed = inventory_changes(previous_inventory, inventory) if inventory is not None else set()
+    affected = {}
+    for task in plan.tasks():
+        reasons = []
+        if task.member not in crew:
+            reasons.append(f"{task.member} is no longer in the team")
+        if changed:
+            used = set(previous_inventory.uses(task.text)) | set(inventory.uses(task.text))
+            reasons.extend(f"the available {key} changed" for key in sorted(used & changed))
+        if reasons:
+            affected.setdefault(task.step, []).extend(reasons)
+    return affected
+
+
+def replan_prompt(prompt: str, plan: Plan, affected: dict) -> str:
+    """The planner prompt, asking for replacements of the affected steps of plan only."""
+    reasons = "\n".join(f"T{step}: {'; '.join(dict.fromkeys(why))}" for (step, why) in sorted(affected.items()))
+    return (
+        f"{prompt}\n\n"
+        "A plan was already made for a previous version of the team and ingredients:\n\n"
+        f"{plan.render()}\n\n"
+        "These steps of it are no longer valid:\n"
+        f"{reasons}\n\n"
+        "Plan a time-step sequence of replacement tasks for only these steps, keeping their step numbers "
+        "and the 'Team member: Task' format. The other steps stay as they are, so don't repeat them."
+    )
+
+
+def splice(plan: Plan, replacement: Plan, affected, crew) -> Plan:
+    """
+    plan with its affected steps replaced by those of replacement. An affected
+    step the replacement leaves out is kept as it was, except for the tasks of
+    members no longer in crew, which are reported as unparsed.
+    """
+    replaced = {step.number: step for step in replacement.steps if step.number in affected}
+    unparsed = list(replacement.unparsed)
+    steps = []
+    for step in plan.steps:
+        if step.number in replaced:
+            steps.append(replaced[step.number])
+            continue
+        if step.number in affected:
+            print(f"  [⚠️] The planner left out T{step.number}; keeping the previous run's tasks of it")
+            unparsed.extend(
+                Unparsed(task.line, f"{task.member}: {task.text}", f"{task.member} is no longer in the team")
+                for task in step.tasks if task.member not in crew
+            )
+            step.tasks = [task for task in step.tasks if task.member in crew]
+        steps.append(step)
+    # Replacement steps keep the dependencies of the steps they replace
+    return Plan(link_steps(steps, {step.number: step.depends_on for step in plan.steps}), unparsed)
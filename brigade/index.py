@@ -0,0 +1,312 @@
+"""
+Index build: embed the recipe corpus and write embeddings.npy, faiss.index,
+the corpus snapshot and the lexical index.
+
+The dataset is read in chunks of rows and each chunk is encoded with large
+batches by a pool of worker processes. Workers write their vectors straight
+into a preallocated, memory-mapped ``.npy`` file, and every finished chunk is
+recorded in a progress file, so an interrupted build resumes from the last
+finished chunk instead of starting over.
+
+The index backend (flat, IVF-Flat, IVF-PQ or HNSW) comes from an index
+config, see brigade.backends; ``bench`` prints a recall-vs-latency report of
+the backends against exact search to help pick one.
+
+    python -m brigade.index build --split train --workers 8 --backend hnsw
+    python -m brigade.index bench --queries 1000 -k 10
+"""
+import argparse
+import json
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import faiss
+import numpy as np
+from tqdm.auto import tqdm
+
+from brigade.backends import (BACKENDS, DEFAULT_SWEEP, STORAGES, apply_search_params,
+                              build_backend_index, convert_embeddings, index_backend, index_storage,
+                              load_index_config, print_recall_report, recall_report, storage_of)
+from brigade.corpus import (DATASET_SPLIT, iter_recipe_texts, load_recipe_dataset, rebind_snapshot,
+                            record_digest, write_snapshot)
+from brigade.lexical import LEXICAL_FILE, build_lexical_index
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDINGS_FILE = "embeddings.npy"
+INDEX_FILE = "faiss.index"
+CORPUS_FILE = "corpus.bin"
+
+# ------------------------------------------------
+# Worker side: one embedder per process
+# ------------------------------------------------
+_worker_model = None
+_worker_batch_size = None
+
+
+def _init_worker(model_name: str, batch_size: int, threads: int):
+    global _worker_model, _worker_batch_size
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # Share the cores between workers instead of every worker claiming all of them
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+    _worker_batch_size = batch_size
+
+
+def _encode_chunk(embeddings_path: str, first: int, texts: list[str]) -> int:
+    vectors = _worker_model.encode(
+        texts,
+        batch_size=_worker_batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    out = np.load(embeddings_path, mmap_mode="r+")
+    out[first:first + len(texts)] = vectors
+    out.flush()
+    del out
+    return first
+
+
+# ------------------------------------------------
+# Build progress bookkeeping
+# ------------------------------------------------
+def _read_progress(path: str, params: dict) -> set:
+    """Rows of the chunks already finished by an earlier build with the same parameters."""
+    try:
+        with open(path, "r") as f:
+            progress = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return set()
+
+    if progress.get("params") != params:
+        return set()
+    return set(progress.get("done", []))
+
+
+def _write_progress(path: str, params: dict, done: set):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"params": params, "done": sorted(done)}, f)
+    os.replace(tmp_path, path)
+
+
+def embedding_dimension(model_name: str) -> int:
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name, device="cpu").get_sentence_embedding_dimension()
+
+
+def encode_corpus(dataset, embeddings_path: str, model_name: str = EMBEDDING_MODEL,
+                  chunk_size: int = 4096, batch_size: int = 256, workers: int = None):
+    """
+    Encode every row of dataset into the .npy file at embeddings_path,
+    resuming a previous run of the same parameters if one was interrupted.
+    Returns the embeddings, memory-mapped read-only.
+    """
+    workers = workers or os.cpu_count() or 1
+    rows = len(dataset)
+    partial_path = f"{embeddings_path}.partial.npy"
+    progress_path = f"{embeddings_path}.progress"
+
+    params = {
+        "model": model_name,
+        "rows": rows,
+        "chunk_size": chunk_size,
+        "fingerprint": getattr(dataset, "_fingerprint", None),
+    }
+    done = _read_progress(progress_path, params) if os.path.exists(partial_path) else set()
+
+    if done:
+        print(f"[♻️] Resuming embedding build: {len(done)} chunks already encoded")
+    else:
+        dim = embedding_dimension(model_name)
+        np.lib.format.open_memmap(partial_path, mode="w+", dtype=np.float32, shape=(rows, dim)).flush()
+        _write_progress(progress_path, params, done)
+
+    chunks = ((first, texts) for (first, texts) in iter_recipe_texts(dataset, chunk_size) if first not in done)
+    total = -(-rows // chunk_size)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    with tqdm(total=total, initial=len(done), desc="Embedding recipes", unit="chunk") as bar:
+        if workers == 1:
+            _init_worker(model_name, batch_size, threads)
+            for (first, texts) in chunks:
+                done.add(_encode_chunk(partial_path, first, texts))
+                _write_progress(progress_path, params, done)
+                bar.update()
+        else:
+            # spawn rather than fork: torch does not survive being forked after it has started threads
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(model_name, batch_size, threads)) as pool:
+                pending = set()
+                for (first, texts) in chunks:
+                    # Keep only a couple of chunks per worker in flight so the corpus is never fully in memory
+                    if len(pending) >= 2 * workers:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            done.add(future.result())
+                            bar.update()
+                        _write_progress(progress_path, params, done)
+                    pending.add(pool.submit(_encode_chunk, partial_path, first, texts))
+
+                for future in wait(pending).done:
+                    done.add(future.result())
+                    bar.update()
+                _write_progress(progress_path, params, done)
+
+    os.replace(partial_path, embeddings_path)
+    os.remove(progress_path)
+    return np.load(embeddings_path, mmap_mode="r")
+
+
+def build_index(index_path: str = INDEX_FILE, embeddings_path: str = EMBEDDINGS_FILE,
+                corpus_path: str = CORPUS_FILE, split: str = DATASET_SPLIT,
+                model_name: str = EMBEDDING_MODEL, chunk_size: int = 4096,
+                batch_size: int = 256, workers: int = None, config: dict = None,
+                lexical_path: str = LEXICAL_FILE):
+    """
+    Build embeddings, index, corpus snapshot and lexical index for the given
+    dataset split, using the index backend from config (flat by default).
+    Returns the index and the opened corpus snapshot.
+    """
+    config = config or load_index_config()
+    print(f"[📚] Loading recipe dataset split '{split}'...")
+    dataset = load_recipe_dataset(split)
+    print(f"[📚] Loaded {len(dataset)} recipes")
+
+    print("[⚙️] Encoding embeddings with progress:")
+    embeddings = encode_corpus(dataset, embeddings_path, model_name, chunk_size, batch_size, workers)
+    if config["storage"] not in (None, "float32"):
+        embeddings = convert_embeddings(embeddings_path, config["storage"])
+    print(f"[💾] Saved {storage_of(embeddings)} embeddings to {embeddings_path}")
+
+    index = build_backend_index(embeddings, config)
+    faiss.write_index(index, index_path)
+    print(f"[💾] Saved {index_backend(index)} FAISS index to {index_path}")
+
+    texts = (text for (_, chunk) in iter_recipe_texts(dataset, chunk_size) for text in chunk)
+    snapshot = write_snapshot(corpus_path, texts, record_digest(index_path))
+    print(f"[💾] Saved corpus snapshot to {corpus_path}")
+
+    lexical = build_lexical_index(lexical_path, snapshot, snapshot.index_digest)
+    print(f"[💾] Saved lexical index of {lexical.terms} terms to {lexical_path}")
+    lexical.close()
+    return index, snapshot
+
+
+def read_index(index_path: str = INDEX_FILE):
+    """Read the index at index_path with its vectors memory-mapped instead of copied into RAM, where faiss supports it."""
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    return faiss.read_index(index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY if mmap_flag else 0)
+
+
+def open_index(index_path: str = INDEX_FILE, embeddings_path: str = EMBEDDINGS_FILE,
+               corpus_path: str = CORPUS_FILE, config: dict = None):
+    """
+    Load the index at index_path. If config asks for a different storage than
+    the saved embeddings, they are converted first. If it asks for a different
+    backend or storage than the index on disk, the index is rebuilt from the
+    saved embeddings (no re-encoding) and the corpus snapshot is rebound to it.
+    """
+    config = config or load_index_config()
+    storage = config["storage"]
+    if storage is not None and storage_of(np.load(embeddings_path, mmap_mode="r")) != storage:
+        print(f"[♻️] Converting {embeddings_path} to {storage}")
+        convert_embeddings(embeddings_path, storage)
+    index = read_index(index_path)
+
+    backend = config["backend"] or index_backend(index)
+    stale_storage = storage is not None and index_storage(index) not in (None, storage)
+    if index_backend(index) != backend or stale_storage:
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        rebuild = dict(config, backend=backend, storage=storage or storage_of(embeddings))
+        print(f"[♻️] Rebuilding {index_backend(index)} index as {backend} with {rebuild['storage']} vectors")
+        index = build_backend_index(embeddings, rebuild)
+        faiss.write_index(index, index_path)
+        index_digest = record_digest(index_path)
+        if os.path.exists(corpus_path):
+            rebind_snapshot(corpus_path, index_digest)
+        print(f"[💾] Saved {backend} FAISS index to {index_path}")
+        index = read_index(index_path)
+
+    return apply_search_params(index, config)
+
+
+# ------------------------------------------------
+# Command line
+# ------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser("brigade.index")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Embed the recipe corpus and write the index files.")
+    build.add_argument("--split", "-s",
+                       default=DATASET_SPLIT,
+                       help=f"Dataset split to index. Default: {DATASET_SPLIT}")
+    build.add_argument("--model", "-m",
+                       default=EMBEDDING_MODEL,
+                       help=f"Sentence embedding model. Default: {EMBEDDING_MODEL}")
+    build.add_argument("--chunk-size",
+                       type=int,
+                       default=4096,
+                       help="Rows per work unit and per resume checkpoint. Default: 4096")
+    build.add_argument("--batch-size",
+                       type=int,
+                       default=256,
+                       help="Encoder batch size inside each worker. Default: 256")
+    build.add_argument("--workers", "-w",
+                       type=int,
+                       default=None,
+                       help="Number of encoder processes. Default: one per CPU core")
+    build.add_argument("--backend", "-b",
+                       choices=BACKENDS,
+                       default=None,
+                       help="Index backend; overrides the config file. Default: flat")
+    build.add_argument("--storage",
+                       choices=STORAGES,
+                       default=None,
+                       help="Storage of the embeddings and indexed vectors; overrides the config file. Default: float32")
+    build.add_argument("--index-config",
+                       default=None,
+                       help="JSON file with the index backend and its parameters.")
+    build.add_argument("--embeddings", default=EMBEDDINGS_FILE, help=f"Default: {EMBEDDINGS_FILE}")
+    build.add_argument("--index", default=INDEX_FILE, help=f"Default: {INDEX_FILE}")
+    build.add_argument("--corpus", default=CORPUS_FILE, help=f"Default: {CORPUS_FILE}")
+    build.add_argument("--lexical", default=LEXICAL_FILE, help=f"Default: {LEXICAL_FILE}")
+
+    bench = commands.add_parser("bench", help="Report recall and latency of each backend against flat search.")
+    bench.add_argument("--sweep",
+                       default=None,
+                       help="JSON file with a list of index configs; list values are swept. "
+                            "Default: a sweep over every backend")
+    bench.add_argument("--queries", "-q",
+                       type=int,
+                       default=1000,
+                       help="Number of queries to time. Default: 1000")
+    bench.add_argument("-k",
+                       type=int,
+                       default=10,
+                       help="Neighbours per query used for recall@k. Default: 10")
+    bench.add_argument("--embeddings", default=EMBEDDINGS_FILE, help=f"Default: {EMBEDDINGS_FILE}")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        config = load_index_config(args.index_config, backend=args.backend, storage=args.storage)
+        build_index(args.index, args.embeddings, args.corpus, args.split, args.model,
+                    args.chunk_size, args.batch_size, args.workers, config, args.lexical)
+
+    elif args.command == "bench":
+        sweep = DEFAULT_SWEEP
+        if args.sweep:
+            with open(args.sweep, "r") as f:
+                sweep = json.load(f)
+        embeddings = np.load(args.embeddings, mmap_mode="r")
+        print_recall_report(recall_report(embeddings, sweep, args.queries, args.k), args.k)
+
+
+if __name__ == "__main__":
+    main()
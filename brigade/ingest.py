@@ -0,0 +1,508 @@
+"""
+Incremental ingest: add, update and delete recipes without re-embedding the
+corpus.
+
+    python -m brigade.ingest add house-recipes/
+    python -m brigade.ingest compact
+
+``add`` takes the current set of house recipes, either a directory of text
+files (one recipe per file, known by its path) or a JSON Lines file of
+``{"id": ..., "text": ...}`` (or ``"instruction"`` and ``"output"``)
+objects. A manifest (``ingest.json``) records the corpus row and content
+digest of every recipe ingested so far, so only new and changed recipes are
+embedded, and nothing already on disk is rewritten:
+
+- their vectors are appended to ``embeddings.npy`` and their texts to the
+  corpus snapshot, in place;
+- their vectors are added, under their row ids, to a small exact index,
+  ``faiss.index.delta``, that retrieval searches along with ``faiss.index``;
+- the recipes the main lexical index doesn't cover get a lexical index of
+  their own, ``lexical.bin.delta``, searched along with ``lexical.bin``.
+
+The main index and lexical index files, and the index digest the snapshot
+records, stay as they are, so an ingest costs time in proportion to the
+recipes it adds (plus the delta lexical index), not to the corpus.
+
+The row of a changed recipe, or of one that is no longer in the source
+(unless ``--keep-missing``), is tombstoned: listed in the manifest, and
+filtered out of search results by ``Retriever.retrieve()``. Once tombstones,
+or the rows in the delta segments, make up more than ``--compact-ratio`` of
+the corpus, ``add`` starts ``compact`` in the background. It rewrites the
+embeddings, index, snapshot and lexical index without the tombstoned rows and
+with the delta segments folded in, from the stored vectors, so nothing is
+re-embedded either.
+
+The existing index stays readable throughout. New files are written next to
+the old ones, or appended after the rows readers know of, and moved into
+place or committed at the end, in one short step under an exclusive lock on
+``faiss.index.lock``. The scripts take a shared lock on the same file while
+they load the index, so a run never sees an index from one generation and a
+snapshot from another. Processes that already loaded the old files keep
+reading them, and the rows they knew of. Writers (``add`` and ``compact``) hold
+``ingest.json.lock`` for their whole run, so they run one at a time.
+
+The swap is journaled: ``faiss.index.swap`` lists the files to move and to
+remove, the snapshot and embeddings row counts to commit and the new
+manifest before anything is moved. The new rows of the snapshot and then of
+``embeddings.npy`` become visible last, when their headers are updated, and
+the journal is removed once the manifest is saved. If a swap is interrupted,
+the next writer or script to load the index finishes it from the journal, so
+the files never stay a mix of two generations.
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+INGEST_FILE = "ingest.json"
+COMPACT_RATIO = 0.1
+
+
+@contextlib.contextmanager
+def file_lock(path: str, shared: bool = False):
+    """Hold a shared or exclusive advisory lock on path (via path.lock); a no-op where fcntl is unavailable."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(f"{path}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# ------------------------------------------------
+# Manifest
+# ------------------------------------------------
+def load_manifest(path: str = INGEST_FILE) -> dict:
+    """{"rows": corpus rows, "documents": {id: {"row", "digest"}}, "tombstones": [row, ...]}"""
+    if not os.path.exists(path):
+        return {"rows": None, "documents": {}, "tombstones": []}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_tombstones(path: str, rows: int) -> frozenset:
+    """
+    Tombstoned rows of a corpus of rows documents. A manifest written for a
+    corpus of another size (e.g. rebuilt from the dataset since) doesn't apply.
+    """
+    manifest = load_manifest(path)
+    if manifest["rows"] != rows:
+        return frozenset()
+    return frozenset(manifest["tombstones"])
+
+
+def read_source(path: str) -> dict:
+    """{id: text} of the recipes in a directory of text files or a JSON Lines file."""
+    from brigade.corpus import recipe_text
+
+    documents = {}
+    if os.path.isdir(path):
+        for (directory, _, files) in os.walk(path):
+            for name in sorted(files):
+                full = os.path.join(directory, name)
+                with open(full, "r", encoding="utf-8") as f:
+                    documents[os.path.relpath(full, path)] = f.read().strip()
+        return documents
+
+    with open(path, "r", encoding="utf-8") as f:
+        for (number, line) in enumerate(f, 1):
+            if not line.strip():
+                continue
+            example = json.loads(line)
+            text = example.get("text") or recipe_text(example)
+            if "id" not in example or not text:
+                raise ValueError(f"{path}:{number}: a recipe needs an 'id' and a 'text' (or 'instruction' and 'output')")
+            documents[str(example["id"])] = text
+    return documents
+
+
+def digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ------------------------------------------------
+# Appending to embeddings.npy
+# ------------------------------------------------
+def _npy_header(path: str):
+    """(format version, header length, shape, dtype) of a .npy file."""
+    with open(path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            (shape, _, dtype) = np.lib.format.read_array_header_1_0(f)
+        else:
+            (shape, _, dtype) = np.lib.format.read_array_header_2_0(f)
+        return version, f.tell(), shape, dtype
+
+
+def _header_bytes(version, shape, dtype) -> bytes:
+    header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": shape}
+    buffer = io.BytesIO()
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(buffer, header)
+    else:
+        np.lib.format.write_array_header_2_0(buffer, header)
+    return buffer.getvalue()
+
+
+def append_rows(path: str, rows) -> int:
+    """
+    Write rows after the last row of the .npy file at path, without changing
+    its header: readers still see the old shape until commit_rows(). Returns
+    the number of rows the file will have.
+    """
+    (_, header_length, shape, dtype) = _npy_header(path)
+    end = header_length + int(np.prod(shape)) * dtype.itemsize
+    with open(path, "r+b") as f:
+        # Anything past the last row is left over from an interrupted ingest
+        f.truncate(end)
+        f.seek(end)
+        f.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+    return shape[0] + len(rows)
+
+
+def commit_rows(path: str, count: int):
+    """Make the first count rows of the .npy file at path visible by updating its header's shape."""
+    (version, header_length, shape, dtype) = _npy_header(path)
+    header = _header_bytes(version, (count,) + shape[1:], dtype)
+    if len(header) == header_length:
+        with open(path, "r+b") as f:
+            f.write(header)
+        return
+    # The header has no room for the new shape: rewrite the file next to it
+    data = np.memmap(path, dtype=dtype, mode="r", offset=header_length, shape=(count,) + shape[1:])
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, data)
+    del data
+    os.replace(tmp_path, path)
+
+
+# ------------------------------------------------
+# Ingest and compaction
+# ------------------------------------------------
+def _next(path: str) -> str:
+    """Where the next generation of a file is written before it is moved into place."""
+    return f"{path}.next"
+
+
+def delta_path(path: str) -> str:
+    """The delta segment of an index or lexical index file: the rows ingested since the file was written."""
+    return f"{path}.delta"
+
+
+def _journal(index_path: str) -> str:
+    return f"{index_path}.swap"
+
+
+def _finish_swap(journal_path: str):
+    """Carry out the swap journal_path describes; every step can be repeated after an interruption."""
+    from brigade.corpus import commit_snapshot
+
+    with open(journal_path, "r") as f:
+        journal = json.load(f)
+    for path in journal["paths"]:
+        if os.path.exists(_next(path)):
+            os.replace(_next(path), path)
+    for path in journal.get("remove", ()):
+        if os.path.exists(path):
+            os.remove(path)
+    if journal.get("snapshot") is not None:
+        commit_snapshot(journal["snapshot"]["path"], journal["snapshot"]["count"])
+    # The appended embeddings become visible last, once everything else is in place
+    if journal["rows"] is not None:
+        commit_rows(journal["embeddings"], journal["rows"])
+    save_manifest(journal["manifest_path"], journal["manifest"])
+    os.remove(journal_path)
+
+
+def _swap(index_path: str, manifest_path: str, manifest: dict, paths: list = (), remove: list = (),
+          snapshot: dict = None, embeddings_path: str = None, rows: int = None):
+    """
+    Move the next generation of every file in paths into place, remove the
+    files in remove and commit the rows appended to the snapshot and the
+    embeddings at once, while no script is loading the index.
+    """
+    journal = {"paths": list(paths), "remove": list(remove), "snapshot": snapshot, "embeddings": embeddings_path,
+               "rows": rows, "manifest_path": manifest_path, "manifest": manifest}
+    with file_lock(index_path):
+        save_manifest(_journal(index_path), journal)
+        _finish_swap(_journal(index_path))
+
+
+def recover_swap(index_path: str):
+    """Finish a swap of the files of index_path that was interrupted, if any."""
+    if not os.path.exists(_journal(index_path)):
+        return
+    with file_lock(index_path):
+        if os.path.exists(_journal(index_path)):
+            print(f"[♻️] Finishing the interrupted swap recorded in {_journal(index_path)}")
+            _finish_swap(_journal(index_path))
+
+
+def _lexical_rows(lexical_path: str, texts) -> int:
+    """How many of the snapshot's documents the main lexical index at lexical_path covers; 0 if it is stale."""
+    from brigade.lexical import LexicalIndex
+
+    if not os.path.exists(lexical_path):
+        return 0
+    try:
+        lexical = LexicalIndex(lexical_path)
+    except ValueError:
+        return 0
+    rows = len(lexical) if lexical.index_digest == texts.index_digest and len(lexical) <= len(texts) else 0
+    lexical.close()
+    return rows
+
+
+def ingest(documents: dict, embedder, embeddings_path: str, index_path: str, corpus_path: str,
+           lexical_path: str, manifest_path: str = INGEST_FILE, delete_missing: bool = True,
+           batch_size: int = 256) -> dict:
+    """
+    Embed and append the new and changed documents ({id: text}), tombstoning
+    the rows they replace and, with delete_missing, those of ingested
+    documents no longer present. Returns {"added", "updated", "deleted",
+    "rows", "tombstones", "unmerged"}, unmerged being the rows in the delta
+    segments.
+    """
+    import faiss
+
+    from brigade.backends import SegmentedIndex, dequantize, load_delta_index, make_delta_index, quantize, storage_of
+    from brigade.corpus import CorpusSnapshot, append_snapshot, write_snapshot
+    from brigade.index import read_index
+    from brigade.lexical import build_lexical_index
+
+    recover_swap(index_path)
+    texts = CorpusSnapshot(corpus_path)
+    first = len(texts)
+    if np.load(embeddings_path, mmap_mode="r").shape[0] != first:
+        texts.close()
+        raise ValueError(f"{embeddings_path} and {corpus_path} have different numbers of recipes")
+    index = load_delta_index(read_index(index_path), delta_path(index_path), first)
+    delta = index.delta if isinstance(index, SegmentedIndex) else make_delta_index(index.d)
+    del index
+
+    manifest = load_manifest(manifest_path)
+    if manifest["rows"] not in (None, first):
+        print(f"[♻️] Ignoring {manifest_path}: it was written for a corpus of {manifest['rows']} recipes")
+        manifest = load_manifest(os.devnull)
+    known = manifest["documents"]
+    tombstones = set(manifest["tombstones"])
+    changes = {"added": 0, "updated": 0, "deleted": 0}
+
+    new = []
+    for (key, text) in documents.items():
+        entry = known.get(key)
+        if entry is not None and entry["digest"] == digest(text):
+            continue
+        if entry is not None:
+            tombstones.add(entry["row"])
+        changes["updated" if entry is not None else "added"] += 1
+        new.append((key, text))
+    if delete_missing:
+        for key in [key for key in known if key not in documents]:
+            tombstones.add(known.pop(key)["row"])
+            changes["deleted"] += 1
+
+    print(f"[📥] {changes['added']} new, {changes['updated']} changed and {changes['deleted']} deleted recipes "
+          f"against a corpus of {first}")
+    if not new and not changes["deleted"]:
+        texts.close()
+        return dict(changes, rows=first, tombstones=len(tombstones), unmerged=delta.ntotal)
+
+    manifest = {"rows": first, "documents": known, "tombstones": sorted(tombstones)}
+    if not new:
+        texts.close()
+        _swap(index_path, manifest_path, manifest)
+        print(f"[💾] Corpus has {first} recipes, {len(tombstones)} of them tombstoned")
+        return dict(changes, rows=first, tombstones=len(tombstones), unmerged=delta.ntotal)
+
+    print(f"[⚙️] Embedding {len(new)} recipes")
+    added = [text for (_, text) in new]
+    vectors = embedder.encode(added, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+    stored = quantize(np.asarray(vectors, dtype=np.float32), storage_of(np.load(embeddings_path, mmap_mode="r")))
+    rows = append_rows(embeddings_path, stored)
+
+    # The main index file stays as it is: new vectors go to the delta index, written next to the one in use
+    delta.add_with_ids(dequantize(stored), np.arange(first, rows, dtype=np.int64))
+    faiss.write_index(delta, _next(delta_path(index_path)))
+    paths = [delta_path(index_path)]
+    unmerged = delta.ntotal
+    del delta
+
+    # Texts are appended to the snapshot in place, and become visible when the swap commits them
+    count = append_snapshot(corpus_path, added)
+    snapshot = {"path": corpus_path, "count": count}
+    if count is None:
+        print(f"[♻️] Rewriting {corpus_path} with room for more recipes")
+        write_snapshot(_next(corpus_path), itertools.chain(texts, added), texts.index_digest).close()
+        (count, snapshot) = (rows, None)
+        paths.append(corpus_path)
+
+    # Likewise the main lexical index; the delta segment is rebuilt from the recipes it doesn't cover
+    lexical_rows = _lexical_rows(lexical_path, texts)
+    if lexical_rows:
+        delta_texts = itertools.chain((texts[row] for row in range(lexical_rows, first)), added)
+        build_lexical_index(_next(delta_path(lexical_path)), delta_texts, texts.index_digest).close()
+        paths.append(delta_path(lexical_path))
+    else:
+        build_lexical_index(_next(lexical_path), itertools.chain(texts, added), texts.index_digest).close()
+        paths.append(lexical_path)
+    texts.close()
+
+    for (n, (key, text)) in enumerate(new):
+        known[key] = {"row": first + n, "digest": digest(text)}
+    manifest["rows"] = count
+    _swap(index_path, manifest_path, manifest, paths, snapshot=snapshot, embeddings_path=embeddings_path, rows=rows)
+    print(f"[💾] Corpus has {count} recipes, {len(tombstones)} of them tombstoned and {unmerged} not yet compacted")
+    return dict(changes, rows=count, tombstones=len(tombstones), unmerged=unmerged)
+
+
+def compact(embeddings_path: str, index_path: str, corpus_path: str, lexical_path: str,
+            manifest_path: str = INGEST_FILE, config: dict = None, chunk_size: int = 65536) -> int:
+    """
+    Rewrite every file without the tombstoned rows and with the delta
+    segments folded in, from the stored vectors; returns the rows removed.
+    """
+    import faiss
+
+    from brigade.backends import build_backend_index, index_backend, load_index_config, storage_of
+    from brigade.corpus import CorpusSnapshot, digest_path, record_digest, write_snapshot
+    from brigade.index import read_index
+    from brigade.lexical import build_lexical_index
+
+    recover_swap(index_path)
+    manifest = load_manifest(manifest_path)
+    texts = CorpusSnapshot(corpus_path)
+    current = read_index(index_path)
+    tombstones = manifest["tombstones"] if manifest["rows"] == len(texts) else []
+    if not tombstones and current.ntotal == len(texts):
+        texts.close()
+        print("[🧹] Nothing to compact")
+        return 0
+
+    keep = np.setdiff1d(np.arange(len(texts)), np.array(tombstones, dtype=np.int64))
+    print(f"[🧹] Compacting {len(texts)} recipes to {len(keep)}, "
+          f"merging the {len(texts) - current.ntotal} in the delta segments")
+
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    next_embeddings = np.lib.format.open_memmap(_next(embeddings_path), mode="w+", dtype=embeddings.dtype,
+                                                shape=(len(keep),) + embeddings.shape[1:])
+    for start in range(0, len(keep), chunk_size):
+        next_embeddings[start:start + chunk_size] = embeddings[keep[start:start + chunk_size]]
+    next_embeddings.flush()
+    del next_embeddings
+
+    # Same backend and storage as the index in use
+    config = dict(config or load_index_config(), backend=index_backend(current), storage=storage_of(embeddings))
+    del current, embeddings
+    index = build_backend_index(np.load(_next(embeddings_path), mmap_mode="r"), config)
+    faiss.write_index(index, _next(index_path))
+    del index
+
+    index_digest = record_digest(_next(index_path), _next(digest_path(index_path)))
+    snapshot = write_snapshot(_next(corpus_path), (texts[int(row)] for row in keep), index_digest)
+    build_lexical_index(_next(lexical_path), snapshot, snapshot.index_digest).close()
+    count = len(snapshot)
+    snapshot.close()
+    removed = len(texts) - count
+    texts.close()
+
+    documents = {
+        key: dict(entry, row=int(np.searchsorted(keep, entry["row"])))
+        for (key, entry) in manifest["documents"].items()
+    }
+    _swap(index_path, manifest_path, {"rows": count, "documents": documents, "tombstones": []},
+          [embeddings_path, index_path, digest_path(index_path), corpus_path, lexical_path],
+          [delta_path(index_path), delta_path(lexical_path)])
+    print(f"[💾] Removed {removed} tombstoned recipes")
+    return removed
+
+
+def compact_in_background(argv: list[str], log_path: str):
+    """Start `python -m brigade.ingest compact` with argv in its own session, logging to log_path."""
+    with open(log_path, "a") as log:
+        subprocess.Popen([sys.executable, "-m", "brigade.ingest", "compact", *argv], stdout=log, stderr=log,
+                         stdin=subprocess.DEVNULL, start_new_session=True)
+
+
+# ------------------------------------------------
+# Command line
+# ------------------------------------------------
+def main(argv=None):
+    from brigade.index import CORPUS_FILE, EMBEDDING_MODEL, EMBEDDINGS_FILE, INDEX_FILE
+    from brigade.lexical import LEXICAL_FILE
+
+    parser = argparse.ArgumentParser("brigade.ingest")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Embed and append new and changed recipes, tombstoning replaced ones.")
+    add.add_argument("source",
+                     help="Directory of recipe text files, or JSON Lines file of {'id', 'text'} recipes.")
+    add.add_argument("--keep-missing",
+                     action="store_true",
+                     help="Keep ingested recipes that are no longer in the source instead of deleting them.")
+    add.add_argument("--compact-ratio",
+                     type=float,
+                     default=COMPACT_RATIO,
+                     help="Start a background compaction once this fraction of the corpus is tombstoned, "
+                          f"or is in the delta segments. Default: {COMPACT_RATIO}")
+    add.add_argument("--model", "-m",
+                     default=EMBEDDING_MODEL,
+                     help=f"Sentence embedding model; must be the one the index was built with. Default: {EMBEDDING_MODEL}")
+    add.add_argument("--batch-size",
+                     type=int,
+                     default=256,
+                     help="Encoder batch size. Default: 256")
+    compact_command = commands.add_parser("compact", help="Rewrite the index files without tombstoned recipes and "
+                                                          "with the delta segments merged.")
+    compact_command.add_argument("--index-config",
+                                 default=None,
+                                 help="JSON file with the index build parameters; backend and storage are kept.")
+    for command in (add, compact_command):
+        command.add_argument("--embeddings", default=EMBEDDINGS_FILE, help=f"Default: {EMBEDDINGS_FILE}")
+        command.add_argument("--index", default=INDEX_FILE, help=f"Default: {INDEX_FILE}")
+        command.add_argument("--corpus", default=CORPUS_FILE, help=f"Default: {CORPUS_FILE}")
+        command.add_argument("--lexical", default=LEXICAL_FILE, help=f"Default: {LEXICAL_FILE}")
+        command.add_argument("--manifest", default=INGEST_FILE, help=f"Default: {INGEST_FILE}")
+    args = parser.parse_args(argv)
+    paths = (args.embeddings, args.index, args.corpus, args.lexical, args.manifest)
+
+    with file_lock(args.manifest):
+        if args.command == "add":
+            from sentence_transformers import SentenceTransformer
+
+            documents = read_source(args.source)
+            result = ingest(documents, SentenceTransformer(args.model), *paths, not args.keep_missing,
+                            args.batch_size)
+        else:
+            from brigade.backends import load_index_config
+
+            compact(*paths, load_index_config(args.index_config))
+            return
+
+    if result["rows"] and max(result["tombstones"], result["unmerged"]) / result["rows"] > args.compact_ratio:
+        print(f"[🧹] {result['tombstones']} of {result['rows']} recipes tombstoned and {result['unmerged']} in the "
+              "delta segments; compacting in the background")
+        compact_in_background(["--embeddings", args.embeddings, "--index", args.index, "--corpus", args.corpus,
+                               "--lexical", args.lexical, "--manifest", args.manifest], "ingest-compact.log")
+
+
+if __name__ == "__main__":
+    main()
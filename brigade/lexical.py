@@ -0,0 +1,292 @@
+"""
+Lexical (BM25) index over the corpus snapshot, stored on disk.
+
+Dense retrieval misses exact matches on rare words: dish names and
+ingredients such as 'rôtisseur' or 'gruyère'. The lexical index scores
+documents by Okapi BM25 over their words instead. Words are case-folded,
+stripped of accents (so 'gruyere' finds 'gruyère'), singularized as in
+brigade/resources.py, and a few words common to every request ('make me a')
+are dropped.
+
+The index is a single memory-mapped file laid out as
+
+    header           magic, format version, document count, term count,
+                     average document length, index digest
+    term offsets     (terms + 1) little-endian uint64 byte offsets into the terms
+    posting offsets  (terms + 1) little-endian uint64 offsets into the postings
+    lengths          count little-endian uint32 document lengths in words
+    documents        the postings' document ids, uint32, grouped by term
+    frequencies      the postings' term frequencies, uint32, grouped by term
+    terms            the UTF-8 encoded terms, sorted, back to back
+
+so a query reads only the terms it binary-searches and the postings of the
+terms it finds. Like the corpus snapshot, the header records the digest of
+the index file the documents belong to, and a stale index is rebuilt.
+
+Recipes added by brigade.ingest go into a second file of the same format, the
+delta segment, which covers the documents after the main file's last one
+until compaction folds it back in. ``Segments`` searches both as one index
+with the BM25 statistics (document count, document frequencies, average
+length) of the whole corpus, so scores are the same as with a single file.
+"""
+import collections
+import mmap
+import os
+import re
+import struct
+import unicodedata
+from array import array
+
+import numpy as np
+
+from brigade.resources import singular
+
+LEXICAL_FILE = "lexical.bin"
+
+MAGIC = b"KBLEXICN"
+VERSION = 1
+HEADER = struct.Struct("<8sIQQd32s4x")
+
+# BM25 term frequency saturation and document length normalization
+K1 = 1.2
+B = 0.75
+
+TOKEN = re.compile(r"[^\W_]+(?:'s\b)?")
+# Combining diacritical marks, left over from NFKD decomposition, and typographic apostrophes
+ACCENTS = {**dict.fromkeys(range(0x300, 0x370)), ord("’"): "'"}
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "i", "in", "is", "it", "make", "me", "my",
+    "of", "on", "or", "please", "some", "that", "the", "this", "to", "with", "you",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """The indexed words of text, in order."""
+    folded = unicodedata.normalize("NFKD", text.casefold()).translate(ACCENTS)
+    return [singular(word) for word in TOKEN.findall(folded) if word not in STOPWORDS]
+
+
+def build_lexical_index(path: str, texts, index_digest: bytes) -> "LexicalIndex":
+    """
+    Index texts (any iterable, e.g. a corpus snapshot) into a lexical index file
+    bound to index_digest and return it opened. The file is written next to
+    path and moved into place, so readers never see a partial index.
+    """
+    postings = {}  # term -> (document ids, frequencies)
+    lengths = array("I")
+    for (document, text) in enumerate(texts):
+        words = collections.Counter(tokenize(text))
+        lengths.append(sum(words.values()))
+        for (term, frequency) in words.items():
+            entry = postings.get(term)
+            if entry is None:
+                entry = postings[term] = (array("I"), array("I"))
+            entry[0].append(document)
+            entry[1].append(frequency)
+
+    terms = sorted(postings, key=lambda term: term.encode("utf-8"))
+    encoded = [term.encode("utf-8") for term in terms]
+    term_offsets = np.zeros(len(terms) + 1, dtype="<u8")
+    term_offsets[1:] = np.cumsum([len(term) for term in encoded], dtype=np.uint64)
+    posting_offsets = np.zeros(len(terms) + 1, dtype="<u8")
+    posting_offsets[1:] = np.cumsum([len(postings[term][0]) for term in terms], dtype=np.uint64)
+    average_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(lengths), len(terms), average_length, index_digest))
+        f.write(term_offsets.tobytes())
+        f.write(posting_offsets.tobytes())
+        f.write(np.asarray(lengths, dtype="<u4").tobytes())
+        for column in (0, 1):
+            for term in terms:
+                f.write(np.asarray(postings[term][column], dtype="<u4").tobytes())
+        for term in encoded:
+            f.write(term)
+
+    os.replace(tmp_path, path)
+    return LexicalIndex(path)
+
+
+class LexicalIndex:
+    """Read-only, memory-mapped view of a lexical index file, searched with BM25."""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mm) < HEADER.size:
+            self._mm.close()
+            raise ValueError(f"{path} is not a lexical index")
+
+        magic, version, count, terms, average_length, index_digest = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a lexical index")
+        if version != VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} has unsupported lexical index version {version}")
+
+        self.count = count
+        self.terms = terms
+        self.average_length = average_length
+        self.index_digest = index_digest
+
+        offset = HEADER.size
+        self._term_offsets = np.frombuffer(self._mm, dtype="<u8", count=terms + 1, offset=offset)
+        offset += self._term_offsets.nbytes
+        self._posting_offsets = np.frombuffer(self._mm, dtype="<u8", count=terms + 1, offset=offset)
+        offset += self._posting_offsets.nbytes
+        self._lengths = np.frombuffer(self._mm, dtype="<u4", count=count, offset=offset)
+        offset += self._lengths.nbytes
+        postings = int(self._posting_offsets[-1])
+        self._documents = np.frombuffer(self._mm, dtype="<u4", count=postings, offset=offset)
+        offset += self._documents.nbytes
+        self._frequencies = np.frombuffer(self._mm, dtype="<u4", count=postings, offset=offset)
+        self._terms_start = offset + self._frequencies.nbytes
+
+    def __len__(self):
+        return self.count
+
+    def _term(self, n: int) -> bytes:
+        (start, end) = self._term_offsets[n:n + 2]
+        return self._mm[self._terms_start + int(start):self._terms_start + int(end)]
+
+    def postings(self, term: str):
+        """(document ids, frequencies) of the documents containing term, found by binary search."""
+        key = term.encode("utf-8")
+        (low, high) = (0, self.terms)
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.terms or self._term(low) != key:
+            return self._documents[:0], self._frequencies[:0]
+        (start, end) = (int(offset) for offset in self._posting_offsets[low:low + 2])
+        return self._documents[start:end], self._frequencies[start:end]
+
+    def search(self, query: str, k: int = 5) -> list:
+        """The top-k (document id, BM25 score) pairs for query, best first."""
+        return self.search_many([query], k)[0]
+
+    def search_many(self, queries: list[str], k: int = 5) -> list:
+        """
+        search() for every query at once: each distinct term's postings are
+        read and weighted once, and the scores of all (query, document) pairs
+        are summed and ranked in a few array operations.
+        """
+        return _search_segments([self], queries, k)
+
+    def close(self):
+        # The arrays borrow the map's buffer, which has to be released first
+        self._term_offsets = self._posting_offsets = self._lengths = self._documents = self._frequencies = None
+        self._mm.close()
+
+
+class Segments:
+    """A main lexical index and its delta segment, searched as one index with the delta's documents last."""
+    def __init__(self, main: LexicalIndex, delta: LexicalIndex):
+        self.main = main
+        self.delta = delta
+        self.terms = main.terms
+        self.index_digest = main.index_digest
+
+    def __len__(self):
+        return len(self.main) + len(self.delta)
+
+    def search(self, query: str, k: int = 5) -> list:
+        return self.search_many([query], k)[0]
+
+    def search_many(self, queries: list[str], k: int = 5) -> list:
+        return _search_segments([self.main, self.delta], queries, k)
+
+    def close(self):
+        self.main.close()
+        self.delta.close()
+
+
+def _weights(segments: list, term: str):
+    """(document ids, BM25 weights) of the documents containing term, numbered across segments."""
+    found = [segment.postings(term) for segment in segments]
+    count = sum(len(segment) for segment in segments)
+    average_length = sum(segment.average_length * len(segment) for segment in segments) / count
+    containing = sum(len(documents) for (documents, _) in found)
+    idf = np.log(1 + (count - containing + 0.5) / (containing + 0.5))
+
+    (documents, weights, first) = ([], [], 0)
+    for (segment, (ids, frequencies)) in zip(segments, found):
+        frequencies = frequencies.astype(np.float32)
+        norm = K1 * (1 - B + B * segment._lengths[ids] / average_length)
+        documents.append(ids.astype(np.int64) + first)
+        weights.append(idf * frequencies * (K1 + 1) / (frequencies + norm))
+        first += len(segment)
+    return np.concatenate(documents), np.concatenate(weights)
+
+
+def _search_segments(segments: list, queries: list[str], k: int) -> list:
+    """search_many() over segments, numbering each segment's documents after the previous segment's."""
+    count = sum(len(segment) for segment in segments)
+    weighted = {}
+    (query_ids, documents, weights) = ([], [], [])
+    for (n, query) in enumerate(queries):
+        for term in dict.fromkeys(tokenize(query)):
+            if term not in weighted:
+                weighted[term] = _weights(segments, term)
+            (found, term_weights) = weighted[term]
+            if len(found):
+                query_ids.append(np.full(len(found), n, dtype=np.int64))
+                documents.append(found)
+                weights.append(term_weights)
+    results = [[] for _ in queries]
+    if not documents or k < 1:
+        return results
+
+    # One key per (query, document) pair
+    keys = np.concatenate(query_ids) * count + np.concatenate(documents)
+    (pairs, inverse) = np.unique(keys, return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(weights))
+    (pair_queries, pair_documents) = np.divmod(pairs, count)
+
+    # Best first within each query, ties by document id; keep each query's first k
+    order = np.lexsort((pair_documents, -scores, pair_queries))
+    ranked = pair_queries[order]
+    order = order[np.arange(len(order)) - np.searchsorted(ranked, ranked) < k]
+    for (n, document, score) in zip(pair_queries[order].tolist(), pair_documents[order].tolist(),
+                                    scores[order].tolist()):
+        results[n].append((document, score))
+    return results
+
+
+def load_lexical_index(path: str, texts, delta_path: str = None):
+    """
+    Open the lexical index at path, with its delta segment at delta_path if
+    the main file stops short of the last document, if they were built for
+    the corpus snapshot texts. Otherwise rebuild it from texts and bind it to
+    the same index.
+    """
+    if os.path.exists(path):
+        try:
+            lexical = LexicalIndex(path)
+        except ValueError as e:
+            print(f"[♻️] Ignoring unreadable lexical index: {e}")
+        else:
+            if lexical.index_digest == texts.index_digest and len(lexical) == len(texts):
+                print(f"[💾] Loaded lexical index of {lexical.terms} terms from {path}")
+                return lexical
+            if (lexical.index_digest == texts.index_digest and len(lexical) < len(texts)
+                    and delta_path and os.path.exists(delta_path)):
+                delta = LexicalIndex(delta_path)
+                if delta.index_digest == texts.index_digest and len(lexical) + len(delta) == len(texts):
+                    print(f"[💾] Loaded lexical index of {lexical.terms} terms from {path} "
+                          f"and {len(delta)} added recipes from {delta_path}")
+                    return Segments(lexical, delta)
+                delta.close()
+            print(f"[♻️] Lexical index {path} does not match the corpus snapshot")
+            lexical.close()
+
+    print("[📚] Building lexical index from the corpus snapshot...")
+    lexical = build_lexical_index(path, texts, texts.index_digest)
+    print(f"[💾] Saved lexical index of {lexical.terms} terms to {path}")
+    return lexical
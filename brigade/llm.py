@@ -0,0 +1,305 @@
+"""
+LLM Wrapper: OpenAI or watsonx, with an optional response cache. The "mock"
+provider replays recorded responses offline (see brigade/mock.py).
+
+Besides the blocking ``generate`` the wrapper offers ``agenerate`` for use
+from asyncio (native for OpenAI, through one AsyncOpenAI client kept for the
+wrapper's lifetime and released by ``close``; a blocking call on a worker
+thread for watsonx), ``generate_concurrently`` to run independent prompts
+(such as the two judges) at the same time from synchronous code, ``stream`` to
+consume a completion piece by piece as it is produced, and ``generate_json``
+for schema-constrained structured output.
+
+Every call is recorded as a span on the wrapper's tracer (see
+brigade/trace.py), with the token counts the provider reports.
+
+Every request to the provider goes through a ``RequestScheduler`` (see
+brigade/ratelimit.py) that enforces requests- and tokens-per-minute budgets,
+admits waiting requests by priority and retries transient failures with
+backoff. Each call takes a ``priority``; cached responses skip the scheduler.
+
+The provider SDKs are imported when a client for them is created, so only
+the selected provider's SDK is ever loaded, and none at all when replaying.
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+
+from brigade.ratelimit import DEFAULT, RequestScheduler, estimate_tokens, record_usage
+from brigade.trace import Tracer, annotate
+
+
+class LLMWrapper:
+    def __init__(self, provider: str, model_name: str, cache=None, tracer=None, scheduler=None,
+                 timeout: float = None):
+        """
+        cache is an optional brigade.cache.ResponseCache. In replay mode no
+        client is created, so no credentials are needed. tracer is an
+        optional brigade.trace.Tracer that records every call. scheduler is
+        a brigade.ratelimit.RequestScheduler, e.g. shared_scheduler(provider);
+        by default requests are only retried, without budgets. timeout is the
+        OpenAI request timeout in seconds.
+        """
+        self.provider = provider
+        self.model = model_name
+        self.cache = cache
+        self.tracer = tracer or Tracer(enabled=False)
+        self.scheduler = scheduler or RequestScheduler()
+        self.timeout = timeout
+        # watsonx model handle, and the async OpenAI client with the event loop thread it runs
+        # on; created on first use and kept until close()
+        self._watsonx_inference = None
+        self._async_client = None
+        self._async_loop = None
+        self._async_lock = threading.Lock()
+
+        if provider not in ("openai", "watsonx", "mock"):
+            raise ValueError("Provider must be 'openai', 'watsonx' or 'mock'")
+
+        if cache is not None and cache.replay:
+            self.client = None
+        elif provider == "mock":
+            from brigade.mock import MockClient
+            self.client = MockClient()
+        elif provider == "openai":
+            api_key = os.getenv("OPENAI_API_KEY", "")
+            if not api_key:
+                raise ValueError("Missing OPENAI_API_KEY in environment")
+            from openai import OpenAI
+            # Retries are the scheduler's job
+            self.client = OpenAI(api_key=api_key, timeout=timeout, max_retries=0)
+        else:  # watsonx
+            url = os.getenv("WATSONX_URL", "")
+            apikey = os.getenv("WATSONX_APIKEY", "")
+            if not url or not apikey:
+                raise ValueError("Missing WATSONX_URL or WATSONX_APIKEY in environment")
+            from ibm_watsonx_ai import APIClient, Credentials
+            creds = Credentials(url=url, token=apikey)
+            self.client = APIClient(credentials=creds)
+
+    def generate(self, prompt: str, priority: int = DEFAULT, **params) -> str:
+        """
+        Complete prompt. Extra keyword arguments (temperature, max_tokens, ...)
+        are passed to the provider and are part of the cache key.
+        """
+        with self._span("llm.generate"):
+            if self.cache is not None:
+                cached = self.cache.get(self.provider, self.model, prompt, params)
+                if cached is not None:
+                    annotate(cached=True)
+                    return cached
+
+            response = self.scheduler.run(
+                lambda: self._complete(prompt, **params), estimate_tokens(prompt, params), priority
+            )
+
+            if self.cache is not None:
+                self.cache.put(self.provider, self.model, prompt, params, response)
+            return response
+
+    def _span(self, name: str):
+        return self.tracer.span(name, kind="client", provider=self.provider, model=self.model)
+
+    def generate_json(self, prompt: str, schema: dict, name: str = "response", priority: int = DEFAULT, **params):
+        """
+        Complete prompt as a JSON document matching schema and return it parsed.
+        OpenAI enforces the schema through structured outputs; watsonx gets
+        the schema in the prompt. Raises ValueError if no JSON comes back.
+        """
+        if self.provider == "openai":
+            response = self.generate(
+                prompt,
+                priority,
+                response_format={"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}},
+                **params
+            )
+        else:  # watsonx
+            response = self.generate(
+                f"{prompt}\n\nRespond only with a JSON document that matches this JSON schema:\n{json.dumps(schema)}",
+                priority,
+                **params
+            )
+        return parse_json_response(response)
+
+    def stream(self, prompt: str, priority: int = DEFAULT, **params):
+        """
+        Yield the completion in pieces as they arrive. A cached response is
+        yielded whole; a streamed one is cached once it is complete. Only
+        starting the stream is retried: once pieces have been passed on, a
+        failure is raised.
+        """
+        with self._span("llm.stream"):
+            if self.cache is not None:
+                cached = self.cache.get(self.provider, self.model, prompt, params)
+                if cached is not None:
+                    annotate(cached=True)
+                    yield cached
+                    return
+
+            pieces = []
+            for piece in self.scheduler.stream(lambda: self._stream(prompt, **params),
+                                               estimate_tokens(prompt, params), priority):
+                pieces.append(piece)
+                yield piece
+
+            if self.cache is not None:
+                response = "".join(pieces)
+                if self.provider == "openai":
+                    response = response.strip()  # same form generate() caches
+                self.cache.put(self.provider, self.model, prompt, params, response)
+
+    def _stream(self, prompt: str, **params):
+        if self.provider == "openai":
+            chunks = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                # The last chunk then carries the token counts
+                **{"stream_options": {"include_usage": True}, **params}
+            )
+            for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None):
+                    _record_openai_usage(chunk.usage)
+        elif self.provider == "watsonx":
+            usage = {}
+            for chunk in self._watsonx_model().generate_text_stream(prompt=prompt, params=params or None, raw_response=True):
+                for result in chunk.get("results", []):
+                    # Every chunk carries the running token counts; the last ones are the totals
+                    for key in ("input_token_count", "generated_token_count"):
+                        if result.get(key) is not None:
+                            usage[key] = result[key]
+                    if result.get("generated_text"):
+                        yield result["generated_text"]
+            record_usage(prompt_tokens=usage.get("input_token_count"),
+                         completion_tokens=usage.get("generated_token_count"))
+        else:  # mock
+            # Recorded responses are replayed whole
+            yield self._complete(prompt, **params)
+
+    def _complete(self, prompt: str, **params) -> str:
+        if self.provider == "mock":
+            # Generation parameters don't change a replayed response
+            return self.client.complete(prompt)
+        if self.provider == "openai":
+            resp = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                **params
+            )
+            _record_openai_usage(resp.usage)
+            return resp.choices[0].message.content.strip()
+        else:  # watsonx
+            resp = self._watsonx_model().generate_text(prompt=prompt, params=params or None, raw_response=True)
+            result = resp["results"][0]
+            record_usage(prompt_tokens=result.get("input_token_count"),
+                         completion_tokens=result.get("generated_token_count"))
+            return result["generated_text"]
+
+    def _watsonx_model(self):
+        if self._watsonx_inference is None:
+            from ibm_watsonx_ai.foundation_models import ModelInference
+            self._watsonx_inference = ModelInference(model_id=self.model, api_client=self.client)
+        return self._watsonx_inference
+
+    async def agenerate(self, prompt: str, priority: int = DEFAULT, **params) -> str:
+        """Async generate(); consults and fills the same response cache."""
+        with self._span("llm.agenerate"):
+            if self.cache is not None:
+                cached = self.cache.get(self.provider, self.model, prompt, params)
+                if cached is not None:
+                    annotate(cached=True)
+                    return cached
+
+            response = await self.scheduler.arun(
+                lambda: self._acomplete(prompt, **params), estimate_tokens(prompt, params), priority
+            )
+
+            if self.cache is not None:
+                self.cache.put(self.provider, self.model, prompt, params, response)
+            return response
+
+    async def _acomplete(self, prompt: str, **params) -> str:
+        if self.provider == "openai":
+            # The request runs on the client's own loop, whichever loop awaits it
+            request = self._openai_async_client().chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                **params
+            )
+            resp = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(request, self._async_loop))
+            _record_openai_usage(resp.usage)
+            return resp.choices[0].message.content.strip()
+        # Not truly async: the watsonx and mock calls are the blocking _complete()
+        # on a worker thread, so other requests proceed meanwhile but each one
+        # holds a thread. to_thread copies the context, so the token counts land
+        # on this span.
+        return await asyncio.to_thread(self._complete, prompt, **params)
+
+    def _openai_async_client(self):
+        # httpx connection pools belong to the loop they were opened on, so the client
+        # gets a loop of its own, on a background thread, for as long as it is open
+        with self._async_lock:
+            if self._async_client is None:
+                from openai import AsyncOpenAI
+                self._async_loop = asyncio.new_event_loop()
+                threading.Thread(target=self._async_loop.run_forever, name="llm-async", daemon=True).start()
+                self._async_client = AsyncOpenAI(api_key=self.client.api_key, timeout=self.timeout, max_retries=0)
+            return self._async_client
+
+    def generate_concurrently(self, prompts: list[str], priority: int = DEFAULT, **params) -> list[str]:
+        """Complete independent prompts at the same time; responses are in prompt order."""
+        async def run():
+            return await asyncio.gather(*(self.agenerate(prompt, priority, **params) for prompt in prompts))
+
+        return asyncio.run(run())
+
+    def close(self):
+        """Close the async client and stop its loop, e.g. when the pipeline shuts down. Blocking calls still work."""
+        with self._async_lock:
+            if self._async_client is not None:
+                asyncio.run_coroutine_threadsafe(self._async_client.close(), self._async_loop).result()
+                self._async_loop.call_soon_threadsafe(self._async_loop.stop)
+                self._async_client = None
+                self._async_loop = None
+
+
+def _record_openai_usage(usage):
+    if usage is not None:
+        record_usage(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+
+def tee_to_file(pieces, f):
+    """Pass streamed pieces through, appending each to the open file f as it arrives."""
+    for piece in pieces:
+        f.write(piece)
+        f.flush()
+        yield piece
+
+
+def iter_lines(pieces):
+    """Regroup streamed pieces into complete lines, yielding each as soon as it ends."""
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        *lines, buffer = buffer.split("\n")
+        yield from lines
+    if buffer:
+        yield buffer
+
+
+def parse_json_response(response: str):
+    """Parse a model's JSON answer, tolerating a markdown code fence or text around it."""
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", response, re.DOTALL)
+    if fenced:
+        response = fenced.group(1)
+    start = min((i for i in (response.find("{"), response.find("[")) if i != -1), default=-1)
+    if start == -1:
+        raise ValueError(f"Expected a JSON response, got: {response[:80]!r}")
+    try:
+        return json.JSONDecoder().raw_decode(response[start:])[0]
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Malformed JSON response: {e}") from e
@@ -0,0 +1,161 @@
+"""
+Offline stand-in for the LLM providers: ``LLMWrapper("mock", ...)``.
+
+Responses are replayed from the output files of recorded runs in
+``brigade/fixtures/responses/`` (copies of the runs under ``results/`` that
+the README reproduces), or in the directory in ``MOCK_LLM_RESPONSES``: each
+prompt is recognized by the stage of the workflow it comes from, and one of
+the responses recorded for that stage is picked by a hash of the prompt, so
+the same prompt always gets the same response. The fixtures are fixed, so
+the mock answers the same whatever the scripts, the batch runner or the
+benchmark have written since; directories with a ``run.log``, which only
+batch runs write, are skipped in any directory.
+
+Recorded plans name the members of the crew they were made for. To keep the
+plan routable for any crew, it is re-parsed and every assignee that is not
+in the crew listed in the prompt is mapped onto one that is, round robin. In
+JSON mode the same plan is returned as a JSON document.
+
+Latency is simulated with ``MOCK_LLM_LATENCY`` seconds per call, varied by up
+to ``MOCK_LLM_JITTER`` (a fraction, e.g. 0.2 for +-20%) with a random
+generator seeded by the prompt, so the delays are reproducible too. Token
+counts are approximated by whitespace-separated words.
+
+``MOCK_LLM_RATE_LIMIT`` (a fraction) of the calls fail with a 429 error,
+as a provider's rate limit would, to exercise the retries of the request
+scheduler (brigade/ratelimit.py). Which attempts fail is again decided by the
+prompt, and the attempt number, so the failures are reproducible too.
+"""
+import collections
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
+from brigade.plan import PlanParser
+from brigade.ratelimit import record_usage
+
+DEFAULT_RESPONSES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "responses")
+# Written by brigade.batch into every run's directory; those outputs are not recordings
+RUN_LOG = "run.log"
+
+# (marker in the prompt, recorded output file), checked in order
+STAGES = (
+    ("cannot be executed as written", None),  # structured plan repair: answered with no fixes
+    ("As the Planning Judge", "plan-feedback.txt"),
+    ("As the Execution Judge", "execution-feedback.txt"),
+    ("Combine these executed subtasks", "final-recipe.txt"),
+    ("Plan a time-step sequence", "execution-plan.txt"),
+    ("Create a recipe for the dish", "generated-recipe.txt"),
+)
+PLAN_FILE = "execution-plan.txt"
+CREW_LINE = re.compile(r"^(.+?) \[(\d+)\]$", re.MULTILINE)
+
+
+class MockRateLimitError(Exception):
+    status_code = 429
+
+
+class _AnyMember:
+    """Staff stand-in that accepts any 'Role <n>' assignee, for re-parsing recorded plans."""
+    def __contains__(self, member):
+        return bool(re.fullmatch(r".+ \d+", member))
+
+    def __iter__(self):
+        return iter(())
+
+
+def load_recordings(root: str) -> dict:
+    """
+    {output file name: [file contents, ...]} for every stage's file under
+    root, in path order, leaving out the directories of batch runs.
+    """
+    names = {name for (_, name) in STAGES if name}
+    recordings = collections.defaultdict(list)
+    for (directory, _, files) in sorted(os.walk(root)):
+        if RUN_LOG in files:
+            continue
+        for name in sorted(files):
+            if name in names:
+                with open(os.path.join(directory, name), "r") as f:
+                    recordings[name].append(f.read().strip())
+    return recordings
+
+
+def crew_members(prompt: str) -> list[str]:
+    """Team members of the 'Role [count]' list in a planning prompt."""
+    return [f"{role} {n}" for (role, count) in CREW_LINE.findall(prompt) for n in range(1, int(count) + 1)]
+
+
+def remap_plan(plan_text: str, members: list[str]):
+    """The recorded plan parsed, with assignees outside members moved onto members round robin."""
+    parser = PlanParser(_AnyMember())
+    for line in plan_text.split("\n"):
+        parser.feed(line)
+    plan = parser.plan()
+
+    crew = set(members)
+    spare = [member for member in members if not member.startswith("Nonce ")] or members
+    mapping = {}
+    for step in plan.steps:
+        for (n, task) in enumerate(step.tasks):
+            if task.member not in crew:
+                if task.member not in mapping:
+                    mapping[task.member] = spare[len(mapping) % len(spare)]
+                step.tasks[n] = task._replace(member=mapping[task.member])
+    return plan
+
+
+class MockClient:
+    def __init__(self, root: str = None, latency: float = None, jitter: float = None, rate_limit: float = None):
+        self.root = root or os.getenv("MOCK_LLM_RESPONSES", DEFAULT_RESPONSES)
+        self.latency = latency if latency is not None else float(os.getenv("MOCK_LLM_LATENCY", "0"))
+        self.jitter = jitter if jitter is not None else float(os.getenv("MOCK_LLM_JITTER", "0"))
+        self.rate_limit = rate_limit if rate_limit is not None else float(os.getenv("MOCK_LLM_RATE_LIMIT", "0"))
+        self.attempts = collections.Counter()
+        self.recordings = load_recordings(self.root)
+        if not self.recordings:
+            raise ValueError(f"No recorded responses under '{self.root}' for the mock provider")
+
+    def complete(self, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        seed = int.from_bytes(digest[:8], "big")
+
+        if self.latency:
+            time.sleep(self.latency * (1 + self.jitter * random.Random(seed).uniform(-1, 1)))
+
+        if self.rate_limit:
+            self.attempts[seed] += 1
+            if random.Random(seed + self.attempts[seed]).random() < self.rate_limit:
+                raise MockRateLimitError("Rate limit reached (simulated)")
+
+        response = self._respond(prompt, seed)
+        record_usage(prompt_tokens=len(prompt.split()), completion_tokens=len(response.split()))
+        return response
+
+    def _respond(self, prompt: str, seed: int) -> str:
+        for (marker, name) in STAGES:
+            if marker not in prompt:
+                continue
+            if name is None:
+                return json.dumps({"fixes": []})
+
+            recorded = self.recordings.get(name)
+            if not recorded:
+                raise ValueError(f"No recorded {name} under '{self.root}' for the mock provider")
+            response = recorded[seed % len(recorded)]
+
+            if name == PLAN_FILE:
+                plan = remap_plan(response, crew_members(prompt))
+                if "JSON" in prompt:
+                    return json.dumps({"steps": [
+                        {"step": step.number, "title": step.title, "after": list(step.depends_on),
+                         "tasks": [{"member": task.member, "task": task.text} for task in step.tasks]}
+                        for step in plan.steps
+                    ]})
+                return plan.render()
+            return response
+
+        raise ValueError(f"The mock provider does not recognize this prompt: {prompt[:80]!r}...")
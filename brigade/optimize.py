@@ -0,0 +1,158 @@
+"""
+Plan load balancing between the planner and the executor.
+
+The executor runs a plan's steps in order with a barrier between them, and a
+team member with several tasks in one step works through them one after
+another. So a step lasts as long as its busiest member's queue, and the
+plan's makespan is the sum of those. ``plan_metrics`` measures that, plus
+the critical path (the busiest member of every step) and the utilization of
+each member of the crew.
+
+``merge_steps`` cuts the number of steps: steps whose dependencies (see
+brigade/plan.py) are all finished by the same point run together as one
+step. A step the planner gave no dependencies is taken to need every step
+before it, so only the planner's explicit 'T4 (after T1, T2)' lets a step
+move up. Merging never lengthens the makespan: a merged step lasts at most
+as long as the steps it replaces one after the other.
+
+``balance_plan`` shortens the makespan by moving tasks from overloaded
+members to idle or less loaded members qualified to do them: members of the
+same role, who are interchangeable by construction of the crew file, and
+members of roles the crew file lists as able to cover the role (see
+brigade/crew.py). Balancing moves tasks only within their step.
+
+Task costs default to one unit each; pass cost to weigh tasks differently.
+"""
+import collections
+
+from brigade.plan import Plan, Step, link_steps
+
+
+def unit_cost(task) -> float:
+    return 1
+
+
+def member_loads(step: Step, cost=unit_cost) -> dict:
+    """Total task cost of each member with work in step."""
+    loads = collections.Counter()
+    for task in step.tasks:
+        loads[task.member] += cost(task)
+    return loads
+
+
+def plan_metrics(plan: Plan, crew, cost=unit_cost) -> dict:
+    """Makespan, critical path, per-step load and per-member utilization of plan for crew."""
+    steps = []
+    critical_path = []
+    busy = collections.Counter()
+
+    for step in plan.steps:
+        loads = member_loads(step, cost)
+        busy.update(loads)
+        (busiest, longest) = max(loads.items(), key=lambda item: item[1]) if loads else (None, 0)
+        critical_path.append({"step": step.number, "member": busiest, "load": longest})
+        steps.append({"step": step.number, "tasks": len(step.tasks), "members": len(loads), "makespan": longest})
+
+    makespan = sum(step["makespan"] for step in steps)
+    utilization = {member: load / makespan for (member, load) in busy.items()} if makespan else {}
+    return {
+        "makespan": makespan,
+        "steps": steps,
+        "critical_path": critical_path,
+        "utilization": utilization,
+        "step_count": len(plan.steps),
+        "members_with_work": len(busy),
+        "crew_size": len(crew),
+        # Share of the crew's total time spent working
+        "crew_utilization": sum(busy.values()) / (makespan * len(crew)) if makespan and len(crew) else 0.0,
+    }
+
+
+def _move(tasks, loads, crew, cost):
+    """Move one task off the most loaded member it can be moved off, if that shortens their queue."""
+    for busiest in sorted(loads, key=lambda member: -loads[member]):
+        role = crew.role_of(busiest)
+        if role is None:
+            continue
+        positions = sorted((n for (n, task) in enumerate(tasks) if task.member == busiest),
+                           key=lambda n: cost(tasks[n]))
+        idlest = min((member for member in crew.qualified_members(role) if member != busiest),
+                     key=lambda member: loads.get(member, 0), default=None)
+        for n in positions:
+            if idlest is not None and loads.get(idlest, 0) + cost(tasks[n]) < loads[busiest]:
+                loads[busiest] -= cost(tasks[n])
+                loads[idlest] = loads.get(idlest, 0) + cost(tasks[n])
+                move = (tasks[n], busiest, idlest)
+                tasks[n] = tasks[n]._replace(member=idlest)
+                return move
+    return None
+
+
+def balance_step(step: Step, crew, cost=unit_cost):
+    """
+    Rebalance step's tasks among qualified members; returns (balanced Step,
+    moves) with moves as (task, from member, to member). Every move strictly
+    evens out the loads, so this terminates.
+    """
+    loads = member_loads(step, cost)
+    tasks = list(step.tasks)
+    moves = []
+    while (move := _move(tasks, loads, crew, cost)) is not None:
+        moves.append(move)
+    return Step(step.number, step.title, tasks, step.depends_on), moves
+
+
+def balance_plan(plan: Plan, crew, cost=unit_cost):
+    """plan with every step balanced by balance_step; returns (balanced Plan, moves)."""
+    steps = []
+    moves = []
+    for step in plan.steps:
+        (balanced, step_moves) = balance_step(step, crew, cost)
+        steps.append(balanced)
+        moves.extend(step_moves)
+    return Plan(steps, list(plan.unparsed)), moves
+
+
+def merge_steps(plan: Plan):
+    """
+    plan with the steps that can start at the same point merged into the
+    first of them; returns (merged Plan, merges) with merges as (step number,
+    number of the step it was merged into).
+    """
+    # A step's level is the number of steps that have to run before it
+    levels = {}
+    for (previous, step) in zip([None] + plan.steps, plan.steps):
+        if previous is None:
+            levels[step.number] = 0
+        elif step.depends_on == (previous.number,):
+            # Only the step before it: it waits for everything so far
+            levels[step.number] = max(levels.values()) + 1
+        else:
+            levels[step.number] = max((levels[number] + 1 for number in step.depends_on), default=0)
+
+    merged = {}
+    merges = []
+    for step in plan.steps:
+        first = merged.get(levels[step.number])
+        if first is None:
+            merged[levels[step.number]] = Step(step.number, step.title, list(step.tasks))
+            continue
+        first.title = "; ".join(filter(None, (first.title, step.title)))
+        first.tasks.extend(task._replace(step=first.number) for task in step.tasks)
+        merges.append((step.number, first.number))
+
+    steps = [merged[level] for level in sorted(merged)]
+    return Plan(link_steps(steps), list(plan.unparsed)), merges
+
+
+def optimization_report(before: Plan, after: Plan, moves, crew, cost=unit_cost, merges=()) -> dict:
+    """Before/after metrics, the merged steps and the reassignments, as written next to the plan file."""
+    return {
+        "before": plan_metrics(before, crew, cost),
+        "after": plan_metrics(after, crew, cost),
+        "merges": [{"step": step, "into": into} for (step, into) in merges],
+        "moves": [
+            {"step": task.step, "task": task.text, "from": source, "to": target}
+            for (task, source, target) in moves
+        ],
+    }
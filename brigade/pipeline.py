@@ -0,0 +1,798 @@
+"""
+The Kitchen Brigade pipeline shared by both scripts: the command line, RAG
+retrieval, the LangGraph workflow (retriever, recipe creator, planner,
+router, optimizer, executor, aggregator) and the judges.
+
+``Kitchen_Brigade.py`` runs ``Pipeline`` as it is. ``Kitchen_Brigade_ingredients.py``
+subclasses it and supplies its own arguments and prompt text through the
+hooks below: ``add_arguments``, ``load_inputs``, ``plan_constraints``,
+``affected_steps``, ``report_resources`` and ``resource_locks``.
+
+Retrieval state (embedder, FAISS index, corpus snapshot, lexical index and
+retrieval cache) lives in a ``Retriever``, which can be loaded once and shared,
+e.g. by the batch runner before it forks its workers.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from typing_extensions import TypedDict
+from brigade.crew import Crew
+from brigade.corpus import load_recipe_texts, load_snapshot
+from brigade.backends import BACKENDS, STORAGES, dequantize, load_delta_index, load_index_config
+from brigade.cache import LLM_CACHE_FILE, RETRIEVAL_CACHE_FILE, ResponseCache, RetrievalCache, index_fingerprint
+from brigade.context import (CANDIDATES_PER_DOC, CONTEXT_TOKENS, MMR_LAMBDA, approximate_tokens, select_context,
+                             token_counter)
+from brigade.ingest import INGEST_FILE, delta_path, file_lock, load_manifest, load_tombstones, recover_swap
+from brigade.lexical import LEXICAL_FILE, load_lexical_index
+from brigade.llm import LLMWrapper, iter_lines, tee_to_file
+from brigade.executor import run_schedule
+from brigade.incremental import (affected_steps, crew_changes, load_state, plan_from_json, replan_prompt,
+                                 reusable_docs, save_state, splice)
+from brigade.optimize import balance_plan, merge_steps, optimization_report
+from brigade.plan import PlanParser, parse_plan
+from brigade.ratelimit import JUDGING, PLANNING, shared_scheduler
+from brigade.structured_plan import generate_structured_plan
+from brigade.retrieval import RETRIEVAL_MODES, search_ids
+from brigade.trace import Tracer, annotate
+
+EMBEDDINGS_FILE = "embeddings.npy"
+INDEX_FILE = "faiss.index"
+CORPUS_FILE = "corpus.bin"
+
+
+class KitchenState(TypedDict, total=False):
+    docs: list[str]
+    command: str
+    recipe: str
+    final_recipe: str
+    plan: str
+    parsed_plan: object
+    routing: dict
+    schedule: list
+    staff: Crew
+    results: dict
+    timings: dict
+
+
+# ------------------------------------------------
+# 0. Load credentials & config from .env
+# ------------------------------------------------
+# Heavy packages (torch via sentence_transformers, faiss, langgraph and the
+# provider SDKs) are imported where they are used, so --help and runs that
+# skip retrieval don't pay for them.
+def load_env():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=".env")  # <-- loads all entries in .env into os.environ
+    print("[🔑] Loaded environment variables")
+
+
+def load_kitchen_roles(path: str) -> dict:
+    with open(path, 'r') as f:
+        kitchen_roles = json.load(f)
+
+    kitchen_roles["Nonce"] = [1,
+        (
+            "Doesn't do anything. Don't assign any tasks to this team member because "
+            "they will not get done."
+        )
+    ]
+    return kitchen_roles
+
+
+# ------------------------------------------------
+# 1. LLM Wrapper: OpenAI or watsonx
+# ------------------------------------------------
+# LLMWrapper lives in brigade/llm.py
+
+
+# ------------------------------------------------
+# 2. Prepare RAG: corpus snapshot, FAISS and lexical indexes
+# ------------------------------------------------
+class Retriever:
+    """
+    What retrieve() searches with: the embedder and FAISS index, the lexical
+    index, or both (--retrieval), plus the corpus snapshot, the stored
+    embeddings and the rows brigade.ingest tombstoned.
+    """
+    def __init__(self):
+        self.embedder = None
+        self.index = None
+        self.texts = None
+        self.embeddings = None
+        self.lexical = None
+        self.tombstones = frozenset()
+        self.cache = None
+
+    def prepare(self, args):
+        """Load (or build) the files retrieval needs with args' index and retrieval options."""
+        index_config = load_index_config(args.index_config, backend=args.index_backend, storage=args.index_storage)
+
+        if args.retrieval != "lexical":
+            try:
+                from sentence_transformers import SentenceTransformer
+                from brigade.index import EMBEDDING_MODEL, open_index
+            except ImportError as e:
+                if args.retrieval == "dense":
+                    raise
+                print(f"[♻️] Embedder unavailable ({e}); falling back to lexical retrieval")
+                args.retrieval = "lexical"
+
+        # An ingest interrupted while moving its files into place is completed first
+        recover_swap(INDEX_FILE)
+        if os.path.exists(EMBEDDINGS_FILE) and os.path.exists(INDEX_FILE):
+            # brigade.ingest doesn't swap in new index files while they are being loaded
+            with file_lock(INDEX_FILE, shared=True):
+                # Lexical retrieval needs neither the embedder nor the FAISS index
+                if args.retrieval != "lexical":
+                    print("[💾] Loading embeddings and FAISS index from disk")
+                    self.index = open_index(INDEX_FILE, EMBEDDINGS_FILE, CORPUS_FILE, index_config)
+                # Texts come from the corpus snapshot; the dataset is only reloaded if it no longer matches the
+                # index, and never over recipes added by brigade.ingest, which the dataset doesn't have
+                ingested = bool(load_manifest(INGEST_FILE)["documents"])
+                self.texts = load_snapshot(CORPUS_FILE, INDEX_FILE, None if ingested else load_recipe_texts)
+                if self.index is not None:
+                    self.index = load_delta_index(self.index, delta_path(INDEX_FILE), len(self.texts))
+                # Stored embeddings of the hits, for near-duplicate detection and MMR
+                self.embeddings = np.load(EMBEDDINGS_FILE, mmap_mode="r")
+                if args.retrieval != "dense":
+                    self.lexical = load_lexical_index(LEXICAL_FILE, self.texts, delta_path(LEXICAL_FILE))
+                self.tombstones = load_tombstones(INGEST_FILE, len(self.texts))
+
+        else:
+            # No cached index: embed the corpus in large batches across worker processes
+            from brigade.index import build_index
+
+            (self.index, self.texts) = build_index(INDEX_FILE, EMBEDDINGS_FILE, CORPUS_FILE, config=index_config)
+            self.embeddings = np.load(EMBEDDINGS_FILE, mmap_mode="r")
+            if args.retrieval != "dense":
+                self.lexical = load_lexical_index(LEXICAL_FILE, self.texts)
+
+        if args.retrieval != "lexical":
+            self.embedder = SentenceTransformer(EMBEDDING_MODEL)
+            if args.retrieval_cache.lower() != "none":
+                self.cache = RetrievalCache(
+                    EMBEDDING_MODEL, index_fingerprint(self.texts.index_digest, self.index), args.retrieval_cache
+                )
+
+    def retrieve(self, query: str, k: int = 5, max_tokens: int = None, count=approximate_tokens,
+                 lambda_: float = MMR_LAMBDA):
+        print("[🔍] Retrieving documents for query:", query)
+        return [text for (text, _) in self.select_contexts([query], k, max_tokens, count, lambda_)[0]]
+
+    def retrieve_many(self, queries: list[str], k: int = 5, max_tokens: int = None, count=approximate_tokens,
+                      lambda_: float = MMR_LAMBDA):
+        """
+        Retrieve for several queries (e.g. every dish of a menu) with one embedder
+        forward pass and one index search. Returns, per query, a list of
+        (document, score) pairs.
+        """
+        print(f"[🔍] Retrieving documents for {len(queries)} queries")
+        return self.select_contexts(queries, k, max_tokens, count, lambda_)
+
+    def select_contexts(self, queries: list[str], k: int, max_tokens: int, count, lambda_: float):
+        """
+        The context of every query: up to k of its CANDIDATES_PER_DOC * k best
+        hits, without near-duplicates, in MMR order and within max_tokens tokens
+        (brigade/context.py).
+        """
+        contexts = []
+        for hits in search_ids(self.embedder, self.index, queries, k * CANDIDATES_PER_DOC, self.cache,
+                               self.lexical, self.tombstones):
+            # The hits' stored embeddings; a memory-mapped file is read in row order
+            rows = np.array([i for (i, _) in hits], dtype=np.int64)
+            vectors = None
+            if self.embeddings is not None and len(rows):
+                order = np.argsort(rows)
+                vectors = np.empty((len(rows), self.embeddings.shape[1]), dtype=np.float32)
+                vectors[order] = dequantize(self.embeddings[rows[order]])
+            (selected, stats) = select_context([(self.texts[i], score) for (i, score) in hits], vectors, k,
+                                               max_tokens, count, lambda_)
+            print(f"  [🔍] Context: {stats['candidates']} candidates, {stats['duplicates']} near-duplicates dropped, "
+                  f"{stats['selected']} selected, {stats['tokens']} tokens"
+                  + (" (truncated)" if stats["truncated"] else ""))
+            contexts.append(selected)
+        return contexts
+
+
+class Pipeline:
+    """One script's pipeline: parse_args(), prepare_retrieval() and run() for one dish at a time."""
+    def __init__(self, name: str = "Kitchen_Brigade", retriever: Retriever = None):
+        self.name = name
+        self.retriever = retriever or Retriever()
+        self.args = None
+        self.kitchen_roles = None
+        # capture all LLM interactions
+        self.llm_log = []
+        # records node and LLM call spans when --trace is given
+        self.tracer = Tracer(enabled=False)
+        # the previous run's saved state, with --incremental
+        self.previous_run = None
+        # the available ingredients, saved with the run state
+        self.ingredients = None
+
+    # ------------------------------------------------
+    # Hooks for the scripts
+    # ------------------------------------------------
+    def add_arguments(self, parser):
+        """Add the script's own arguments, after --dish and --crew."""
+
+    def load_inputs(self):
+        """Load the script's own inputs for a run, once self.args is set."""
+
+    def plan_constraints(self) -> str:
+        """Text added to the planner prompt after the recipe."""
+        return ""
+
+    def affected_steps(self, plan, staff) -> dict:
+        """The steps of the previous run's plan that changes since then invalidate."""
+        return affected_steps(plan, staff)
+
+    def report_resources(self, plan, report: dict):
+        """Add to the optimizer's plan metrics report and print a summary."""
+
+    def resource_locks(self):
+        """Locks the executor's tasks take for the resources they use, or None."""
+        return None
+
+    # ------------------------------------------------
+    # 3. Define kitchen brigade agents
+    # ------------------------------------------------
+    def make_agents(self, llm: LLMWrapper) -> Crew:
+        """
+        Create a mapping of brigade team members to agent functions.
+        Each agent returns a string describing the action taken. Agents are
+        created on a member's first assignment, not up front.
+        """
+        def make_func(staff_member: str):
+            return lambda task: {"result": f"[{staff_member}] I have completed the task: {task}"}
+
+        return Crew(self.kitchen_roles, make_func)
+
+    # ------------------------------------------------
+    # 4. Build LangGraph workflow
+    # ------------------------------------------------
+    def build_workflow(self, llm: LLMWrapper, dish: str):
+        from langgraph.graph import StateGraph, START
+
+        args = self.args
+        llm_log = self.llm_log
+        previous_run = self.previous_run
+        graph = StateGraph(KitchenState)  # use KitchenState as state schema
+
+        def retriever(state):
+            # Multi-dish runs pre-fetch docs for every dish with retrieve_many()
+            if "docs" not in state:
+                if reusable_docs(previous_run, args) is not None:
+                    print("[♻️] Reusing the documents retrieved by the previous run")
+                    state["docs"] = previous_run["docs"]
+                else:
+                    if previous_run is not None and previous_run["docs"] is not None:
+                        print("[♻️] The context options changed since the previous run; retrieving again")
+                    state["docs"] = self.retriever.retrieve(state["command"], args.context_docs, args.context_tokens,
+                                                            token_counter(args.provider, args.model), args.mmr_lambda)
+            return state
+
+        def recipe_creator(state):
+            print("[📝] Reviewing recipe...")
+            if args.recipe:
+                print(f"  [📝] Retrieving recipe from '{args.recipe}'")
+                with open(args.recipe, "r") as f:
+                    response = f.read()
+
+            elif previous_run is not None and previous_run["recipe"] and previous_run["docs"] == state["docs"]:
+                print("  [♻️] Reusing the recipe generated by the previous run")
+                response = previous_run["recipe"]
+
+            else:
+                print(f"  [📝] Sythesizing recipe from document store")
+                docs = "\n".join(state["docs"])
+                prompt = (
+                    f"You are the Chef de cuisine tasked to prepare {dish}. Create a recipe for the dish based on these recipes:\n"
+                    f"{docs}\n\n"
+                )
+                stage = "Creating"
+                response = llm.generate(prompt)
+                llm_log.append((stage, prompt, response))
+
+                print(f"  [📝] Saving generated recipe")
+                with open(os.path.join(args.output_directory, args.generated_recipe), "w") as f:
+                    print(f"{response}", file=f)
+
+            state["recipe"] = response
+            return state
+
+        def planner(state):
+            print("[📝] Generating execution plan")
+            prompt = (
+                f"You are the Chef de cuisine tasked to prepare {dish} based on this recipe:\n\n"
+                f"{state['recipe']}\n\n"
+                f"{self.plan_constraints()}"
+                "Plan a time-step sequence of tasks to prepare the dish beginning at Time 0, denoted T0, and incrementing by one for each step until completion.\n"
+                "Within each time step list the tasks to be completed by each team member in the form 'Team member: Task' such that each of the tasks within the step can be completed independently.\n"
+                "Combine multiple tasks within a step completed by the same team member into a single task.\n"
+                "If a step only needs some of the earlier steps to be finished, name them after its time step, for example 'T4 (after T1, T2)'; "
+                "a step without them follows all the steps before it.\n"
+                f"The list below lists the roles in the team and, in brackets, the number of members in the role.\n"
+                "Team members are identified by their role name combined with a unique number within the role.\n"
+                "For example, 'Sous Chef [2]' would indicate there are two Sous Chefs in the team; 'Sous Chef 1', and 'Sous Chef 2'. Here's the list:\n\n"
+                f"{Crew(self.kitchen_roles).describe()}\n\n"
+                "No other roles or team members are available.\n"
+                "All tasks must be assigned to a specific team member.\n"
+                "Groupings such as 'All team members' are not allowed.\n"
+                "If it's unclear which role should perform a task the task can be assigned by the team member 'Nonce 1'."
+            )
+            stage = "Planning"
+
+            if previous_run is not None and previous_run["plan"] is not None and previous_run["recipe"] == state["recipe"]:
+                return replan(state, prompt)
+
+            if args.plan_format == "json":
+                # Schema-constrained plan, validated against the crew; only invalid tasks are re-prompted
+                print("  [📝] Requesting structured plan")
+                state["staff"] = self.make_agents(llm)
+                state["parsed_plan"] = generate_structured_plan(llm, prompt, state["staff"], log=llm_log)
+                response = state["parsed_plan"].render()
+
+                print("  [📝] Saving execution plan")
+                with open(os.path.join(args.output_directory, args.execution_plan), "w") as f:
+                    print(f"{response}", file=f)
+
+                state["plan"] = response
+                return state
+
+            if args.stream:
+                # Write the plan as it arrives and route each task line as soon as it is complete
+                print("  [📝] Streaming execution plan")
+                state["staff"] = self.make_agents(llm)
+                plan_parser = PlanParser(state["staff"])
+                pieces = []
+                routed = 0
+                started = time.perf_counter()
+
+                with open(os.path.join(args.output_directory, args.execution_plan), "w") as f:
+                    for line in iter_lines(tee_to_file(llm.stream(prompt, PLANNING), f)):
+                        pieces.append(line)
+                        if plan_parser.feed(line):
+                            routed += 1
+                            if routed == 1:
+                                print(f"  [🔀] First task routed after {time.perf_counter() - started:.2f}s")
+                    print(file=f)
+
+                response = "\n".join(pieces).strip()
+                state["parsed_plan"] = plan_parser.plan()
+            else:
+                response = llm.generate(prompt, PLANNING)
+
+                print("  [📝] Saving execution plan")
+                with open(os.path.join(args.output_directory, args.execution_plan), "w") as f:
+                    print(f"{response}", file=f)
+
+            llm_log.append((stage, prompt, response))
+            state["plan"] = response
+            return state
+
+        def replan(state, prompt):
+            """Keep the previous run's plan except for the steps the changed inputs affect."""
+            state["staff"] = self.make_agents(llm)
+            plan = plan_from_json(previous_run["plan"])
+            changes = crew_changes(Crew(previous_run["crew"]), state["staff"])
+            if changes:
+                print(f"  [♻️] Crew changes since the previous run: {', '.join(changes)}")
+            affected = self.affected_steps(plan, state["staff"])
+
+            if affected:
+                print(f"  [♻️] Re-planning {', '.join(f'T{step}' for step in sorted(affected))} "
+                      f"of the previous run's {len(plan.steps)} steps")
+                prompt = replan_prompt(prompt, plan, affected)
+                response = llm.generate(prompt, PLANNING)
+                llm_log.append(("Re-planning", prompt, response))
+                plan = splice(plan, parse_plan(response, state["staff"]), affected, state["staff"])
+            else:
+                print(f"  [♻️] Reusing all {len(plan.steps)} steps of the previous run's plan")
+
+            print("  [📝] Saving execution plan")
+            state["parsed_plan"] = plan
+            state["plan"] = plan.render()
+            with open(os.path.join(args.output_directory, args.execution_plan), "w") as f:
+                print(f"{state['plan']}", file=f)
+            return state
+
+        def router(state):
+            print("[🔀] Routing tasks to agents")
+            if "parsed_plan" in state:
+                # Structured and streaming plans are parsed by the planner itself
+                print("  [🔀] Tasks were routed by the planner")
+            else:
+                state["staff"] = self.make_agents(llm)
+
+                print("  [🔀] Meet the team...")
+                print(f"{os.linesep.join(f'    {members}' for members in state['staff'].roster())}")
+
+                plan_parser = PlanParser(state["staff"])
+                for line in state["plan"].split("\n"):
+                    plan_parser.feed(line)
+                state["parsed_plan"] = plan_parser.plan()
+
+            parsed_plan = state["parsed_plan"]
+            for unparsed in parsed_plan.unparsed:
+                print(f"  [⚠️] Plan line {unparsed.line} not routed ({unparsed.reason}): {unparsed.text}")
+
+            state["routing"] = parsed_plan.routing()
+            state["schedule"] = parsed_plan.schedule()
+            return state
+
+        def optimizer(state):
+            print("[⚖️] Balancing the plan across the crew")
+            before = state["parsed_plan"]
+            if args.no_balance:
+                (after, merges, moves) = (before, [], [])
+            else:
+                # Independent steps run together, then each step's tasks are spread over the qualified members
+                (merged, merges) = merge_steps(before)
+                (after, moves) = balance_plan(merged, state["staff"])
+            report = optimization_report(before, after, moves, state["staff"], merges=merges)
+            print(f"  [⚖️] Makespan {report['before']['makespan']} → {report['after']['makespan']} task units in "
+                  f"{report['before']['step_count']} → {report['after']['step_count']} steps; {len(moves)} tasks reassigned")
+            for merge in report["merges"]:
+                print(f"    T{merge['step']} runs with T{merge['into']}")
+            for move in report["moves"]:
+                print(f"    T{move['step']}: {move['from']} → {move['to']}: {move['task']}")
+
+            self.report_resources(after, report)
+
+            print("  [💾] Saving plan metrics")
+            with open(os.path.join(args.output_directory, args.plan_metrics), "w") as f:
+                json.dump(report, f, indent=2)
+
+            if merges or moves:
+                # Judges see the plan as it is executed
+                state["parsed_plan"] = after
+                state["plan"] = after.render()
+                state["routing"] = after.routing()
+                state["schedule"] = after.schedule()
+            return state
+
+        def executor(state):
+            print("[⚙️] Executing routed tasks")
+            # Steps run in order; the tasks within a step run concurrently
+            state["results"], state["timings"] = run_schedule(
+                state.get("schedule", []), state["staff"], args.executor_workers, self.resource_locks()
+            )
+            print(f"  [⚙️] {state['staff'].agents_created} of {len(state['staff'])} team members had work")
+            steps = state["timings"]["steps"]
+            annotate(steps=len(steps), tasks=len(state["timings"]["tasks"]),
+                     critical_path_seconds=sum(step["critical_path_seconds"] for step in steps),
+                     resource_wait_seconds=sum(step["resource_wait_seconds"] for step in steps))
+
+            print("  [💾] Saving execution timings")
+            with open(os.path.join(args.output_directory, args.execution_timings), "w") as f:
+                json.dump(state["timings"], f, indent=2)
+            return state
+
+        def aggregator(state):
+            print("[📦] Aggregating results into final recipe")
+            # Gather each role's output from state
+            outputs = []
+
+            for activity in state["routing"].values():
+                outputs.append(os.linesep.join(activity))
+
+            joined = "\n".join(outputs)
+            prompt = (
+                "Combine these executed subtasks into a final recipe with clear steps:\n"
+                f"{joined}"
+            )
+            stage = "Aggregation"
+
+            if args.stream:
+                print("  [📦] Streaming final recipe")
+                with open(os.path.join(args.output_directory, args.final_recipe), "w") as f:
+                    response = "".join(tee_to_file(llm.stream(prompt), f)).strip()
+                    print(file=f)
+            else:
+                response = llm.generate(prompt)
+
+                print("  [📦] Saving final recipe")
+                with open(os.path.join(args.output_directory, args.final_recipe), "w") as f:
+                    print(f"{response}", file=f)
+
+            llm_log.append((stage, prompt, response))
+            state["final_recipe"] = response
+            return state
+
+        tracer = self.tracer
+        # With a recipe file there is nothing to retrieve: the graph has no retriever node
+        if not args.recipe:
+            graph.add_node("retriever", tracer.wrap("node.retriever", retriever))
+        graph.add_node("recipe_creator", tracer.wrap("node.recipe_creator", recipe_creator))
+        graph.add_node("planner", tracer.wrap("node.planner", planner))
+        graph.add_node("router", tracer.wrap("node.router", router))
+        graph.add_node("optimizer", tracer.wrap("node.optimizer", optimizer))
+        graph.add_node("executor", tracer.wrap("node.executor", executor))
+        graph.add_node("aggregator", tracer.wrap("node.aggregator", aggregator))
+
+        if args.recipe:
+            graph.add_edge(START, "recipe_creator")
+        else:
+            graph.add_edge(START, "retriever")
+            graph.add_edge("retriever", "recipe_creator")
+        graph.add_edge("recipe_creator", "planner")
+        graph.add_edge("planner", "router")
+        graph.add_edge("router", "optimizer")
+        graph.add_edge("optimizer", "executor")
+        graph.add_edge("executor", "aggregator")
+        return graph
+
+    # ------------------------------------------------
+    # 5. Main entrypoint
+    # ------------------------------------------------
+    def parse_args(self, argv=None):
+        parser = argparse.ArgumentParser(self.name)
+        parser.add_argument("--dish", "-d",
+                            required=True,
+                            help="The name of the dish to prepare. Used to create a recipe if none is provided.")
+        parser.add_argument("--crew", "-c",
+                            required=True,
+                            help="File defining the available roles and number of team members in each role.")
+        self.add_arguments(parser)
+        parser.add_argument("--recipe", "-r",
+                            required=False,
+                            help="Text file containing the recipe to prepare. Will be generated via RAG if not supplied.")
+        parser.add_argument("--provider", "-p",
+                            default="openai",
+                            help="Name of the planning and judging model provider. One of: openai (default), watsonx, or mock (replays recorded responses offline)")
+        parser.add_argument("--model", "-m",
+                            default="gpt-4o",
+                            help="Name of the model to use of planning and judging. Defaults to 'gpt-4o'")
+        parser.add_argument("--plan-format",
+                            choices=["text", "json"],
+                            default="text",
+                            help="text asks the planner for a free-text plan (default); json asks for a schema-constrained JSON plan, "
+                                 "validated against the crew, re-prompting only for invalid tasks.")
+        parser.add_argument("--stream",
+                            action="store_true",
+                            help="Stream the plan and final recipe: output files are written as tokens arrive and plan tasks are routed as soon as each line is complete.")
+        parser.add_argument("--executor-workers",
+                            type=int,
+                            default=8,
+                            help="Maximum number of team members working at the same time within a plan step. Default: 8")
+        parser.add_argument("--index-backend", "-b",
+                            choices=BACKENDS,
+                            default=None,
+                            help="FAISS index backend for recipe retrieval. One of: flat, ivf-flat, ivf-pq or hnsw. "
+                                 "Changing it rebuilds the index from the saved embeddings. Defaults to the index on disk, or flat")
+        parser.add_argument("--index-storage",
+                            choices=STORAGES,
+                            default=None,
+                            help="Storage of the embeddings and indexed vectors: float32, float16 or int8. Changing it "
+                                 "converts embeddings.npy and rebuilds the index. Defaults to the files on disk, or float32")
+        parser.add_argument("--index-config",
+                            required=False,
+                            help="JSON file with the index backend and its build and search parameters.")
+        parser.add_argument("--retrieval",
+                            choices=RETRIEVAL_MODES,
+                            default="hybrid",
+                            help="hybrid fuses dense (embedding) and lexical (BM25) search (default); dense and lexical "
+                                 "use one of them. Lexical needs neither the embedder nor the FAISS index, and hybrid "
+                                 "falls back to it when the embedder can't be loaded.")
+        parser.add_argument("--context-docs",
+                            type=int,
+                            default=5,
+                            help="Most recipes retrieved into the prompt. Default: 5")
+        parser.add_argument("--context-tokens",
+                            type=int,
+                            default=CONTEXT_TOKENS,
+                            help="Token budget of the retrieved recipes in the recipe prompt, counted with the "
+                                 f"model's tokenizer where one is available. Default: {CONTEXT_TOKENS}")
+        parser.add_argument("--mmr-lambda",
+                            type=float,
+                            default=MMR_LAMBDA,
+                            help="Relevance versus diversity of the retrieved recipes, from 0 (most diverse) to 1 "
+                                 f"(most relevant). Default: {MMR_LAMBDA}")
+        parser.add_argument("--retrieval-cache",
+                            default=RETRIEVAL_CACHE_FILE,
+                            help="SQLite file caching query embeddings and retrieval results (dense and, with hybrid retrieval, "
+                                 f"fused), or 'none' to disable. Default: {RETRIEVAL_CACHE_FILE}")
+        parser.add_argument("--llm-cache",
+                            required=False,
+                            help=f"SQLite file caching LLM responses by provider, model, prompt and parameters, e.g. {LLM_CACHE_FILE}. Disabled by default")
+        parser.add_argument("--llm-cache-mode",
+                            choices=ResponseCache.MODES,
+                            default="read-write",
+                            help="read-write records new responses; replay only serves recorded ones and fails on anything else, "
+                                 "without contacting the provider. Default: read-write")
+        parser.add_argument("--llm-cache-max-mb",
+                            type=int,
+                            default=512,
+                            help="Size limit of the LLM response cache; least recently used responses are evicted first. Default: 512")
+        parser.add_argument("--llm-rpm",
+                            type=float,
+                            default=None,
+                            help="Requests per minute the LLM provider allows; requests wait for admission beyond it. "
+                                 "The budget is this process's own: separate runs against the same account each need "
+                                 "a share of it (brigade.batch splits it between its workers). Default: no limit")
+        parser.add_argument("--llm-tpm",
+                            type=float,
+                            default=None,
+                            help="Tokens (prompt and completion) per minute the LLM provider allows, for this process "
+                                 "like --llm-rpm. Default: no limit")
+        parser.add_argument("--llm-retries",
+                            type=int,
+                            default=5,
+                            help="Retries of an LLM request that is rate limited, times out or fails with a server error, "
+                                 "with jittered exponential backoff. Default: 5")
+        parser.add_argument("--llm-timeout",
+                            type=float,
+                            default=120,
+                            help="Timeout of an OpenAI request in seconds. Default: 120")
+        parser.add_argument("--incremental",
+                            action="store_true",
+                            help="Reuse the previous run in the output directory: its retrieved documents and recipe "
+                                 "for the same dish and context options, and its plan for the same recipe, re-planning only the steps "
+                                 "affected by changes to the crew or ingredients.")
+        parser.add_argument("--no-balance",
+                            action="store_true",
+                            help="Execute the plan as the planner assigned it, without merging independent steps or "
+                                 "moving tasks from overloaded team members to idle qualified ones. Plan metrics are "
+                                 "still written.")
+        parser.add_argument("--trace",
+                            action="store_true",
+                            help="Record wall time, CPU time, peak RSS and token counts for every workflow node and LLM call; "
+                                 "writes a JSON trace and an OpenTelemetry (OTLP/JSON) span file and prints a summary table.")
+        parser.add_argument("--cache-stats",
+                            required=False,
+                            help="Write the retrieval cache hit/miss counters to this JSON file.")
+        group = parser.add_argument_group("Output files")
+        group.add_argument("--output-directory", '-o',
+                           default=".",
+                           help="Path to directory for output files.")
+        group.add_argument("--generated-recipe", "--gr",
+                           default="generated-recipe.txt",
+                           help="Output file for the recipe generated by RAG if no --recipe is provided. Default: generated-recipe.txt")
+        group.add_argument("--final-recipe", "--fr",
+                           default="final-recipe.txt",
+                           help="Output file for the final recipe after planning. Default: final-recipe.txt")
+        group.add_argument("--execution-plan", "--ep",
+                           default="execution-plan.txt",
+                           help="Output file for the generated preparation plan. Default: execution-plan.txt")
+        group.add_argument("--plan-feedback", "--pf",
+                           default="plan-feedback.txt",
+                           help="File for the output of the Planning Judge. Default: plan-feedback.txt")
+        group.add_argument("--execution-feedback", "--ef",
+                           default="execution-feedback.txt",
+                           help="File for the output of the Execution Judge. Default: execution-feedback.txt")
+        group.add_argument("--plan-metrics",
+                           default="plan-metrics.json",
+                           help="Makespan, critical path and utilization of the plan before and after balancing, "
+                                "and the tasks reassigned. Default: plan-metrics.json")
+        group.add_argument("--execution-timings",
+                           default="execution-timings.json",
+                           help="Wall time of every executed task and, per step, its wall time and critical path. "
+                                "Default: execution-timings.json")
+        group.add_argument("--run-state",
+                           default="run-state.json",
+                           help="Inputs and results of the run, which --incremental reuses. Default: run-state.json")
+        group.add_argument("--trace-file",
+                           default="trace.json",
+                           help="JSON trace of the run's spans and their summary, with --trace. Default: trace.json")
+        group.add_argument("--trace-spans",
+                           default="trace-spans.json",
+                           help="The run's spans in OTLP/JSON, for OpenTelemetry tools, with --trace. Default: trace-spans.json")
+        return parser.parse_args(argv)
+
+    def prepare_retrieval(self, args):
+        self.retriever.prepare(args)
+
+    def run(self, args, docs=None):
+        """
+        Run the brigade for one dish and write its output files. docs, if given,
+        are the retrieved recipes for the dish, e.g. pre-fetched with retrieve_many().
+        """
+        self.args = args
+        self.llm_log.clear()
+        load_env()
+
+        # Load the kitchen brigade, i.e. the team roles and the number of each role
+        self.kitchen_roles = load_kitchen_roles(args.crew)
+        self.load_inputs()
+
+        llm_cache = None
+        if args.llm_cache:
+            llm_cache = ResponseCache(args.llm_cache, args.llm_cache_mode, args.llm_cache_max_mb * 2**20)
+        tracer = self.tracer = Tracer(enabled=args.trace)
+        # One scheduler per provider for the whole process, so concurrent runs share the budgets
+        scheduler = shared_scheduler(args.provider, args.llm_rpm, args.llm_tpm, args.llm_retries)
+        llm = LLMWrapper(args.provider, args.model, llm_cache, tracer, scheduler, args.llm_timeout)
+
+        state_path = os.path.join(args.output_directory, args.run_state)
+        self.previous_run = load_state(state_path, args) if args.incremental else None
+        if args.incremental and self.previous_run is None:
+            print(f"[♻️] No state of a previous run for this dish and model in '{state_path}'; running everything")
+
+        workflow = self.build_workflow(llm, args.dish)
+        initial_state = {"command": args.dish}
+        if docs is not None:
+            initial_state["docs"] = docs
+        with tracer.span("workflow", dish=args.dish):
+            final_state = workflow.compile().invoke(initial_state)
+        print("  [💾] Saving run state")
+        save_state(state_path, args, self.kitchen_roles, final_state, self.ingredients)
+        # Gather execution outputs from all agent keys
+
+        final_recipe = final_state.get("final_recipe", "")
+        print("\n=== Final Recipe ===\n")
+        print(final_recipe)
+
+        plan_text = final_state.get("plan", "")
+        print("=== Plan ===\n")
+        print(plan_text)
+
+        execution_results = [ v for v in final_state["results"].values() ]
+        print("\n=== Execution Results ===\n")
+        print("\n".join(execution_results))
+
+        # Judges Evaluation
+        planning_prompt = (
+            "As the Planning Judge, evaluate the quality of the routing/assignment of subtasks to specific kitchen roles. "
+            "Discuss if each assignment makes sense given the role's responsibilities.\n\n"
+            f"Plan Provided:\n{plan_text}"
+        )
+        exec_prompt = (
+            "As the Execution Judge, evaluate the quality of execution of the subtasks and the final recipe. "
+            "Focus on efficiency (minimal number of steps) and effectiveness (completion and correctness).\n\n"
+            f"Subtasks Results:\n{chr(10).join(execution_results)}\n\n"
+            f"Final Recipe:\n{final_recipe}"
+        )
+
+        # The judges don't depend on each other, so both requests are in flight at once
+        print("[👩‍⚖️] Planning Judge Evaluation")
+        print("[👨‍⚖️] Execution Judge Evaluation")
+        with tracer.span("judges"):
+            planning_feedback, execution_feedback = llm.generate_concurrently([planning_prompt, exec_prompt], JUDGING)
+        self.llm_log.append(("Planning Judge", planning_prompt, planning_feedback))
+        self.llm_log.append(("Execution Judge", exec_prompt, execution_feedback))
+
+        print("  [👩‍⚖️] Saving planning evaluation")
+        with open(os.path.join(args.output_directory, args.plan_feedback), "w") as f:
+            print(f"{planning_feedback}", file=f)
+
+        print("  [👩‍⚖️] Saving execution evaluation")
+        with open(os.path.join(args.output_directory, args.execution_feedback), "w") as f:
+            print(f"{execution_feedback}", file=f)
+
+        print("\n=== Judge Results ===\n")
+        print("-- Planning Judge --\n", planning_feedback)
+        print("\n-- Execution Judge --\n", execution_feedback)
+
+        retrieval_cache = self.retriever.cache
+        if retrieval_cache is not None:
+            print(f"\n[🗄️] Retrieval cache: {json.dumps(retrieval_cache.stats())}")
+            if args.cache_stats:
+                retrieval_cache.export_stats(args.cache_stats)
+
+        if llm_cache is not None:
+            print(f"[🗄️] LLM response cache: {json.dumps(llm_cache.stats())}")
+        print(f"[🚦] LLM request scheduler: {json.dumps(scheduler.stats())}")
+        llm.close()
+
+        if args.trace:
+            print("  [⏱️] Saving trace")
+            tracer.export_json(os.path.join(args.output_directory, args.trace_file))
+            tracer.export_otlp(os.path.join(args.output_directory, args.trace_spans))
+
+            print("\n=== Trace Summary ===\n")
+            tracer.print_summary()
+
+    def main(self, argv=None):
+        args = self.parse_args(argv)
+
+        print(f"Invocation command line: {' '.join(sys.argv)}")
+
+        # The embedder, index and corpus are only needed to synthesize a recipe
+        previous = load_state(os.path.join(args.output_directory, args.run_state), args) if args.incremental else None
+        if not args.recipe and reusable_docs(previous, args) is None:
+            self.prepare_retrieval(args)
+        self.run(args)
@@ -0,0 +1,206 @@
+"""
+Execution plan parsing.
+
+The planner answers in loosely formatted markdown: ``T<n>`` step headers
+followed by 'Team member: Task' lines, with whatever bullets and emphasis
+the model felt like using. ``PlanParser`` turns that into a ``Plan``: a DAG
+of ``Step`` records, each holding its ``Task`` records and the steps it
+depends on. Lines that look like content but cannot be turned into a task
+are kept in ``Plan.unparsed`` with the reason, instead of being dropped.
+
+A step depends on the step before it, unless its header names the earlier
+steps it needs finished: 'T4 (after T1, T2): Make the sauce'. Those
+dependencies let the optimizer run independent steps together
+(brigade/optimize.py).
+
+The parser consumes one line at a time, so a plan can be parsed while it is
+still being generated.
+"""
+import collections
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+# 'T0', '**T1: Season and Prep Chicken**', '### T2 - Prepare Vegetables', '**Time 3 (T3):**', ...
+STEP_HEADER = re.compile(
+    r"^[\s#*_>-]*(?:T(\d+)\b|(?:Time|Step)\s+(\d+)\b(?:\s*\(T\d+\))?)[\s*_:.)-]*(.*?)[\s*_]*$"
+)
+# '(after T1, T2)', '(after T1 and T3)' at the start of a step title
+AFTER = re.compile(r"^\(\s*after\s+(T?\d+(?:\s*(?:,|and|&)\s*T?\d+)*)\s*\)[\s*_:.-]*", re.IGNORECASE)
+# '- ', '* ', '• ', '+ ', '1. ', '2) '
+BULLET = re.compile(r"^\s*(?:[-*•+]|\d+[.)])\s+")
+EMPHASIS = re.compile(r"[*_`]+")
+
+
+class Task(NamedTuple):
+    step: int
+    member: str
+    text: str
+    line: int
+
+
+class Unparsed(NamedTuple):
+    line: int
+    text: str
+    reason: str
+
+
+@dataclass(slots=True)
+class Step:
+    number: int
+    title: str = ""
+    tasks: list = field(default_factory=list)
+    depends_on: tuple = ()
+
+    @property
+    def members(self) -> list[str]:
+        """Team members with work in this step, in order of first appearance."""
+        return list(dict.fromkeys(task.member for task in self.tasks))
+
+
+@dataclass(slots=True)
+class Plan:
+    steps: list = field(default_factory=list)
+    unparsed: list = field(default_factory=list)
+
+    def tasks(self):
+        for step in self.steps:
+            yield from step.tasks
+
+    def routing(self) -> dict:
+        """Each team member's tasks in plan order."""
+        routing = collections.defaultdict(list)
+        for task in self.tasks():
+            routing[task.member].append(task.text)
+        return routing
+
+    def schedule(self) -> list:
+        """[(step, [(team member, task), ...]), ...] in step order."""
+        return [(step.number, [(task.member, task.text) for task in step.tasks]) for step in self.steps]
+
+    def render(self) -> str:
+        """The plan as plain 'T<n>' / '- Team member: Task' text."""
+        lines = []
+        for (previous, step) in zip([None] + self.steps, self.steps):
+            after = ""
+            if step.depends_on and step.depends_on != (previous.number if previous else None,):
+                after = f" (after {', '.join(f'T{number}' for number in step.depends_on)})"
+            lines.append(f"T{step.number}{after}: {step.title}".rstrip(": "))
+            lines.extend(f"- {task.member}: {task.text}" for task in step.tasks)
+        return "\n".join(lines)
+
+
+def step_header(line: str):
+    """
+    The (step number, title, steps it is after) if line is a 'T<n>' step
+    header, else None. The steps it is after are () unless the header names
+    them.
+    """
+    match = STEP_HEADER.match(line)
+    if not match:
+        return None
+    title = match.group(3).strip()
+    after = AFTER.match(title)
+    if after is None:
+        return (int(match.group(1) or match.group(2)), title, ())
+    return (int(match.group(1) or match.group(2)), title[after.end():].strip(),
+            tuple(int(number) for number in re.findall(r"\d+", after.group(1))))
+
+
+class PlanParser:
+    """
+    Incremental plan parser. Feed it lines, then call plan(). Only members
+    in staff are accepted as assignees, except that a bare role name stands
+    for the role's only member ('Sous Chef' for 'Sous Chef 1'). Tasks before
+    the first step header belong to step 0. A brigade.crew.Crew resolves
+    names itself; for any other staff the aliases are collected up front.
+    """
+    def __init__(self, staff):
+        self.staff = staff
+        self.aliases = None
+        if not hasattr(staff, "resolve"):
+            roles = collections.defaultdict(list)
+            for member in staff:
+                roles[member.rsplit(" ", 1)[0]].append(member)
+            self.aliases = {role: members[0] for (role, members) in roles.items() if len(members) == 1}
+        self._steps = {}
+        self._after = {}  # step number -> the earlier steps its header names
+        self._step = None
+        self._line = 0
+        self.unparsed = []
+
+    def _current_step(self) -> Step:
+        if self._step is None:
+            self._step = self._steps.setdefault(0, Step(0))
+        return self._step
+
+    def feed(self, line: str):
+        """Parse one line; returns the Task it produced, or None."""
+        self._line += 1
+        stripped = line.strip()
+        if not stripped or set(stripped) <= set("-*_=#"):
+            return None
+
+        header = step_header(stripped)
+        if header is not None:
+            (number, title, after) = header
+            self._step = self._steps.setdefault(number, Step(number))
+            self._step.title = self._step.title or title
+            if after:
+                self._after.setdefault(number, after)
+            return None
+
+        bulleted = BULLET.match(stripped)
+        content = stripped[bulleted.end():] if bulleted else stripped
+        (assignee, colon, text) = content.partition(":")
+        member = EMPHASIS.sub("", assignee).strip()
+        if self.aliases is None:
+            member = self.staff.resolve(member) or member
+        else:
+            member = self.aliases.get(member, member)
+        text = EMPHASIS.sub("", text).strip()
+
+        if colon and member in self.staff:
+            task = Task(self._current_step().number, sys.intern(member), text, self._line)
+            self._current_step().tasks.append(task)
+            return task
+
+        # Prose before the first step (the model's preamble) is not a plan line
+        if self._step is None and not bulleted:
+            return None
+
+        if not colon:
+            reason = "no 'Team member: Task' separator"
+        else:
+            reason = f"unknown team member '{member}'"
+        self.unparsed.append(Unparsed(self._line, stripped, reason))
+        return None
+
+    def plan(self) -> Plan:
+        """
+        The plan parsed so far, with each step depending on the earlier steps
+        its header names, or else on the one before it.
+        """
+        steps = [step for (_, step) in sorted(self._steps.items()) if step.tasks]
+        return Plan(link_steps(steps, self._after), list(self.unparsed))
+
+
+def link_steps(steps: list, after: dict = None) -> list:
+    """
+    Set the depends_on of steps (in order): the earlier steps after[number]
+    names, where it names any that are in steps, or else the step before.
+    """
+    seen = set()
+    for (previous, step) in zip([None] + steps, steps):
+        named = tuple(number for number in (after or {}).get(step.number, ()) if number in seen)
+        step.depends_on = named or ((previous.number,) if previous else ())
+        seen.add(step.number)
+    return steps
+
+
+def parse_plan(text: str, staff) -> Plan:
+    parser = PlanParser(staff)
+    for line in text.split("\n"):
+        parser.feed(line)
+    return parser.plan()
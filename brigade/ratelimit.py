@@ -0,0 +1,278 @@
+"""
+Rate-limit-aware scheduling of LLM requests.
+
+Every request an ``LLMWrapper`` sends to a provider goes through a
+``RequestScheduler``, which one process shares between all wrappers of the
+same provider (``shared_scheduler``):
+
+- Budgets: at most ``rpm`` requests and ``tpm`` tokens are admitted in any
+  60 second window. A request reserves its estimated tokens (prompt
+  characters / 4 plus the completion limit) when it is admitted; the
+  reservation is corrected to the token counts the provider reports.
+- Priority: waiting requests are admitted lowest priority number first, in
+  arrival order within a priority, so the planner (``PLANNING``) goes ahead
+  of recipe and aggregation requests (``DEFAULT``), and those go ahead of
+  the judges (``JUDGING``).
+- Retries: requests failing with a rate limit (429), timeout, conflict or
+  server error (5xx) are retried up to ``max_retries`` times, after a
+  jittered exponential backoff ("full jitter": a uniformly random delay up to
+  backoff * 2^attempt, capped at max_backoff) or the provider's Retry-After,
+  whichever is longer. A retry queues for admission again.
+
+``stats`` reports requests, retries, the current and peak queue depth and the
+time requests spent waiting for admission.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+
+from brigade.trace import annotate
+
+# Priorities: lower numbers are admitted first
+PLANNING = 0
+DEFAULT = 1
+JUDGING = 2
+
+WINDOW_SECONDS = 60.0
+# Completion tokens reserved for a request without max_tokens / max_new_tokens
+COMPLETION_TOKENS = 1024
+RETRYABLE_STATUS = (408, 409, 429)
+RETRYABLE_ERRORS = ("APITimeoutError", "APIConnectionError", "InternalServerError", "RateLimitError",
+                    "Timeout", "ConnectTimeout", "ReadTimeout")
+
+# Token counts reported by the provider for the request running in this context
+_usage = contextvars.ContextVar("brigade_llm_usage", default=None)
+
+
+def record_usage(prompt_tokens=None, completion_tokens=None):
+    """Record a provider's token counts on the current span and on the request's reservation."""
+    annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    holder = _usage.get()
+    if holder is not None and prompt_tokens is not None:
+        holder.append(prompt_tokens + (completion_tokens or 0))
+
+
+def estimate_tokens(prompt: str, params: dict) -> int:
+    """Tokens to reserve for a request: about 4 characters per prompt token, plus the completion limit."""
+    completion = params.get("max_tokens") or params.get("max_completion_tokens") or params.get("max_new_tokens")
+    return len(prompt) // 4 + (completion or COMPLETION_TOKENS)
+
+
+def status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether error is transient: rate limited, timed out or a server error."""
+    status = status_code(error)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in RETRYABLE_ERRORS
+
+
+def retry_after(error: Exception):
+    """Seconds the provider asked to wait (Retry-After header), or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    def __init__(self, rpm: float = None, tpm: float = None, max_retries: int = 5,
+                 backoff: float = 1.0, max_backoff: float = 60.0):
+        """rpm and tpm of None or 0 mean no limit."""
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._condition = threading.Condition()
+        self._queue = []  # heap of (priority, arrival)
+        self._arrivals = itertools.count()
+        self._admitted = deque()  # [admission time, tokens] of the requests in the window
+        self._random = random.Random()
+        self._stats = {"requests": 0, "retries": 0, "failures": 0, "queue_depth": 0, "max_queue_depth": 0,
+                       "throttled": 0, "throttle_wait_seconds": 0.0, "max_throttle_wait_seconds": 0.0,
+                       "backoff_seconds": 0.0}
+
+    # ------------------------------------------------
+    # Admission
+    # ------------------------------------------------
+    def _delay(self, tokens: int, now: float) -> float:
+        """Seconds until a request of tokens fits both budgets; 0 if it fits now."""
+        while self._admitted and self._admitted[0][0] <= now - WINDOW_SECONDS:
+            self._admitted.popleft()
+        delay = 0.0
+        if self.rpm and len(self._admitted) >= self.rpm:
+            # The admission that has to leave the window before the count is below rpm
+            delay = self._admitted[int(len(self._admitted) - self.rpm)][0] + WINDOW_SECONDS - now
+        if self.tpm:
+            excess = sum(used for (_, used) in self._admitted) + tokens - self.tpm
+            # A request larger than the whole budget is admitted once the window is empty
+            for (admitted, used) in self._admitted:
+                if excess <= 0:
+                    break
+                excess -= used
+                delay = max(delay, admitted + WINDOW_SECONDS - now)
+        return max(delay, 0.0)
+
+    def acquire(self, tokens: int, priority: int = DEFAULT) -> list:
+        """Wait until the request is first in line and fits the budgets; returns its reservation."""
+        started = time.perf_counter()
+        with self._condition:
+            entry = (priority, next(self._arrivals))
+            heapq.heappush(self._queue, entry)
+            self._stats["queue_depth"] = len(self._queue)
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._queue))
+            while True:
+                if self._queue[0] == entry:
+                    delay = self._delay(tokens, time.monotonic())
+                    if delay == 0:
+                        break
+                    self._condition.wait(delay)
+                else:
+                    self._condition.wait()
+            heapq.heappop(self._queue)
+            reservation = [time.monotonic(), tokens]
+            self._admitted.append(reservation)
+
+            waited = time.perf_counter() - started
+            self._stats["requests"] += 1
+            self._stats["queue_depth"] = len(self._queue)
+            if waited >= 0.001:
+                self._stats["throttled"] += 1
+            self._stats["throttle_wait_seconds"] += waited
+            self._stats["max_throttle_wait_seconds"] = max(self._stats["max_throttle_wait_seconds"], waited)
+            self._condition.notify_all()
+        annotate(queued_seconds=waited)
+        return reservation
+
+    def settle(self, reservation: list, tokens: int):
+        """Replace a reservation's estimate with the tokens actually used."""
+        with self._condition:
+            reservation[1] = tokens
+            self._condition.notify_all()
+
+    # ------------------------------------------------
+    # Requests with retries
+    # ------------------------------------------------
+    def backoff_delay(self, attempt: int, error: Exception) -> float:
+        delay = self._random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        return max(delay, retry_after(error) or 0.0)
+
+    def _failed(self, attempt: int, error: Exception):
+        """The backoff before retrying after error, or None to give up."""
+        with self._condition:
+            if not is_retryable(error) or attempt >= self.max_retries:
+                self._stats["failures"] += 1
+                return None
+            delay = self.backoff_delay(attempt, error)
+            self._stats["retries"] += 1
+            self._stats["backoff_seconds"] += delay
+        annotate(retries=attempt + 1)
+        print(f"  [🚦] LLM request failed ({type(error).__name__}: {status_code(error) or error}); "
+              f"retry {attempt + 1} of {self.max_retries} in {delay:.1f}s")
+        return delay
+
+    def run(self, call, tokens: int, priority: int = DEFAULT):
+        """call() once admitted, retried while it fails transiently."""
+        for attempt in itertools.count():
+            reservation = self.acquire(tokens, priority)
+            holder = []
+            token = _usage.set(holder)
+            try:
+                return call()
+            except Exception as error:
+                delay = self._failed(attempt, error)
+                if delay is None:
+                    raise
+            finally:
+                _usage.reset(token)
+                if holder:
+                    self.settle(reservation, holder[-1])
+            time.sleep(delay)
+
+    async def arun(self, call, tokens: int, priority: int = DEFAULT):
+        """Async run(): awaits call() once admitted, waiting for admission on a worker thread."""
+        for attempt in itertools.count():
+            reservation = await asyncio.to_thread(self.acquire, tokens, priority)
+            holder = []
+            token = _usage.set(holder)
+            try:
+                return await call()
+            except Exception as error:
+                delay = self._failed(attempt, error)
+                if delay is None:
+                    raise
+            finally:
+                _usage.reset(token)
+                if holder:
+                    self.settle(reservation, holder[-1])
+            await asyncio.sleep(delay)
+
+    def stream(self, start, tokens: int, priority: int = DEFAULT):
+        """
+        Yield the pieces of the stream start() opens, once admitted. Only
+        opening it (start() and its first piece) is retried; the reservation is
+        settled with the token counts the stream reports once it finishes.
+        """
+        for attempt in itertools.count():
+            reservation = self.acquire(tokens, priority)
+            holder = []
+            token = _usage.set(holder)
+            try:
+                stream = start()
+                first = next(stream, None)
+                break
+            except Exception as error:
+                if holder:
+                    self.settle(reservation, holder[-1])
+                delay = self._failed(attempt, error)
+                if delay is None:
+                    raise
+            finally:
+                _usage.reset(token)
+            time.sleep(delay)
+
+        try:
+            piece = first
+            while piece is not None:
+                yield piece
+                # Advance the stream with the reservation's usage holder, like run() does for its call
+                token = _usage.set(holder)
+                try:
+                    piece = next(stream, None)
+                finally:
+                    _usage.reset(token)
+        finally:
+            if holder:
+                self.settle(reservation, holder[-1])
+
+    def stats(self) -> dict:
+        with self._condition:
+            return dict(self._stats, rpm=self.rpm, tpm=self.tpm)
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler(provider: str, rpm: float = None, tpm: float = None, max_retries: int = 5) -> RequestScheduler:
+    """The process-wide scheduler of provider, created on first use; later calls update its budgets."""
+    with _shared_lock:
+        scheduler = _shared.get(provider)
+        if scheduler is None:
+            scheduler = _shared[provider] = RequestScheduler(rpm, tpm, max_retries)
+        else:
+            (scheduler.rpm, scheduler.tpm, scheduler.max_retries) = (rpm, tpm, max_retries)
+        return scheduler
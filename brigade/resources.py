@@ -0,0 +1,330 @@
+"""
+Ingredient and utensil inventory, and resource contention between tasks.
+
+An ingredients file lists what the kitchen has, as markdown bullets under
+'Ingredients' and 'Utensils' (or 'Equipment') headers:
+
+    #### Utensils:
+    - 3 paring knives
+    - 1 9x13-inch roasting pan
+    - Cutting board
+
+``parse_inventory`` turns it into counted resources. A leading whole number
+is the count ('3 paring knives'); quantities of measure ('1/4 cup red wine',
+'1 1/2 cup chicken stock') and items without a number count as one. A count
+of 0 is an error; remove the line instead. Each resource is known by a key,
+its name without the count, sizes and descriptive words and with the words
+singularized ('paring knife', 'roasting pan'). 'Basting brush or spoon' and
+'Salt and pepper' list two resources. Resources with the same key are
+pooled.
+
+A task uses a resource if its text names it, longest names first, so 'the
+chicken stock' uses the stock but not the chicken. A task naming only the
+last word of a key ('a knife', 'the pan') uses the largest pool of that
+kind. ``resource_index`` maps each resource to the tasks of a plan that use
+it.
+
+Only utensils are held while a task runs: two tasks can't share the one
+roasting pan at the same time, but seasoning the chicken doesn't stop anyone
+else from searing it. ``ResourceLocks`` holds a counted semaphore per utensil;
+the executor acquires the utensils of a task before running it, so only tasks
+that compete for the same utensils wait for each other and everything else in
+a step still runs in parallel. ``contention_report`` estimates what the
+limits cost: the makespan and parallelism (task units per unit of makespan)
+of the plan with and without them, step by step and per utensil.
+
+Ingredients are checked by quantity when the plan is made instead.
+``ingredient_check`` adds up the counts the tasks name ('Sear 4 chicken
+breasts') for every counted ingredient and reports those the plan needs more
+of than the kitchen has.
+"""
+import collections
+import heapq
+import re
+import threading
+import time
+from typing import NamedTuple
+
+from brigade.optimize import unit_cost
+from brigade.plan import Plan, Step
+
+SECTION = re.compile(r"^[\s#*_]*(ingredients|utensils|equipment)\b", re.IGNORECASE)
+KINDS = {"ingredients": "ingredient", "utensils": "utensil", "equipment": "utensil"}
+# Kinds held while a task runs; the rest are checked by quantity at plan time
+LOCKED_KINDS = {"utensil"}
+ITEM = re.compile(r"^\s*(?:[-*•+]|\d+[.)])\s+(.+?)\s*$")
+WORD = re.compile(r"[a-z]+(?:'s)?")
+TOKEN = re.compile(r"\d+(?:/\d+)?|[a-z]+(?:'s)?")
+# '3 paring knives' is a count; '1/4 cup', '1 1/2 cup', '2 tbsp' are measures
+COUNT = re.compile(r"^(\d+)\s+(?!\d|\S*/)(.+)$")
+MEASURES = {
+    "cup", "cups", "tbsp", "tsp", "tablespoon", "tablespoons", "teaspoon", "teaspoons", "oz", "ounce", "ounces",
+    "lb", "lbs", "pound", "pounds", "g", "gram", "grams", "kg", "ml", "l", "liter", "liters", "pinch", "dash",
+}
+DESCRIPTORS = {
+    "a", "an", "the", "of", "whole", "large", "small", "medium", "fresh", "big", "inch", "quart", "gallon",
+    "with", "capacity", "blade",
+}
+
+
+def singular(word: str) -> str:
+    if word.endswith("'s"):
+        word = word[:-2]
+    if word.endswith("ives"):
+        return word[:-3] + "fe"
+    if word.endswith(("oes", "shes", "ches", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def words(text: str) -> list[str]:
+    return [singular(word) for word in WORD.findall(text.lower())]
+
+
+class Resource(NamedTuple):
+    key: str
+    kind: str
+    count: int
+    name: str
+    counted: bool = False   # the count was given ('3 paring knives'), not a measure or implied
+
+
+def parse_item(text: str, kind: str) -> list[Resource]:
+    """The resources one inventory line lists."""
+    count = 1
+    counted = False
+    match = COUNT.match(text)
+    if match and match.group(2).split()[0].lower() not in MEASURES:
+        count = int(match.group(1))
+        counted = True
+        if count < 1:
+            # A pool of none would leave every task that uses it waiting forever
+            raise ValueError(f"Inventory item '{text}' has a count of {count}; list only what the kitchen has")
+    resources = []
+    for alternative in re.split(r"\s+(?:or|and)\s+|\s*,\s*", text):
+        # Sizes and quantities ('9x13-inch', '1/4') and descriptive words don't name the resource
+        key = " ".join(
+            word for word in words(re.sub(r"\S*\d\S*", " ", alternative))
+            if word not in DESCRIPTORS and word not in MEASURES
+        )
+        if key:
+            resources.append(Resource(key, kind, count, text, counted))
+    return resources
+
+
+def parse_inventory(text: str) -> "Inventory":
+    """The counted resources of an ingredients file."""
+    kind = "resource"
+    resources = []
+    for line in text.split("\n"):
+        section = SECTION.match(line)
+        if section:
+            kind = KINDS[section.group(1).lower()]
+            continue
+        item = ITEM.match(line)
+        if item:
+            resources.extend(parse_item(item.group(1), kind))
+    return Inventory(resources)
+
+
+class Inventory:
+    """Resource pools ({key: count}) and the lookup of the pools a task uses."""
+    def __init__(self, resources: list[Resource]):
+        self.resources = resources
+        self.capacity = collections.Counter()
+        self.kinds = {}
+        self.counted = set()
+        for resource in resources:
+            self.capacity[resource.key] += resource.count
+            self.kinds.setdefault(resource.key, resource.kind)
+            if resource.counted:
+                self.counted.add(resource.key)
+        self._keys = sorted(self.capacity, key=lambda key: -len(key.split()))
+        # Last word of the key -> pools of that kind, largest first
+        self._by_head = collections.defaultdict(list)
+        for key in sorted(self.capacity, key=lambda key: -self.capacity[key]):
+            self._by_head[key.split()[-1]].append(key)
+        self._uses = {}
+
+    def __len__(self) -> int:
+        return len(self.capacity)
+
+    def uses(self, task: str) -> tuple:
+        """Keys of the resource pools task uses, sorted (the order locks are taken in)."""
+        used = self._uses.get(task)
+        if used is not None:
+            return used
+
+        task_words = words(task)
+        consumed = [False] * len(task_words)
+        used = set()
+        for key in self._keys:
+            key_words = key.split()
+            for first in range(len(task_words) - len(key_words) + 1):
+                span = range(first, first + len(key_words))
+                if task_words[first:first + len(key_words)] == key_words and not any(consumed[n] for n in span):
+                    used.add(key)
+                    for n in span:
+                        consumed[n] = True
+        for (word, taken) in zip(task_words, consumed):
+            keys = self._by_head.get(word)
+            if keys and not taken and used.isdisjoint(keys):
+                used.add(keys[0])
+
+        used = self._uses[task] = tuple(sorted(used))
+        return used
+
+    def locked(self, task: str) -> tuple:
+        """Keys of the pools task holds while it runs: the utensils it uses, sorted."""
+        return tuple(key for key in self.uses(task) if self.kinds[key] in LOCKED_KINDS)
+
+    def quantities(self, task: str) -> dict:
+        """{ingredient key: count} for the counted ingredients task names with a count ('Peel 3 potatoes')."""
+        tokens = [token if token[0].isdigit() else singular(token) for token in TOKEN.findall(task.lower())]
+        found = collections.Counter()
+        for key in self.uses(task):
+            if key not in self.counted or self.kinds[key] in LOCKED_KINDS:
+                continue
+            key_words = key.split()
+            for (n, token) in enumerate(tokens):
+                if not token.isdigit():
+                    continue
+                # The count is followed by the key, or its last word, within a few descriptive words
+                following = []
+                for word in tokens[n + 1:n + 1 + 3 + len(key_words)]:
+                    if word[0].isdigit() or word in MEASURES:
+                        break
+                    following.append(word)
+                text = " ".join(following)
+                if f" {key} " in f" {text} " or key_words[-1] in following:
+                    found[key] += int(token)
+        return dict(found)
+
+
+def resource_index(plan: Plan, inventory: Inventory) -> dict:
+    """{resource key: [Task, ...]} for every resource some task of plan uses."""
+    index = collections.defaultdict(list)
+    for task in plan.tasks():
+        for key in inventory.uses(task.text):
+            index[key].append(task)
+    return index
+
+
+# ------------------------------------------------
+# Execution
+# ------------------------------------------------
+class ResourceLocks:
+    """A counted semaphore per utensil pool; tasks hold their utensils while they run."""
+    def __init__(self, inventory: Inventory):
+        self.inventory = inventory
+        self._semaphores = {
+            key: threading.BoundedSemaphore(count) for (key, count) in inventory.capacity.items()
+            if inventory.kinds[key] in LOCKED_KINDS
+        }
+
+    def acquire(self, task: str) -> float:
+        """Wait for task's utensils, always in key order so no two tasks deadlock; returns seconds waited."""
+        started = time.perf_counter()
+        for key in self.inventory.locked(task):
+            self._semaphores[key].acquire()
+        return time.perf_counter() - started
+
+    def release(self, task: str):
+        for key in reversed(self.inventory.locked(task)):
+            self._semaphores[key].release()
+
+
+# ------------------------------------------------
+# Cost of the limits
+# ------------------------------------------------
+def step_makespan(step: Step, inventory: Inventory = None, cost=unit_cost) -> float:
+    """
+    Makespan of step when every member works through their tasks in order and,
+    with an inventory, starts a task only once its utensils are free.
+    """
+    queues = collections.defaultdict(collections.deque)
+    for task in step.tasks:
+        queues[task.member].append(task)
+    if inventory is None:
+        return max((sum(cost(task) for task in queue) for queue in queues.values()), default=0)
+
+    in_use = collections.Counter()
+    running = []  # heap of (finish time, n, member, resource keys)
+    now = 0
+    n = 0
+    idle = list(queues)
+    while idle or running:
+        for member in list(idle):
+            task = queues[member][0]
+            keys = inventory.locked(task.text)
+            if all(in_use[key] < inventory.capacity[key] for key in keys):
+                in_use.update(keys)
+                queues[member].popleft()
+                idle.remove(member)
+                heapq.heappush(running, (now + cost(task), n, member, keys))
+                n += 1
+        if not running:
+            break
+        (now, _, member, keys) = heapq.heappop(running)
+        in_use.subtract(keys)
+        if queues[member]:
+            idle.append(member)
+    return now
+
+
+def ingredient_check(plan: Plan, inventory: Inventory) -> list[dict]:
+    """
+    For every counted ingredient the plan's tasks name with a count, how many
+    the tasks need against how many the kitchen has.
+    """
+    needed = collections.Counter()
+    tasks = collections.Counter()
+    for task in plan.tasks():
+        for (key, count) in inventory.quantities(task.text).items():
+            needed[key] += count
+            tasks[key] += 1
+    return [
+        {"ingredient": key, "count": inventory.capacity[key], "needed": needed[key], "tasks": tasks[key],
+         "short": needed[key] > inventory.capacity[key]}
+        for key in sorted(needed)
+    ]
+
+
+def contention_report(plan: Plan, inventory: Inventory, cost=unit_cost) -> dict:
+    """
+    Makespan and parallelism of plan with and without the inventory's utensil
+    limits, by step and by utensil, and the ingredient check.
+    """
+    steps = []
+    for step in plan.steps:
+        free = step_makespan(step, None, cost)
+        limited = step_makespan(step, inventory, cost)
+        steps.append({"step": step.number, "tasks": len(step.tasks), "makespan": free, "limited_makespan": limited})
+
+    work = sum(cost(task) for task in plan.tasks())
+    free = sum(step["makespan"] for step in steps)
+    limited = sum(step["limited_makespan"] for step in steps)
+    resources = []
+    for (key, tasks) in resource_index(plan, inventory).items():
+        if inventory.kinds[key] not in LOCKED_KINDS:
+            continue
+        demand = collections.Counter(task.step for task in tasks)
+        resources.append({
+            "resource": key,
+            "kind": inventory.kinds[key],
+            "count": inventory.capacity[key],
+            "tasks": len(tasks),
+            "peak_demand": max(demand.values()),
+            "contended_steps": sorted(step for (step, tasks) in demand.items() if tasks > inventory.capacity[key]),
+        })
+    return {
+        "makespan": free,
+        "limited_makespan": limited,
+        "parallelism": work / free if free else 0.0,
+        "limited_parallelism": work / limited if limited else 0.0,
+        "steps": steps,
+        "resources": resources,
+        "ingredients": ingredient_check(plan, inventory),
+    }
@@ -0,0 +1,114 @@
+"""
+Hybrid dense and lexical retrieval over the recipe index.
+
+``search_many`` is the one place queries meet the embedder, the FAISS index
+and the lexical index: all queries are encoded in a single forward pass and
+looked up with a single matrix search, and with a lexical index
+(brigade/lexical.py) also scored with BM25. The two rankings are combined
+with reciprocal-rank fusion (RRF): a document scores 1 / (RRF_K + rank) in
+each ranking it appears in, so a recipe that names a rare ingredient of the
+dish can rank high without a close embedding, and vice versa. Fused scores
+are scaled to (0, 1], 1 being first in every ranking. Without an embedder,
+e.g. when it could not be loaded, the search is lexical only; without a
+lexical index it is dense only.
+
+Rows tombstoned by brigade/ingest.py are left out of the results.
+
+``Retriever.retrieve()`` and ``retrieve_many()`` in brigade/pipeline.py are
+thin wrappers around it. ``search_ids`` returns the corpus row of each hit
+instead of its text, e.g. to look up the hits' stored embeddings.
+"""
+import collections
+
+import numpy as np
+
+RETRIEVAL_MODES = ("hybrid", "dense", "lexical")
+RRF_K = 60
+
+
+def fuse(rankings: list, k: int) -> list:
+    """The top-k (id, score) of the reciprocal-rank fusion of rankings ([[(id, score), ...], ...])."""
+    rankings = [ranking for ranking in rankings if ranking]
+    fused = collections.defaultdict(float)
+    for ranking in rankings:
+        for (rank, (i, _)) in enumerate(ranking, 1):
+            fused[i] += 1 / (RRF_K + rank)
+    best = len(rankings) / (RRF_K + 1)
+    return [(i, score / best) for (i, score) in sorted(fused.items(), key=lambda hit: -hit[1])[:k]]
+
+
+def search_many(embedder, index, texts, queries: list[str], k: int = 5, cache=None, lexical=None,
+                tombstones=frozenset()):
+    """
+    Top-k hits for every query as a list (one entry per query) of
+    (text, score) pairs, best first. Dense-only scores are inner products of
+    normalized embeddings, i.e. cosine similarities; lexical-only scores are
+    BM25 scores.
+
+    With a RetrievalCache, queries with cached dense hits skip the embedder
+    and the index, and queries with a cached embedding skip only the
+    embedder. Lexical hits are not cached.
+    """
+    hits = search_ids(embedder, index, queries, k, cache, lexical, tombstones)
+    return [[(texts[i], score) for (i, score) in query_hits] for query_hits in hits]
+
+
+def search_ids(embedder, index, queries: list[str], k: int = 5, cache=None, lexical=None,
+               tombstones=frozenset()):
+    """search_many(), with the corpus row of each hit in place of its text."""
+    if not queries:
+        return []
+    if tombstones:
+        # Tombstoned rows stay in the indexes until compaction: fetch twice as many as needed, and again with
+        # twice as many for the queries that still come up short, up to k + len(tombstones)
+        results = [None] * len(queries)
+        (pending, fetch) = (list(range(len(queries))), min(2 * k, k + len(tombstones)))
+        while pending:
+            hits = search_ids(embedder, index, [queries[n] for n in pending], fetch, cache, lexical)
+            short = []
+            for (n, query_hits) in zip(pending, hits):
+                results[n] = [hit for hit in query_hits if hit[0] not in tombstones][:k]
+                if len(results[n]) < k and len(query_hits) == fetch and fetch < k + len(tombstones):
+                    short.append(n)
+            (pending, fetch) = (short, min(2 * fetch, k + len(tombstones)))
+        return results
+    if embedder is None:
+        if lexical is None:
+            raise ValueError("Retrieval needs an embedder or a lexical index")
+        return lexical.search_many(queries, k)
+    if lexical is not None:
+        # The fused list is cached as a whole; the dense search of the queries it misses has its own entries
+        fused = [cache.get_hits(query, k, fused=True) if cache else None for query in queries]
+        missing = [n for (n, found) in enumerate(fused) if found is None]
+        if missing:
+            subset = [queries[n] for n in missing]
+            dense = search_ids(embedder, index, subset, k, cache)
+            for (n, dense_hits, lexical_hits) in zip(missing, dense, lexical.search_many(subset, k)):
+                fused[n] = fuse([dense_hits, lexical_hits], k)
+                if cache:
+                    cache.put_hits(queries[n], k, fused[n], fused=True)
+        return fused
+
+    hits = [cache.get_hits(query, k) if cache else None for query in queries]
+    missing = [n for (n, found) in enumerate(hits) if found is None]
+
+    if missing:
+        vectors = [cache.get_embedding(queries[n]) if cache else None for n in missing]
+        to_encode = [n for (n, vector) in zip(missing, vectors) if vector is None]
+
+        if to_encode:
+            encoded = embedder.encode([queries[n] for n in to_encode], convert_to_numpy=True, normalize_embeddings=True)
+            by_query = dict(zip(to_encode, encoded))
+            vectors = [by_query.get(n, vector) for (n, vector) in zip(missing, vectors)]
+            if cache:
+                for (n, vector) in by_query.items():
+                    cache.put_embedding(queries[n], vector)
+
+        D, I = index.search(np.vstack(vectors).astype(np.float32), k)
+
+        # Approximate backends pad with id -1 when they find fewer than k neighbours
+        for (n, ids, scores) in zip(missing, I, D):
+            hits[n] = [(int(i), float(score)) for (i, score) in zip(ids, scores) if i != -1]
+            if cache:
+                cache.put_hits(queries[n], k, hits[n])
+    return hits
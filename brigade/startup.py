@@ -0,0 +1,94 @@
+"""
+Startup-time benchmark guarding the scripts' import budget.
+
+    python -m brigade.startup --budget 1.0
+
+For each script this times ``--help`` in a fresh interpreter (the median of
+several runs) and checks that importing the script loads none of the heavy
+packages: those must only be imported where they are used, once a run needs
+them. Exits with status 1 when a script is over budget or imports a heavy
+package eagerly, printing the slowest top-level imports to show where the
+time went.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPTS = ("Kitchen_Brigade", "Kitchen_Brigade_ingredients")
+HEAVY_MODULES = (
+    "torch", "transformers", "sentence_transformers", "datasets", "faiss",
+    "langgraph", "openai", "ibm_watsonx_ai",
+)
+DEFAULT_BUDGET = 1.0
+
+
+def time_help(script: str, repeat: int = 5) -> float:
+    """Median wall time in seconds of '<script>.py --help' in a new interpreter."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, f"{script}.py", "--help"], check=True, capture_output=True)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def heavy_imports(script: str) -> list[str]:
+    """The HEAVY_MODULES that importing script loads."""
+    code = (
+        "import importlib, json, sys\n"
+        f"importlib.import_module({script!r})\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def import_profile(script: str, top: int = 10) -> list:
+    """[(package, cumulative seconds), ...] for the slowest top-level imports of script, per -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {script}"], check=True, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        (_, cumulative, name) = line.split("|")
+        # Nested imports are indented under the module that imported them; keep the script's direct imports
+        if name.startswith("   ") and not name.startswith("     "):
+            rows.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(rows, key=lambda row: -row[1])[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser("brigade.startup", description="Check the scripts' startup time against a budget.")
+    parser.add_argument("--budget",
+                        type=float,
+                        default=DEFAULT_BUDGET,
+                        help=f"Maximum median seconds for '<script>.py --help'. Default: {DEFAULT_BUDGET}")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=5,
+                        help="Number of timed runs per script. Default: 5")
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'script':<30} {'--help (s)':>10}  heavy imports")
+    for script in SCRIPTS:
+        seconds = time_help(script, args.repeat)
+        heavy = heavy_imports(script)
+        print(f"{script:<30} {seconds:>10.3f}  {', '.join(heavy) or '-'}")
+
+        if seconds > args.budget or heavy:
+            failed = True
+            print(f"  [⚠️] {script} is over its {args.budget:.3f}s budget or imports heavy packages eagerly. Slowest imports:")
+            for (name, cumulative) in import_profile(script):
+                print(f"    {name:<40} {cumulative:.3f}s")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+Structured planning: the planner answers with a JSON plan constrained by a
+schema instead of free text.
+
+The plan is validated against the team loaded from the crew file. Only the
+tasks that fail validation are sent back to the model for repair instead of
+regenerating the whole plan; whatever still fails after the last repair
+round is reported in ``Plan.unparsed`` like any other line the plan parser
+could not route.
+
+For a large Crew the assignee is constrained by a pattern over the role
+names instead of an enum of every member, so the schema and the repair
+prompt grow with the number of roles, not of members.
+"""
+import json
+import re
+import sys
+
+from brigade.crew import Crew
+from brigade.plan import Plan, Step, Task, Unparsed, link_steps
+from brigade.ratelimit import PLANNING
+
+# Crews with more members than this are described by role in schemas and prompts
+MAX_ENUM_MEMBERS = 100
+
+
+def member_schema(staff) -> dict:
+    """Schema of a team member ID of staff."""
+    if isinstance(staff, Crew) and len(staff) > MAX_ENUM_MEMBERS:
+        roles = "|".join(re.sub(r"([.^$*+?()\[\]{}|\\])", r"\\\1", role) for role in staff.roles)
+        return {"type": "string", "pattern": f"^(?:{roles}) [1-9][0-9]*$"}
+    return {"type": "string", "enum": list(staff)}
+
+
+def team_listing(staff) -> str:
+    """The team members of staff for a prompt; a large Crew is listed one role per line."""
+    if isinstance(staff, Crew) and len(staff) > MAX_ENUM_MEMBERS:
+        return "\n" + "\n".join(staff.roster())
+    return ", ".join(staff)
+
+
+def plan_schema(staff) -> dict:
+    """JSON schema of a plan whose tasks are assigned to one of the members of staff."""
+    task = {
+        "type": "object",
+        "properties": {
+            "member": member_schema(staff),
+            "task": {"type": "string"},
+        },
+        "required": ["member", "task"],
+        "additionalProperties": False,
+    }
+    step = {
+        "type": "object",
+        "properties": {
+            "step": {"type": "integer"},
+            "title": {"type": "string"},
+            "after": {"type": "array", "items": {"type": "integer"}},
+            "tasks": {"type": "array", "items": task},
+        },
+        "required": ["step", "title", "after", "tasks"],
+        "additionalProperties": False,
+    }
+    return {
+        "type": "object",
+        "properties": {"steps": {"type": "array", "items": step}},
+        "required": ["steps"],
+        "additionalProperties": False,
+    }
+
+
+def repair_schema(staff) -> dict:
+    """Schema of the answer to a repair prompt: one corrected task per problem."""
+    fix = {
+        "type": "object",
+        "properties": {
+            "id": {"type": "integer"},
+            "member": member_schema(staff),
+            "task": {"type": "string"},
+        },
+        "required": ["id", "member", "task"],
+        "additionalProperties": False,
+    }
+    return {
+        "type": "object",
+        "properties": {"fixes": {"type": "array", "items": fix}},
+        "required": ["fixes"],
+        "additionalProperties": False,
+    }
+
+
+STRUCTURED_INSTRUCTIONS = (
+    "Respond with JSON: a 'steps' list with one entry per time step, where 'step' is the step number "
+    "(0 for T0), 'title' a short name for the step, 'after' the earlier steps it needs finished "
+    "(empty if it follows the step before it) and 'tasks' the tasks of the step, "
+    "each with the 'member' it is assigned to and the 'task' itself."
+)
+
+
+def decode_plan(data):
+    """
+    Steps of a decoded JSON plan as ({step number: [[member, task], ...]},
+    {step number: title}, {step number: (earlier step number, ...)}),
+    tolerating missing or mistyped fields.
+    """
+    steps = {}
+    titles = {}
+    after = {}
+    for (n, entry) in enumerate(data.get("steps", []) if isinstance(data, dict) else []):
+        entry = entry if isinstance(entry, dict) else {}
+        number = entry.get("step", n)
+        number = number if isinstance(number, int) else n
+        tasks = steps.setdefault(number, [])
+        titles.setdefault(number, str(entry.get("title", "")).strip())
+        earlier = entry.get("after")
+        if isinstance(earlier, list):
+            after.setdefault(number, tuple(step for step in earlier if isinstance(step, int)))
+        for item in entry.get("tasks", []):
+            item = item if isinstance(item, dict) else {}
+            tasks.append([str(item.get("member", "")).strip(), str(item.get("task", "")).strip()])
+    return steps, titles, after
+
+
+def find_problems(steps: dict, staff) -> list:
+    """(step number, position, member, task, reason) for every task that cannot be executed as is."""
+    problems = []
+    for (number, tasks) in steps.items():
+        for (position, (member, task)) in enumerate(tasks):
+            if member not in staff:
+                problems.append((number, position, member, task, f"unknown team member '{member}'"))
+            elif not task:
+                problems.append((number, position, member, task, "empty task"))
+    return problems
+
+
+def repair_prompt(problems, staff) -> str:
+    listed = "\n".join(
+        f"{id}. T{number}: '{member}: {task}' ({reason})"
+        for (id, (number, _, member, task, reason)) in enumerate(problems)
+    )
+    return (
+        "The following tasks of a kitchen plan cannot be executed as written:\n\n"
+        f"{listed}\n\n"
+        f"Team members available: {team_listing(staff)}.\n"
+        "For each numbered task return its 'id', the team member best suited to do it, and the task text. "
+        "Do not change anything else."
+    )
+
+
+def build_plan(steps, titles, problems, after=None) -> Plan:
+    """Plan records from validated steps; remaining problems become Unparsed entries."""
+    broken = {(number, position): reason for (number, position, _, _, reason) in problems}
+    plan = Plan()
+    ordinal = 0
+
+    for number in sorted(steps):
+        step = Step(number, titles.get(number, ""))
+        for (position, (member, task)) in enumerate(steps[number]):
+            ordinal += 1
+            reason = broken.get((number, position))
+            if reason:
+                plan.unparsed.append(Unparsed(ordinal, f"T{number}: {member}: {task}", reason))
+            else:
+                step.tasks.append(Task(number, sys.intern(member), task, ordinal))
+        if step.tasks:
+            plan.steps.append(step)
+
+    link_steps(plan.steps, after)
+    return plan
+
+
+def generate_structured_plan(llm, prompt: str, staff, max_repairs: int = 2, log=None) -> Plan:
+    """
+    Ask llm for a schema-constrained plan and validate it against staff,
+    re-prompting only for the invalid tasks up to max_repairs times. Each
+    exchange is appended to log as (stage, prompt, response) if given.
+    """
+    prompt = f"{prompt}\n\n{STRUCTURED_INSTRUCTIONS}"
+    data = llm.generate_json(prompt, plan_schema(staff), name="kitchen_plan", priority=PLANNING)
+    if log is not None:
+        log.append(("Planning", prompt, json.dumps(data)))
+
+    steps, titles, after = decode_plan(data)
+    problems = find_problems(steps, staff)
+
+    for _ in range(max_repairs):
+        if not problems:
+            break
+        print(f"  [🛠️] Re-prompting for {len(problems)} invalid task(s)")
+        fix_prompt = repair_prompt(problems, staff)
+        fixes = llm.generate_json(fix_prompt, repair_schema(staff), name="kitchen_plan_fixes", priority=PLANNING)
+        if log is not None:
+            log.append(("Plan Repair", fix_prompt, json.dumps(fixes)))
+
+        for fix in fixes.get("fixes", []) if isinstance(fixes, dict) else []:
+            if isinstance(fix, dict) and isinstance(fix.get("id"), int) and 0 <= fix["id"] < len(problems):
+                (number, position, *_) = problems[fix["id"]]
+                steps[number][position] = [str(fix.get("member", "")).strip(), str(fix.get("task", "")).strip()]
+
+        problems = find_problems(steps, staff)
+
+    return build_plan(steps, titles, problems, after)
@@ -0,0 +1,209 @@
+"""
+Synthetic recipes, index and crews for offline benchmarks.
+
+Nothing here needs network access or the sentence-transformers model:
+
+- ``synthetic_recipes`` generates a reproducible stream of recipe-like texts.
+- ``HashingEmbedder`` is a stand-in for SentenceTransformer with the same
+  ``encode`` signature. Every word gets a fixed pseudo-random vector (seeded
+  by the word), and a text's embedding is the normalized sum of its words'
+  vectors. Texts that share words score higher against each other, so
+  retrieval results still mean something.
+- ``build_synthetic_index`` writes ``embeddings.npy``, ``faiss.index`` and
+  ``corpus.bin`` for N synthetic recipes into a directory, in the same
+  formats the scripts use, streaming in chunks so 1M recipes fit in memory.
+- ``synthetic_crew`` makes a crew file of any size in the format of
+  ``crew.json``.
+
+    python -m brigade.synthetic corpus --recipes 100000 --out .bench/100000
+    python -m brigade.synthetic crew --members 500 --out .bench/crew-500.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import zlib
+
+import numpy as np
+
+from brigade.backends import BACKENDS, build_backend_index, convert_embeddings, index_backend, load_index_config
+from brigade.corpus import load_snapshot, record_digest, write_snapshot
+
+DIMENSION = 384  # same as all-MiniLM-L6-v2
+META_FILE = "synthetic.json"
+
+ADJECTIVES = ("Crispy", "Smoky", "Creamy", "Spicy", "Rustic", "Golden", "Herbed", "Tangy", "Slow-cooked", "Charred")
+PROTEINS = ("chicken", "beef", "pork", "salmon", "tofu", "shrimp", "lamb", "chickpeas", "eggs", "halibut", "duck", "lentils")
+VEGETABLES = ("potatoes", "carrots", "spinach", "mushrooms", "zucchini", "peppers", "onions", "kale", "tomatoes", "squash")
+SAUCES = ("garlic butter", "lemon herb sauce", "red wine jus", "tahini", "salsa verde", "curry sauce", "pesto", "gravy")
+METHODS = ("roast", "grill", "sear", "braise", "bake", "saute", "poach", "simmer", "fry", "steam")
+UTENSILS = ("skillet", "oven", "saucepan", "baking sheet", "grill pan", "stock pot", "wok", "dutch oven")
+ROLES = (
+    "Chef de Cuisine", "Sous Chef", "Saucier", "Chef de Partie", "Cuisinier", "Commis", "Garde Manger",
+    "Rotisseur", "Poissonnier", "Entremetier", "Patissier", "Tournant", "Friturier", "Grillardin", "Plongeur",
+)
+
+
+def synthetic_recipes(count: int, seed: int = 0):
+    """Yield count reproducible recipe texts ('instruction output', like the real corpus)."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        (adjective, protein, vegetable, sauce) = (
+            rng.choice(ADJECTIVES), rng.choice(PROTEINS), rng.choice(VEGETABLES), rng.choice(SAUCES)
+        )
+        steps = " ".join(
+            f"{n}. {rng.choice(METHODS).capitalize()} the {rng.choice((protein, vegetable))} "
+            f"in a {rng.choice(UTENSILS)} for {rng.randint(2, 45)} minutes."
+            for n in range(1, rng.randint(3, 7))
+        )
+        yield (
+            f"Make {adjective.lower()} {protein} with {vegetable} and {sauce}. "
+            f"{adjective} {protein.capitalize()} with {vegetable.capitalize()}. "
+            f"Ingredients: {rng.randint(1, 4)} lb {protein}, {rng.randint(1, 6)} {vegetable}, "
+            f"{rng.randint(1, 3)} tbsp {sauce}, salt, pepper. Instructions: {steps}"
+        )
+
+
+class HashingEmbedder:
+    """Offline stand-in for SentenceTransformer: normalized sums of per-word pseudo-random vectors."""
+    WORD = re.compile(r"\w+")
+
+    def __init__(self, dimension: int = DIMENSION):
+        self.dimension = dimension
+        self._ids = {}
+        self._vectors = np.empty((0, dimension), dtype=np.float32)
+
+    def _word_ids(self, words) -> list[int]:
+        new = [word for word in dict.fromkeys(words) if word not in self._ids]
+        if new:
+            vectors = np.stack([
+                np.random.default_rng(zlib.crc32(word.encode("utf-8"))).standard_normal(self.dimension, dtype=np.float32)
+                for word in new
+            ])
+            for word in new:
+                self._ids[word] = len(self._ids)
+            self._vectors = np.vstack([self._vectors, vectors])
+        return [self._ids[word] for word in words]
+
+    def encode(self, sentences, convert_to_numpy: bool = True, normalize_embeddings: bool = True,
+               batch_size: int = 1024, **_):
+        sentences = [sentences] if isinstance(sentences, str) else list(sentences)
+        embeddings = np.empty((len(sentences), self.dimension), dtype=np.float32)
+
+        for first in range(0, len(sentences), batch_size):
+            words = [self.WORD.findall(sentence.lower()) or ["<empty>"] for sentence in sentences[first:first + batch_size]]
+            ids = np.array(self._word_ids([word for sentence in words for word in sentence]), dtype=np.int64)
+            rows = np.repeat(np.arange(len(words)), [len(sentence) for sentence in words])
+            # Word counts per text times the word vectors: one matrix product per batch
+            vocabulary = len(self._vectors)
+            counts = np.bincount(rows * vocabulary + ids, minlength=len(words) * vocabulary)
+            embeddings[first:first + len(words)] = counts.reshape(len(words), vocabulary).astype(np.float32) @ self._vectors
+
+        if normalize_embeddings:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+
+def build_synthetic_index(directory: str, recipes: int, config: dict = None, seed: int = 0,
+                          chunk_size: int = 65536):
+    """
+    Write embeddings, index and corpus snapshot for recipes synthetic recipes
+    into directory, or reuse them if a previous call made them with the same
+    parameters. Returns (index, snapshot, embedder).
+    """
+    import faiss
+
+    config = config or load_index_config()
+    os.makedirs(directory, exist_ok=True)
+    embeddings_path = os.path.join(directory, "embeddings.npy")
+    index_path = os.path.join(directory, "faiss.index")
+    corpus_path = os.path.join(directory, "corpus.bin")
+    meta_path = os.path.join(directory, META_FILE)
+    meta = {"recipes": recipes, "seed": seed, "dimension": DIMENSION, "config": config}
+    embedder = HashingEmbedder()
+
+    if os.path.exists(meta_path) and os.path.exists(corpus_path):
+        with open(meta_path, "r") as f:
+            if json.load(f) == meta:
+                print(f"[💾] Reusing synthetic index of {recipes} recipes in {directory}")
+                index = faiss.read_index(index_path)
+                return index, load_snapshot(corpus_path, index_path, None), embedder
+
+    print(f"[⚙️] Generating {recipes} synthetic recipes and their embeddings")
+    embeddings = np.lib.format.open_memmap(embeddings_path, mode="w+", dtype=np.float32, shape=(recipes, DIMENSION))
+    chunk = []
+    first = 0
+    for text in synthetic_recipes(recipes, seed):
+        chunk.append(text)
+        if len(chunk) == chunk_size:
+            embeddings[first:first + len(chunk)] = embedder.encode(chunk)
+            first += len(chunk)
+            chunk = []
+    if chunk:
+        embeddings[first:first + len(chunk)] = embedder.encode(chunk)
+    embeddings.flush()
+    del embeddings
+    if config["storage"] not in (None, "float32"):
+        convert_embeddings(embeddings_path, config["storage"])
+
+    index = build_backend_index(np.load(embeddings_path, mmap_mode="r"), config)
+    faiss.write_index(index, index_path)
+    snapshot = write_snapshot(corpus_path, synthetic_recipes(recipes, seed), record_digest(index_path))
+    print(f"[💾] Saved {index_backend(index)} index and corpus of {recipes} synthetic recipes to {directory}")
+
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    return index, snapshot, embedder
+
+
+def synthetic_crew(members: int) -> dict:
+    """A crew of members team members over the classic brigade roles, in crew.json format."""
+    if members < 1:
+        raise ValueError("A crew needs at least one member")
+    roles = ROLES[:members]
+    (per_role, extra) = divmod(members, len(roles))
+    return {
+        role: [per_role + (1 if n < extra else 0), f"{role}: synthetic team member for benchmarks."]
+        for (n, role) in enumerate(roles)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser("brigade.synthetic")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    corpus = commands.add_parser("corpus", help="Write embeddings, index and corpus snapshot of synthetic recipes.")
+    corpus.add_argument("--recipes", "-n",
+                        type=int,
+                        default=1000,
+                        help="Number of recipes. Default: 1000")
+    corpus.add_argument("--backend", "-b",
+                        choices=BACKENDS,
+                        default=None,
+                        help="Index backend; overrides the config file. Default: flat")
+    corpus.add_argument("--index-config",
+                        default=None,
+                        help="JSON file with the index backend and its parameters.")
+    corpus.add_argument("--seed", type=int, default=0, help="Default: 0")
+    corpus.add_argument("--out", "-o", required=True, help="Directory for the files.")
+
+    crew = commands.add_parser("crew", help="Write a crew file with the given number of team members.")
+    crew.add_argument("--members", "-n",
+                      type=int,
+                      default=15,
+                      help="Number of team members. Default: 15")
+    crew.add_argument("--out", "-o", required=True, help="Crew file to write.")
+    args = parser.parse_args(argv)
+
+    if args.command == "corpus":
+        build_synthetic_index(args.out, args.recipes, load_index_config(args.index_config, backend=args.backend), args.seed)
+
+    elif args.command == "crew":
+        with open(args.out, "w") as f:
+            json.dump(synthetic_crew(args.members), f, indent=2)
+        print(f"[💾] Saved crew of {args.members} to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
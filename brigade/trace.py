@@ -0,0 +1,238 @@
+"""
+Run instrumentation: spans with wall time, CPU time and peak RSS.
+
+A ``Tracer`` records a tree of spans: one per workflow node, one per LLM
+call (with provider-reported token counts when the provider returns them)
+and any others a caller opens with ``tracer.span(...)``. The current span is
+tracked in a context variable, so spans opened inside a node, on a worker
+thread started with ``asyncio.to_thread`` or in an asyncio task nest under
+the span that was current when they started.
+
+CPU time is the process CPU time (all threads) elapsed during the span, so
+the CPU times of concurrent spans overlap. Peak RSS is the process
+high-water mark when the span ends; the resident memory is never sampled
+in between, so a span can only show that the peak went up while it ran.
+
+A run's spans can be exported as a JSON trace (``export_json``) and as an
+OTLP/JSON file (``export_otlp``) that OpenTelemetry collectors and tools such
+as Jaeger import, and summarized as a table per span name with latency
+percentiles and token totals (``print_summary``).
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_current = contextvars.ContextVar("brigade_current_span", default=None)
+
+
+def peak_rss() -> int:
+    """High-water mark of the process's resident memory in bytes, or 0 where unknown."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank q-th percentile (0-100) of values; 0.0 if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+class Span:
+    __slots__ = ("name", "kind", "span_id", "parent_id", "start_ns", "end_ns",
+                 "wall_seconds", "cpu_seconds", "peak_rss_bytes", "peak_rss_growth_bytes",
+                 "attributes", "error")
+
+    def __init__(self, name: str, kind: str, parent_id, attributes: dict):
+        self.name = name
+        self.kind = kind
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.peak_rss_bytes = None
+        self.peak_rss_growth_bytes = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+def current_span():
+    """The innermost open span in this context, or None."""
+    return _current.get()
+
+
+def annotate(**attributes):
+    """Set attributes (e.g. token counts) on the current span, if there is one."""
+    span = _current.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+class Tracer:
+    """
+    Collects the spans of one run. A disabled tracer records nothing and its
+    spans cost next to nothing, so code can be instrumented unconditionally.
+    """
+    def __init__(self, enabled: bool = True, service: str = "kitchen-brigade"):
+        self.enabled = enabled
+        self.service = service
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes):
+        """
+        Record the body of the with-block as a span named name. kind is
+        "internal" or "client" (a call to another service, e.g. an LLM).
+        Yields the Span (None when disabled) for setting attributes.
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        parent = _current.get()
+        span = Span(name, kind, parent.span_id if parent else None, attributes)
+        token = _current.set(span)
+        rss_before = peak_rss()
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.wall_seconds = time.perf_counter() - started
+            span.cpu_seconds = time.process_time() - cpu_started
+            span.peak_rss_bytes = peak_rss()
+            span.peak_rss_growth_bytes = span.peak_rss_bytes - rss_before
+            span.end_ns = time.time_ns()
+            _current.reset(token)
+            with self._lock:
+                self.spans.append(span)
+
+    def wrap(self, name: str, func, kind: str = "internal"):
+        """func, recorded as a span named name on every call."""
+        if not self.enabled:
+            return func
+
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            with self.span(name, kind):
+                return func(*args, **kwargs)
+        return traced
+
+    def summary(self) -> list[dict]:
+        """One row per span name, in order of first completion: calls, time, memory, tokens and latency percentiles."""
+        groups = {}
+        for span in self.spans:
+            groups.setdefault(span.name, []).append(span)
+
+        rows = []
+        for (name, spans) in groups.items():
+            walls = [span.wall_seconds for span in spans]
+            rows.append({
+                "name": name,
+                "calls": len(spans),
+                "errors": sum(1 for span in spans if span.error),
+                "cached": sum(1 for span in spans if span.attributes.get("cached")),
+                "wall_seconds": sum(walls),
+                "cpu_seconds": sum(span.cpu_seconds for span in spans),
+                "peak_rss_bytes": max(span.peak_rss_bytes for span in spans),
+                "prompt_tokens": sum(span.attributes.get("prompt_tokens") or 0 for span in spans),
+                "completion_tokens": sum(span.attributes.get("completion_tokens") or 0 for span in spans),
+                "p50_seconds": percentile(walls, 50),
+                "p95_seconds": percentile(walls, 95),
+                "p99_seconds": percentile(walls, 99),
+            })
+        return rows
+
+    def print_summary(self, file=None):
+        rows = self.summary()
+        print(f"{'span':<22} {'calls':>5} {'cached':>6} {'wall s':>8} {'cpu s':>8} {'peak MB':>8} "
+              f"{'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'in tok':>7} {'out tok':>7}", file=file)
+        for row in rows:
+            print(f"{row['name']:<22} {row['calls']:>5} {row['cached']:>6} {row['wall_seconds']:>8.2f} "
+                  f"{row['cpu_seconds']:>8.2f} {row['peak_rss_bytes'] / 2**20:>8.1f} "
+                  f"{row['p50_seconds']:>7.2f} {row['p95_seconds']:>7.2f} {row['p99_seconds']:>7.2f} "
+                  f"{row['prompt_tokens']:>7} {row['completion_tokens']:>7}", file=file)
+
+    def export_json(self, path: str):
+        """Write the trace id, every span and the summary as one JSON document."""
+        with open(path, "w") as f:
+            json.dump({
+                "trace_id": self.trace_id,
+                "service": self.service,
+                "spans": [span.to_dict() for span in self.spans],
+                "summary": self.summary(),
+            }, f, indent=2)
+
+    def export_otlp(self, path: str):
+        """Write the spans in the OTLP/JSON format of OpenTelemetry's ExportTraceServiceRequest."""
+        def value(v):
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        def attributes(items):
+            return [{"key": key, "value": value(v)} for (key, v) in items if v is not None]
+
+        spans = []
+        for span in self.spans:
+            measured = {
+                "brigade.wall_seconds": span.wall_seconds,
+                "brigade.cpu_seconds": span.cpu_seconds,
+                "brigade.peak_rss_bytes": span.peak_rss_bytes,
+                "brigade.peak_rss_growth_bytes": span.peak_rss_growth_bytes,
+            }
+            record = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                # SPAN_KIND_INTERNAL = 1, SPAN_KIND_CLIENT = 3
+                "kind": 3 if span.kind == "client" else 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": attributes(list(span.attributes.items()) + list(measured.items())),
+                # STATUS_CODE_OK = 1, STATUS_CODE_ERROR = 2
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                record["parentSpanId"] = span.parent_id
+            spans.append(record)
+
+        with open(path, "w") as f:
+            json.dump({
+                "resourceSpans": [{
+                    "resource": {"attributes": attributes([("service.name", self.service)])},
+                    "scopeSpans": [{"scope": {"name": "brigade"}, "spans": spans}],
+                }]
+            }, f, indent=2)
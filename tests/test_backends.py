@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from brigade.backends import (INT8_SCALE, build_backend_index, dequantize, index_storage, load_index_config,
+                              quantize, scalar_quantizer)
+
+
+def normalized(rows=200, dim=32, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_float16_round_trip_is_the_float16_value():
+    vectors = normalized()
+    stored = quantize(vectors, "float16")
+    assert stored.dtype == np.float16
+    np.testing.assert_array_equal(dequantize(stored), vectors.astype(np.float16).astype(np.float32))
+    np.testing.assert_allclose(dequantize(stored), vectors, atol=1e-3)
+
+
+def test_int8_round_trip_is_within_half_a_step():
+    vectors = normalized()
+    stored = quantize(vectors, "int8")
+    assert stored.dtype == np.int8
+    assert np.abs(dequantize(stored) - vectors).max() <= 0.5 / INT8_SCALE + 1e-7
+    # Decoding and encoding again gives the same bytes
+    np.testing.assert_array_equal(quantize(dequantize(stored), "int8"), stored)
+
+
+@pytest.mark.parametrize("backend", ["flat", "hnsw", "ivf-flat"])
+def test_int8_index_codes_are_the_stored_bytes(backend):
+    pytest.importorskip("faiss")
+    stored = quantize(normalized(rows=400), "int8")
+
+    index = build_backend_index(stored, load_index_config(backend=backend, storage="int8", nlist=4))
+
+    assert index_storage(index) == "int8"
+    sq = scalar_quantizer(index)
+    codes = sq.compute_codes(dequantize(stored))
+    np.testing.assert_array_equal(codes.astype(np.int16) - 127, stored)
+    np.testing.assert_allclose(sq.decode(codes), dequantize(stored), atol=1e-6)
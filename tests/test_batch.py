@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+from brigade.batch import load_manifest, run_argv, script_name
+
+
+def write_manifest(tmp_path, manifest):
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps(manifest))
+    return str(path)
+
+
+def test_matrix_expands_to_every_combination(tmp_path):
+    runs = load_manifest(write_manifest(tmp_path, {
+        "output_root": "out",
+        "options": ["--provider", "mock"],
+        "matrix": {
+            "dishes": ["Make me a Hamburger", {"label": "custom", "dish": "Make me a Hamburger with cheddar"}],
+            "crews": ["crew.json", "crews/short-order.json"],
+            "ingredients": ["pantry.txt"],
+        },
+        "runs": [{"dish": "Make me a stew", "crew": "crew.json", "options": ["--stream"]}],
+    }))
+
+    assert [run["output_directory"] for run in runs] == [
+        os.path.join("out", "make-me-a-hamburger", "crew", "pantry"),
+        os.path.join("out", "make-me-a-hamburger", "short-order", "pantry"),
+        os.path.join("out", "custom", "crew", "pantry"),
+        os.path.join("out", "custom", "short-order", "pantry"),
+        os.path.join("out", "make-me-a-stew", "crew"),
+    ]
+    assert runs[2]["dish"] == "Make me a Hamburger with cheddar"
+    assert [script_name(run) for run in runs] == ["Kitchen_Brigade_ingredients"] * 4 + ["Kitchen_Brigade"]
+    # A run's own options come after the shared ones
+    assert run_argv(runs[4])[-3:] == ["--provider", "mock", "--stream"]
+
+
+def test_recipes_get_a_directory_only_when_there_are_several(tmp_path):
+    one = load_manifest(write_manifest(tmp_path, {
+        "matrix": {"dishes": ["Roast chicken"], "crews": ["crew.json"], "recipes": ["recipes/roast.txt"]},
+    }))
+    several = load_manifest(write_manifest(tmp_path, {
+        "matrix": {"dishes": ["Roast chicken"], "crews": ["crew.json"],
+                   "recipes": ["recipes/roast.txt", "recipes/spatchcock.txt"]},
+        "runs": [{"dish": "Stew", "crew": "crew.json", "recipe": "recipes/stew.txt"}],
+    }))
+
+    assert [run["output_directory"] for run in one] == [os.path.join("results", "roast-chicken", "crew")]
+    assert [run["output_directory"] for run in several] == [
+        os.path.join("results", "roast-chicken", "crew", "roast"),
+        os.path.join("results", "roast-chicken", "crew", "spatchcock"),
+        os.path.join("results", "stew", "crew", "stew"),
+    ]
+
+
+def test_runs_writing_to_the_same_directory_are_an_error(tmp_path):
+    path = write_manifest(tmp_path, {
+        "matrix": {"dishes": ["Make me a Hamburger"], "crews": ["crew.json", "other/crew.json"]},
+    })
+
+    with pytest.raises(ValueError, match="several runs would write to"):
+        load_manifest(path)
+
+
+def test_a_manifest_needs_runs(tmp_path):
+    with pytest.raises(ValueError, match="no 'matrix' or 'runs'"):
+        load_manifest(write_manifest(tmp_path, {"options": ["--provider", "mock"]}))
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+from brigade.cache import DiskCache, ReplayMissError, ResponseCache, RetrievalCache, index_fingerprint
+from brigade.lexical import build_lexical_index
+from brigade.llm import LLMWrapper
+from brigade.retrieval import search_ids
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "llm-cache.sqlite")
+
+
+def test_replay_serves_recorded_responses(cache_path):
+    ResponseCache(cache_path).put("openai", "gpt-4o", "Plan the roast", {"temperature": 0}, "T1: Prep")
+    replay = ResponseCache(cache_path, "replay")
+    assert replay.get("openai", "gpt-4o", "Plan the roast", {"temperature": 0}) == "T1: Prep"
+    assert replay.stats()["hits"] == 1
+
+
+@pytest.mark.parametrize("provider, model, prompt, params", [
+    ("openai", "gpt-4o", "Plan the stew", {"temperature": 0}),
+    ("openai", "gpt-4o", "Plan the roast", {"temperature": 1}),
+    ("openai", "gpt-4o-mini", "Plan the roast", {"temperature": 0}),
+    ("watsonx", "gpt-4o", "Plan the roast", {"temperature": 0}),
+])
+def test_replay_miss_raises(cache_path, provider, model, prompt, params):
+    ResponseCache(cache_path).put("openai", "gpt-4o", "Plan the roast", {"temperature": 0}, "T1: Prep")
+    replay = ResponseCache(cache_path, "replay")
+    with pytest.raises(ReplayMissError):
+        replay.get(provider, model, prompt, params)
+    assert replay.stats()["misses"] == 1
+
+
+def test_read_write_miss_returns_none(cache_path):
+    cache = ResponseCache(cache_path)
+    assert cache.get("openai", "gpt-4o", "Plan the roast", {}) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_replay_never_writes(cache_path):
+    ResponseCache(cache_path).put("mock", "mock", "Plan the roast", {}, "T1: Prep")
+    replay = ResponseCache(cache_path, "replay")
+    replay.put("mock", "mock", "Plan the stew", {}, "T1: Simmer")
+    with pytest.raises(ReplayMissError):
+        ResponseCache(cache_path, "replay").get("mock", "mock", "Plan the stew", {})
+
+
+def test_unknown_mode_is_rejected(cache_path):
+    with pytest.raises(ValueError):
+        ResponseCache(cache_path, "write-only")
+
+
+def test_wrapper_replays_without_a_client(cache_path):
+    ResponseCache(cache_path).put("openai", "gpt-4o", "Plan the roast", {}, "T1: Prep")
+    llm = LLMWrapper("openai", "gpt-4o", cache=ResponseCache(cache_path, "replay"))
+    assert llm.client is None
+    assert llm.generate("Plan the roast") == "T1: Prep"
+    with pytest.raises(ReplayMissError):
+        llm.generate("Plan the stew")
+
+
+def test_disk_cache_evicts_least_recently_used_bytes(monkeypatch, tmp_path):
+    clock = iter(range(1000))
+    monkeypatch.setattr("brigade.cache.time.time", lambda: next(clock))
+    disk = DiskCache(str(tmp_path / "disk.sqlite"), max_entries=None, max_bytes=25)
+    for key in ("roast", "stew", "soup"):
+        disk.put(key, b"x" * 10)
+    # Only the two most recently written fit
+    assert disk.get("roast") is None
+    assert disk.size() == 20
+
+    # Reading stew makes soup the least recently used
+    disk.get("stew")
+    disk.put("tart", b"x" * 6)
+    assert (disk.get("soup"), disk.get("stew"), disk.get("tart")) == (None, b"x" * 10, b"x" * 6)
+    assert disk.size() == 16
+
+
+class Index:
+    """Stand-in FAISS index returning fixed hits and counting searches."""
+    ntotal = 4
+
+    def __init__(self):
+        self.searches = 0
+
+    def search(self, queries, k):
+        self.searches += 1
+        return np.tile(np.array([[0.9, 0.8]], dtype=np.float32), (len(queries), 1)), np.tile([[0, 2]], (len(queries), 1))
+
+
+class Embedder:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, queries, **kwargs):
+        self.encoded.extend(queries)
+        return np.ones((len(queries), 2), dtype=np.float32)
+
+
+def test_results_are_not_reused_once_the_index_digest_changes(tmp_path):
+    path = str(tmp_path / "retrieval.sqlite")
+    (index, embedder) = (Index(), Embedder())
+    before = RetrievalCache("model", index_fingerprint(b"a" * 32, index), path)
+    search_ids(embedder, index, ["Roast Chicken"], 2, before)
+
+    after = RetrievalCache("model", index_fingerprint(b"b" * 32, index), path)
+    assert after.get_hits("roast chicken", 2) is None
+    # The query embedding doesn't depend on the index, so it is still reused
+    search_ids(embedder, index, ["Roast Chicken"], 2, after)
+    assert (embedder.encoded, index.searches) == (["Roast Chicken"], 2)
+    assert RetrievalCache("model", index_fingerprint(b"a" * 32, index), path).get_hits("roast chicken", 2) \
+        == [(0, pytest.approx(0.9)), (2, pytest.approx(0.8))]
+
+
+def test_fused_results_are_cached(tmp_path):
+    lexical = build_lexical_index(str(tmp_path / "lexical.bin"), ["Roast chicken", "Stew", "Chicken soup", "Tart"],
+                                  bytes(32))
+    (index, embedder) = (Index(), Embedder())
+    cache = RetrievalCache("model", index_fingerprint(bytes(32), index), str(tmp_path / "retrieval.sqlite"))
+    searched = []
+    search_many = lexical.search_many
+    lexical.search_many = lambda queries, k: searched.append(queries) or search_many(queries, k)
+
+    first = search_ids(embedder, index, ["chicken soup"], 2, cache, lexical)
+    again = search_ids(embedder, index, ["Chicken  Soup"], 2, cache, lexical)
+
+    assert again == first
+    assert (embedder.encoded, index.searches, searched) == (["chicken soup"], 1, [["chicken soup"]])
+    assert cache.stats()["fused_memory_hits"] == 1
+    lexical.close()
@@ -0,0 +1,62 @@
+import numpy as np
+
+from brigade.context import approximate_tokens, mmr_order, select_context, truncate
+
+
+def unit(*components):
+    vector = np.array(components, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+HITS = [
+    ("Roast chicken with thyme", 0.9),
+    ("Roast chicken with thyme and lemon", 0.85),
+    ("Roast chicken with thyme", 0.8),
+    ("Chicken noodle soup", 0.6),
+    ("Chocolate cake", 0.1),
+]
+VECTORS = [unit(1, 0, 0), unit(1, 0.05, 0), unit(1, 0, 0), unit(0.6, 0.8, 0), unit(0, 0, 1)]
+
+
+def words(text: str) -> int:
+    return len(text.split())
+
+
+def test_near_duplicates_and_identical_texts_are_dropped():
+    (selected, stats) = select_context(HITS, VECTORS, k=5)
+
+    texts = [text for (text, _) in selected]
+    assert "Roast chicken with thyme and lemon" not in texts
+    assert texts.count("Roast chicken with thyme") == 1
+    assert (stats["candidates"], stats["duplicates"], stats["selected"]) == (5, 2, 3)
+
+
+def test_lambda_one_keeps_the_relevance_order():
+    # Orthogonal except for the first two, which MMR with lambda < 1 would split up
+    vectors = [unit(1, 0, 0, 0), unit(0.9, 0.43, 0, 0), unit(0, 0, 1, 0), unit(0, 0, 0, 1)]
+    scores = [0.9, 0.8, 0.7, 0.6]
+    similarities = np.array(vectors) @ np.array(vectors).T
+
+    assert mmr_order(scores, similarities, 1.0) == [0, 1, 2, 3]
+    assert mmr_order(scores, similarities, 0.5) == [0, 2, 3, 1]
+
+
+def test_the_token_budget_is_never_exceeded():
+    hits = [(" ".join(["word"] * length), 1.0 - n / 10) for (n, length) in enumerate([40, 25, 10, 30, 5, 8])]
+    vectors = np.eye(len(hits), dtype=np.float32)
+
+    for max_tokens in (4, 5, 12, 33, 50, 75, 200):
+        (selected, stats) = select_context(hits, vectors, k=6, max_tokens=max_tokens, count=words)
+        assert selected
+        assert sum(words(text) for (text, _) in selected) == stats["tokens"] <= max_tokens
+    # A document that doesn't fit is skipped for shorter ones further down
+    (selected, _) = select_context(hits, vectors, k=6, max_tokens=50, count=words)
+    assert [words(text) for (text, _) in selected] == [40, 10]
+
+
+def test_the_first_document_is_cut_when_nothing_fits():
+    (selected, stats) = select_context([("a" * 400, 1.0)], max_tokens=20)
+
+    assert stats["truncated"]
+    assert approximate_tokens(selected[0][0]) <= 20
+    assert truncate("a" * 400, 20, approximate_tokens) == selected[0][0]
@@ -0,0 +1,91 @@
+import sys
+import types
+
+import pytest
+
+from brigade import corpus
+from brigade.corpus import (CorpusSnapshot, digest_path, iter_recipe_texts, load_recipe_dataset, load_recipe_texts,
+                            load_snapshot, write_snapshot)
+
+ROWS = [
+    {"instruction": "Roast chicken", "output": "Roast at 200°C for an hour."},
+    {"instruction": "Gruyère toast", "output": None},
+    {"instruction": "Tomato soup", "output": "Simmer the tomatoes with basil."},
+    {"instruction": None, "output": "An answer without a question."},
+    {"instruction": "Water", "output": ""},
+]
+
+
+class Dataset:
+    """The parts of a Hugging Face dataset the corpus module uses."""
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, rows: slice) -> dict:
+        return {column: [row[column] for row in self.rows[rows]] for column in ("instruction", "output")}
+
+    def filter(self, keep):
+        return Dataset([row for row in self.rows if keep(row)])
+
+
+@pytest.fixture
+def datasets(monkeypatch):
+    module = types.ModuleType("datasets")
+    module.load_dataset = lambda name, split: Dataset(ROWS)
+    monkeypatch.setitem(sys.modules, "datasets", module)
+
+
+def test_snapshot_round_trip(tmp_path):
+    texts = ["Roast chicken", "", "Gruyère toast ✓", "Tomato soup\nwith basil"]
+
+    write_snapshot(str(tmp_path / "corpus.bin"), iter(texts), b"d" * 32).close()
+    snapshot = CorpusSnapshot(str(tmp_path / "corpus.bin"))
+
+    assert list(snapshot) == texts
+    assert (len(snapshot), snapshot[2], snapshot[-1]) == (4, "Gruyère toast ✓", "Tomato soup\nwith basil")
+    assert snapshot.index_digest == b"d" * 32
+    snapshot.close()
+
+
+def test_incomplete_rows_are_left_out_so_snapshot_rows_are_dataset_rows(datasets):
+    # Rows with a missing instruction or output have no text; an empty output is still a text
+    assert load_recipe_texts() == [
+        "Roast chicken Roast at 200°C for an hour.", "Tomato soup Simmer the tomatoes with basil.", "Water ",
+    ]
+    assert len(load_recipe_dataset()) == 3
+
+    with pytest.raises(ValueError, match="incomplete rows"):
+        list(iter_recipe_texts(Dataset(ROWS), chunk_size=2))
+
+
+def test_snapshot_is_rebuilt_from_the_dataset_when_the_index_changes(datasets, tmp_path):
+    (index_path, path) = (tmp_path / "faiss.index", str(tmp_path / "corpus.bin"))
+    index_path.write_bytes(b"index")
+    write_snapshot(path, ["A recipe from another index"], b"\0" * 32).close()
+
+    snapshot = load_snapshot(path, str(index_path))
+
+    assert list(snapshot) == load_recipe_texts()
+    snapshot.close()
+
+
+def test_index_digest_is_hashed_once_until_the_index_changes(monkeypatch, tmp_path):
+    index_path = tmp_path / "faiss.index"
+    index_path.write_bytes(b"index")
+    path = str(tmp_path / "corpus.bin")
+    hashed = []
+    file_digest = corpus.file_digest
+    monkeypatch.setattr(corpus, "file_digest", lambda path: hashed.append(path) or file_digest(path))
+
+    load_snapshot(path, str(index_path), lambda: ["Roast chicken"]).close()
+    load_snapshot(path, str(index_path), None).close()
+    assert len(hashed) == 1
+    assert (tmp_path / digest_path("faiss.index")).exists()
+
+    index_path.write_bytes(b"another index")
+    with pytest.raises(ValueError, match="does not match"):
+        load_snapshot(path, str(index_path), None)
+    assert len(hashed) == 2
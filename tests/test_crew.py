@@ -0,0 +1,56 @@
+import pytest
+
+from brigade.crew import Crew
+
+ROLES = {
+    "Sous Chef": [1, "Second-in-command."],
+    "Commis": [300, "Junior cook.", ["Plongeur", "Garde Manger"]],
+    "Tournant": [2, "Swing cook.", ["Plongeur"]],
+    "Garde Manger": [0, "Cold kitchen."],
+}
+
+
+def test_agents_are_created_on_first_use_only():
+    made = []
+    crew = Crew(ROLES, lambda member: made.append(member) or (lambda task: {"result": f"[{member}] {task}"}))
+
+    # Sizing, iterating, membership and prompts don't create agents
+    assert len(crew) == 303 and len(list(crew)) == 303
+    assert "Commis 300" in crew and "Commis 301" not in crew and "Garde Manger 1" not in crew
+    assert crew.describe().splitlines() == ["Sous Chef [1]", "Commis [300]", "Tournant [2]", "Garde Manger [0]"]
+    assert crew.roster() == ["Sous Chef 1", "Commis 1-300", "Tournant 1-2"]
+    assert crew.agents_created == 0
+
+    assert crew["Commis 7"]("Peel")["result"] == "[Commis 7] Peel"
+    crew["Commis 7"]
+    assert (crew.agents_created, made) == (1, ["Commis 7"])
+    with pytest.raises(KeyError):
+        crew["Commis 301"]
+    assert crew.agents_created == 1
+
+
+def test_an_absent_role_falls_back_to_its_stand_ins():
+    crew = Crew(ROLES)
+
+    # No Plongeur in the crew: Commis, then Tournants, take its tasks
+    assert list(crew.qualified_members("Plongeur"))[:2] == ["Commis 1", "Commis 2"]
+    assert list(crew.qualified_members("Plongeur"))[-2:] == ["Tournant 1", "Tournant 2"]
+    # A role with no members counts as absent too
+    assert next(crew.qualified_members("Garde Manger")) == "Commis 1"
+    # Own members come first; a role nobody covers has only its own
+    assert list(crew.qualified_members("Tournant")) == ["Tournant 1", "Tournant 2"]
+    assert list(crew.qualified_members("Saucier")) == []
+
+
+def test_member_ids_and_roles():
+    crew = Crew(ROLES)
+
+    assert crew.role_of("Sous Chef 1") == "Sous Chef"
+    assert crew.role_of("Sous Chef 2") is None
+    assert Crew.split("Garde Manger 12") == ("Garde Manger", 12)
+    # A bare role name resolves only for a single-member role
+    assert (crew.resolve("Sous Chef"), crew.resolve("Tournant"), crew.resolve("Tournant 2")) == (
+        "Sous Chef 1", None, "Tournant 2",
+    )
+    # IDs are interned, so equal IDs are the same object
+    assert crew.resolve("Commis 12") is next(member for member in crew.members_of("Commis") if member == "Commis 12")
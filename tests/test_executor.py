@@ -0,0 +1,50 @@
+import time
+
+from brigade.executor import run_schedule
+
+
+def recording_agent(name, log, seconds=0.2):
+    def agent(task):
+        started = time.monotonic()
+        time.sleep(seconds)
+        log.append((task, started, time.monotonic()))
+        return {"result": f"{name}: {task}"}
+    return agent
+
+
+def test_steps_run_in_order_and_the_tasks_of_a_step_overlap():
+    log = []
+    staff = {member: recording_agent(member, log) for member in ("Saucier", "Commis", "Plongeur")}
+    schedule = [
+        (1, [("Saucier", "Make the roux"), ("Commis", "Peel the onions")]),
+        (2, [("Plongeur", "Wash the pans")]),
+    ]
+
+    results, timings = run_schedule(schedule, staff, max_workers=4)
+
+    spans = {task: (started, ended) for (task, started, ended) in log}
+    roux, onions, pans = spans["Make the roux"], spans["Peel the onions"], spans["Wash the pans"]
+    # Both tasks of T1 run at the same time...
+    assert roux[0] < onions[1] and onions[0] < roux[1]
+    # ...and T2 starts only once both are done
+    assert pans[0] >= max(roux[1], onions[1])
+
+    assert results == {"Saucier": "Saucier: Make the roux", "Commis": "Commis: Peel the onions",
+                       "Plongeur": "Plongeur: Wash the pans"}
+    assert [step["step"] for step in timings["steps"]] == [1, 2]
+    assert len(timings["tasks"]) == 3
+    # The parallel step takes about as long as one of its tasks, not both
+    assert timings["steps"][0]["wall_seconds"] < 0.35
+
+
+def test_a_member_works_through_their_tasks_of_a_step_in_order():
+    log = []
+    schedule = [(1, [("Commis", "Peel the carrots"), ("Commis", "Dice the carrots")])]
+
+    results, timings = run_schedule(schedule, {"Commis": recording_agent("Commis", log, 0.05)})
+
+    assert [task for (task, _, _) in log] == ["Peel the carrots", "Dice the carrots"]
+    assert log[1][1] >= log[0][2]
+    assert results["Commis"] == "Commis: Peel the carrots\nCommis: Dice the carrots"
+    step = timings["steps"][0]
+    assert step["critical_path_seconds"] >= 0.1 and step["members"] == 1
@@ -0,0 +1,75 @@
+import types
+
+from brigade.crew import Crew
+from brigade.incremental import affected_steps, plan_from_json, plan_to_json, reusable_docs, splice
+from brigade.plan import parse_plan
+from brigade.resources import parse_inventory
+
+BEFORE = Crew({"Commis": [2, "Junior cook."], "Saucier": [1, "Prepares sauces."], "Plongeur": [1, "Washes up."]})
+# One Commis and the Plongeur fewer
+AFTER = Crew({"Commis": [1, "Junior cook."], "Saucier": [1, "Prepares sauces."]})
+
+PLAN = """T1: Prep
+- Commis 1: Peel the shallots
+- Commis 2: Peel the potatoes
+T2 (after T1): Sauce
+- Saucier 1: Reduce the stock in the saucepan
+T3 (after T1): Wash up
+- Plongeur 1: Wash the prep bowls
+- Commis 1: Dry the prep bowls
+T4 (after T2, T3): Plate
+- Commis 1: Plate the potatoes
+"""
+
+
+def test_steps_of_members_no_longer_in_the_team_are_affected():
+    plan = parse_plan(PLAN, BEFORE)
+
+    affected = affected_steps(plan, AFTER)
+
+    assert affected == {1: ["Commis 2 is no longer in the team"], 3: ["Plongeur 1 is no longer in the team"]}
+
+
+def test_steps_using_changed_resources_are_affected():
+    plan = parse_plan(PLAN, BEFORE)
+    before = parse_inventory("#### Utensils:\n- 1 saucepan\n- 2 bowls\n")
+    after = parse_inventory("#### Utensils:\n- 2 saucepans\n- 2 bowls\n")
+
+    assert affected_steps(plan, BEFORE, before, after) == {2: ["the available saucepan changed"]}
+
+
+def test_splice_replaces_affected_steps_and_keeps_the_rest():
+    plan = parse_plan(PLAN, BEFORE)
+    affected = affected_steps(plan, AFTER)
+    # The planner only answers for T1, and leaves T3 out
+    replacement = parse_plan("T1: Prep\n- Commis 1: Peel the shallots and the potatoes\n", AFTER)
+
+    spliced = splice(plan, replacement, affected, AFTER)
+
+    assert [step.number for step in spliced.steps] == [1, 2, 3, 4]
+    assert [task.text for task in spliced.steps[0].tasks] == ["Peel the shallots and the potatoes"]
+    # The left-out step keeps its tasks, without those of members who left, which are reported
+    assert [(task.member, task.text) for task in spliced.steps[2].tasks] == [("Commis 1", "Dry the prep bowls")]
+    assert [(item.text, item.reason) for item in spliced.unparsed] == [
+        ("Plongeur 1: Wash the prep bowls", "Plongeur 1 is no longer in the team"),
+    ]
+    # Unaffected steps are the previous ones, and every step keeps its dependencies
+    assert spliced.steps[1].tasks == plan.steps[1].tasks
+    assert [step.depends_on for step in spliced.steps] == [(), (1,), (1,), (2, 3)]
+
+
+def test_plans_round_trip_through_the_run_state():
+    plan = parse_plan(PLAN, BEFORE)
+
+    assert plan_to_json(plan_from_json(plan_to_json(plan))) == plan_to_json(plan)
+
+
+def test_docs_are_reused_only_with_the_same_context_options():
+    args = types.SimpleNamespace(context_docs=5, context_tokens=2000, mmr_lambda=0.7)
+    state = {"docs": ["Roast chicken"], "context": {"context_docs": 5, "context_tokens": 2000, "mmr_lambda": 0.7}}
+
+    assert reusable_docs(state, args) == ["Roast chicken"]
+    assert reusable_docs(state, types.SimpleNamespace(**dict(vars(args), mmr_lambda=1.0))) is None
+    assert reusable_docs(state, types.SimpleNamespace(**dict(vars(args), context_docs=3))) is None
+    # A state saved before the options were recorded is not reused either
+    assert reusable_docs({"docs": ["Roast chicken"]}, args) is None
@@ -0,0 +1,152 @@
+import os
+from unittest import mock
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from brigade import ingest
+from brigade.backends import load_delta_index
+from brigade.corpus import CorpusSnapshot, file_digest, load_snapshot
+from brigade.ingest import compact, delta_path, load_manifest, load_tombstones, recover_swap
+from brigade.lexical import build_lexical_index, load_lexical_index
+from brigade.retrieval import search_ids
+from brigade.synthetic import HashingEmbedder, build_synthetic_index
+
+CORPUS = 50
+
+
+@pytest.fixture
+def files(tmp_path):
+    (index, snapshot, _) = build_synthetic_index(str(tmp_path), CORPUS)
+    snapshot.close()
+    del index
+    return tuple(str(tmp_path / name) for name in
+                 ("embeddings.npy", "faiss.index", "corpus.bin", "lexical.bin", "ingest.json"))
+
+
+def add(files, documents, delete_missing=True):
+    return ingest.ingest(documents, HashingEmbedder(), *files, delete_missing=delete_missing)
+
+
+def corpus(files) -> list:
+    snapshot = CorpusSnapshot(files[2])
+    texts = list(snapshot)
+    snapshot.close()
+    return texts
+
+
+def test_new_recipes_are_appended(files):
+    result = add(files, {"soup": "Tomato soup with basil", "tart": "Lemon tart"})
+    assert (result["added"], result["rows"], result["tombstones"]) == (2, CORPUS + 2, 0)
+    assert np.load(files[0], mmap_mode="r").shape[0] == CORPUS + 2
+    assert corpus(files)[CORPUS:] == ["Tomato soup with basil", "Lemon tart"]
+    # Unchanged recipes are not embedded again
+    assert add(files, {"soup": "Tomato soup with basil", "tart": "Lemon tart"})["rows"] == CORPUS + 2
+
+
+def test_ingest_appends_in_place_and_leaves_the_main_files_alone(files, tmp_path):
+    texts = CorpusSnapshot(files[2])
+    load_lexical_index(files[3], texts).close()
+    texts.close()
+    with open(files[1], "rb") as f:
+        index_bytes = f.read()
+    lexical_digest = file_digest(files[3])
+    snapshot_inode = os.stat(files[2]).st_ino
+
+    result = add(files, {"soup": "Tomato soup with basil", "tart": "Lemon tart"})
+
+    assert result["unmerged"] == 2
+    with open(files[1], "rb") as f:
+        assert f.read() == index_bytes
+    assert file_digest(files[3]) == lexical_digest
+    assert os.stat(files[2]).st_ino == snapshot_inode
+    # The delta segments hold the new rows, under their row ids
+    texts = CorpusSnapshot(files[2])
+    index = load_delta_index(faiss.read_index(files[1]), delta_path(files[1]), len(texts))
+    assert index.ntotal == CORPUS + 2
+    (_, I) = index.search(HashingEmbedder().encode(["Lemon tart"]), 1)
+    assert I[0][0] == CORPUS + 1
+    lexical = load_lexical_index(files[3], texts, delta_path(files[3]))
+    assert len(lexical) == CORPUS + 2
+    assert lexical.search("lemon tart", 1)[0][0] == CORPUS + 1
+    # Scored with the statistics of the whole corpus, as one index would
+    whole = build_lexical_index(str(tmp_path / "whole.bin"), texts, texts.index_digest)
+    for (hits, expected) in zip(lexical.search_many(["tomato soup", "lemon"], 5),
+                                whole.search_many(["tomato soup", "lemon"], 5)):
+        assert [row for (row, _) in hits] == [row for (row, _) in expected]
+        assert [score for (_, score) in hits] == pytest.approx([score for (_, score) in expected])
+    whole.close()
+    lexical.close()
+    texts.close()
+
+
+def test_a_stale_snapshot_with_ingested_recipes_is_not_rebuilt_from_the_dataset(files):
+    add(files, {"soup": "Tomato soup with basil"})
+    with open(files[1], "ab") as f:
+        f.write(b"\0")
+
+    with pytest.raises(ValueError, match="without losing recipes added by brigade.ingest"):
+        load_snapshot(files[2], files[1], None)
+
+
+def test_changed_and_missing_recipes_are_tombstoned(files):
+    add(files, {"soup": "Tomato soup with basil", "tart": "Lemon tart"})
+    result = add(files, {"soup": "Tomato soup with basil and cream"})
+    assert (result["updated"], result["deleted"], result["rows"]) == (1, 1, CORPUS + 3)
+    assert load_tombstones(files[4], CORPUS + 3) == {CORPUS, CORPUS + 1}
+    assert load_manifest(files[4])["documents"]["soup"]["row"] == CORPUS + 2
+
+
+def test_keep_missing_keeps_recipes_not_in_the_source(files):
+    add(files, {"soup": "Tomato soup with basil", "tart": "Lemon tart"})
+    add(files, {"soup": "Tomato soup with basil"}, delete_missing=False)
+    assert load_tombstones(files[4], CORPUS + 2) == frozenset()
+
+
+def test_tombstoned_rows_are_not_retrieved(files):
+    add(files, {"soup": "Tomato soup with basil"})
+    add(files, {"soup": "Tomato soup with fresh basil"})
+    tombstones = load_tombstones(files[4], CORPUS + 2)
+    index = load_delta_index(faiss.read_index(files[1]), delta_path(files[1]), CORPUS + 2)
+    hits = search_ids(HashingEmbedder(), index, ["tomato soup with basil"], 3, tombstones=tombstones)
+    rows = [row for (row, _) in hits[0]]
+    assert CORPUS not in rows
+    assert rows[0] == CORPUS + 1
+
+
+def test_compaction_remaps_rows(files):
+    add(files, {"soup": "Tomato soup with basil", "tart": "Lemon tart", "stew": "Beef stew"})
+    add(files, {"soup": "Tomato soup with basil and cream", "stew": "Beef stew"})
+    before = {key: corpus(files)[entry["row"]] for (key, entry) in load_manifest(files[4])["documents"].items()}
+    vectors = {key: np.array(np.load(files[0], mmap_mode="r")[entry["row"]])
+               for (key, entry) in load_manifest(files[4])["documents"].items()}
+
+    assert compact(*files) == 2
+    assert not os.path.exists(delta_path(files[1])) and not os.path.exists(delta_path(files[3]))
+    assert faiss.read_index(files[1]).ntotal == CORPUS + 2
+    manifest = load_manifest(files[4])
+    assert (manifest["rows"], manifest["tombstones"]) == (CORPUS + 2, [])
+    texts = corpus(files)
+    embeddings = np.load(files[0], mmap_mode="r")
+    assert len(texts) == embeddings.shape[0] == CORPUS + 2
+    for (key, entry) in manifest["documents"].items():
+        assert texts[entry["row"]] == before[key]
+        np.testing.assert_array_equal(embeddings[entry["row"]], vectors[key])
+    assert compact(*files) == 0
+
+
+def test_interrupted_swap_is_finished(files):
+    add(files, {"soup": "Tomato soup with basil"})
+    with mock.patch.object(ingest, "commit_rows", side_effect=KeyboardInterrupt):
+        with pytest.raises(KeyboardInterrupt):
+            add(files, {"soup": "Tomato soup with basil", "tart": "Lemon tart"})
+    # The snapshot is already committed, but the new embeddings row is not visible yet
+    assert len(corpus(files)) == CORPUS + 2
+    assert np.load(files[0], mmap_mode="r").shape[0] == CORPUS + 1
+
+    recover_swap(files[1])
+    assert not os.path.exists(f"{files[1]}.swap")
+    assert np.load(files[0], mmap_mode="r").shape[0] == CORPUS + 2
+    assert load_manifest(files[4])["documents"]["tart"]["row"] == CORPUS + 1
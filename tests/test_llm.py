@@ -0,0 +1,95 @@
+import sys
+import types
+
+import pytest
+
+from brigade.llm import LLMWrapper
+from brigade.trace import Tracer
+
+
+@pytest.fixture
+def watsonx(monkeypatch):
+    """A stand-in for the ibm_watsonx_ai SDK that records the calls made to it."""
+    calls = []
+
+    class ModelInference:
+        def __init__(self, model_id, api_client):
+            calls.append(("init", model_id))
+
+        def generate_text(self, prompt, params=None, raw_response=False):
+            calls.append(("generate_text", prompt, params, raw_response))
+            return {"results": [{"generated_text": "T1: Prep", "input_token_count": 12,
+                                 "generated_token_count": 3}]}
+
+    sdk = types.ModuleType("ibm_watsonx_ai")
+    sdk.APIClient = lambda credentials: object()
+    sdk.Credentials = lambda url, token: None
+    models = types.ModuleType("ibm_watsonx_ai.foundation_models")
+    models.ModelInference = ModelInference
+    monkeypatch.setitem(sys.modules, "ibm_watsonx_ai", sdk)
+    monkeypatch.setitem(sys.modules, "ibm_watsonx_ai.foundation_models", models)
+    monkeypatch.setenv("WATSONX_URL", "https://watsonx.example")
+    monkeypatch.setenv("WATSONX_APIKEY", "key")
+    return calls
+
+
+def test_watsonx_generate_uses_the_raw_response_and_its_token_counts(watsonx):
+    llm = LLMWrapper("watsonx", "ibm/granite", tracer=Tracer())
+
+    assert llm.generate("Plan the roast", max_new_tokens=50) == "T1: Prep"
+    assert llm.generate("Plan the stew") == "T1: Prep"
+
+    # One model handle for every call
+    assert watsonx == [
+        ("init", "ibm/granite"),
+        ("generate_text", "Plan the roast", {"max_new_tokens": 50}, True),
+        ("generate_text", "Plan the stew", None, True),
+    ]
+    span = llm.tracer.spans[0]
+    assert (span.attributes["prompt_tokens"], span.attributes["completion_tokens"]) == (12, 3)
+
+
+@pytest.fixture
+def openai(monkeypatch):
+    """A stand-in for the openai SDK that counts the async clients made and closed."""
+    made = []
+
+    class Usage:
+        prompt_tokens = 10
+        completion_tokens = 2
+
+    class Completions:
+        def __init__(self, client):
+            self.client = client
+
+        async def create(self, model, messages, **params):
+            assert not self.client.closed
+            message = types.SimpleNamespace(content=f" {messages[0]['content'].upper()} ")
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=Usage())
+
+    class AsyncOpenAI:
+        def __init__(self, api_key, timeout, max_retries):
+            self.closed = False
+            self.chat = types.SimpleNamespace(completions=Completions(self))
+            made.append(self)
+
+        async def close(self):
+            self.closed = True
+
+    sdk = types.ModuleType("openai")
+    sdk.OpenAI = lambda api_key, timeout, max_retries: types.SimpleNamespace(api_key=api_key)
+    sdk.AsyncOpenAI = AsyncOpenAI
+    monkeypatch.setitem(sys.modules, "openai", sdk)
+    monkeypatch.setenv("OPENAI_API_KEY", "key")
+    return made
+
+
+def test_one_async_client_serves_every_concurrent_call_until_close(openai):
+    llm = LLMWrapper("openai", "gpt-4o")
+
+    assert llm.generate_concurrently(["plan", "execute"]) == ["PLAN", "EXECUTE"]
+    assert llm.generate_concurrently(["judge"]) == ["JUDGE"]
+
+    assert len(openai) == 1 and not openai[0].closed
+    llm.close()
+    assert openai[0].closed
@@ -0,0 +1,23 @@
+from brigade.mock import DEFAULT_RESPONSES, MockClient, load_recordings
+
+
+def test_batch_run_directories_are_not_replayed(tmp_path):
+    recorded = tmp_path / "recorded"
+    recorded.mkdir()
+    (recorded / "plan-feedback.txt").write_text("Recorded feedback")
+    batch_run = tmp_path / "scenarios" / "hamburger" / "crew"
+    batch_run.mkdir(parents=True)
+    (batch_run / "plan-feedback.txt").write_text("Mock output of a batch run")
+    (batch_run / "run.log").write_text("")
+
+    assert load_recordings(str(tmp_path))["plan-feedback.txt"] == ["Recorded feedback"]
+
+
+def test_default_recordings_are_the_checked_in_fixtures(monkeypatch, tmp_path):
+    monkeypatch.delenv("MOCK_LLM_RESPONSES", raising=False)
+    monkeypatch.chdir(tmp_path)
+
+    client = MockClient()
+
+    assert client.root == DEFAULT_RESPONSES
+    assert len(client.recordings["execution-plan.txt"]) == 9
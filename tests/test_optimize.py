@@ -0,0 +1,65 @@
+from brigade.crew import Crew
+from brigade.optimize import balance_plan, merge_steps, plan_metrics
+from brigade.plan import parse_plan
+
+CREW = Crew({
+    "Sous Chef": [1, "Second-in-command."],
+    "Saucier": [2, "Prepares sauces."],
+    "Commis": [2, "Junior cook.", ["Plongeur"]],
+    "Plongeur": [1, "Washes up."],
+})
+
+PLAN = """T1: Prep
+- Commis 1: Peel the shallots
+T2 (after T1): Sauce base
+- Saucier 1: Sweat the shallots
+T3 (after T1): Wash up
+- Plongeur 1: Wash the prep bowls
+T4 (after T2, T3): Finish
+- Sous Chef 1: Taste the sauce
+"""
+
+
+def test_independent_steps_are_merged_and_dependency_order_kept():
+    plan = parse_plan(PLAN, CREW)
+
+    (merged, merges) = merge_steps(plan)
+
+    # T3 only waits for T1, so it runs together with T2
+    assert merges == [(3, 2)]
+    assert [step.number for step in merged.steps] == [1, 2, 4]
+    assert [(task.step, task.member) for task in merged.steps[1].tasks] == [(2, "Saucier 1"), (2, "Plongeur 1")]
+    assert merged.steps[1].title == "Sauce base; Wash up"
+    assert [step.depends_on for step in merged.steps] == [(), (1,), (2,)]
+    assert plan_metrics(merged, CREW)["step_count"] == 3
+
+
+def test_steps_without_after_stay_in_sequence():
+    plan = parse_plan("T1: Prep\n- Commis 1: Peel\nT2: Cook\n- Saucier 1: Reduce\nT3: Plate\n- Sous Chef 1: Plate\n",
+                      CREW)
+
+    (merged, merges) = merge_steps(plan)
+
+    assert merges == []
+    assert [step.number for step in merged.steps] == [1, 2, 3]
+
+
+def test_tasks_move_only_to_qualified_members():
+    plan = parse_plan("""T1: Everything
+- Plongeur 1: Wash the pans
+- Plongeur 1: Wash the bowls
+- Plongeur 1: Wash the knives
+- Sous Chef 1: Taste the sauce
+- Sous Chef 1: Check the seasoning
+""", CREW)
+
+    (balanced, moves) = balance_plan(plan, CREW)
+
+    # Commis cover for the Plongeur; nobody covers for the Sous Chef, and the idle Sauciers cover for no one
+    assert moves
+    assert all(CREW.role_of(target) == "Commis" for (_, source, target) in moves)
+    assert all(source == "Plongeur 1" for (_, source, _) in moves)
+    members = [task.member for task in balanced.steps[0].tasks]
+    assert members.count("Sous Chef 1") == 2
+    assert not any(member.startswith("Saucier") for member in members)
+    assert plan_metrics(balanced, CREW)["makespan"] < plan_metrics(plan, CREW)["makespan"]
@@ -0,0 +1,73 @@
+from brigade.crew import Crew
+from brigade.plan import PlanParser, parse_plan
+
+CREW = Crew({
+    "Sous Chef": [2, "Second-in-command."],
+    "Saucier": [1, "Prepares sauces."],
+    "Plongeur": [1, "Washes up."],
+})
+
+PLAN = """Here's the plan for the roast chicken:
+
+**T1: Prep**
+- **Sous Chef 1**: Season the chicken
+* Saucier: Dice the shallots
+- Rotisseur 1: Truss the chicken
+- Preheat the oven
+
+### T2 (after T1) - Roast
+1. Sous Chef 2: Roast the chicken
+T3: Sauce
+- Saucier 1: Make the pan sauce
+T4 (after T2, T3): Plate
+- Plongeur 1: Wash the roasting pan
+"""
+
+
+def test_tasks_are_routed_to_crew_members():
+    plan = parse_plan(PLAN, CREW)
+    assert plan.schedule() == [
+        (1, [("Sous Chef 1", "Season the chicken"), ("Saucier 1", "Dice the shallots")]),
+        (2, [("Sous Chef 2", "Roast the chicken")]),
+        (3, [("Saucier 1", "Make the pan sauce")]),
+        (4, [("Plongeur 1", "Wash the roasting pan")]),
+    ]
+    assert [step.title for step in plan.steps] == ["Prep", "Roast", "Sauce", "Plate"]
+
+
+def test_unparsed_lines_are_kept_with_a_reason():
+    plan = parse_plan(PLAN, CREW)
+    assert [(unparsed.line, unparsed.reason) for unparsed in plan.unparsed] == [
+        (6, "unknown team member 'Rotisseur 1'"),
+        (7, "no 'Team member: Task' separator"),
+    ]
+    assert plan.unparsed[1].text == "- Preheat the oven"
+
+
+def test_preamble_is_not_unparsed():
+    plan = parse_plan("Sure! Here is the plan.\nT1: Prep\n- Saucier 1: Dice the shallots", CREW)
+    assert plan.unparsed == []
+    assert len(list(plan.tasks())) == 1
+
+
+def test_dependencies_default_to_the_previous_step():
+    plan = parse_plan(PLAN, CREW)
+    assert [step.depends_on for step in plan.steps] == [(), (1,), (2,), (2, 3)]
+
+
+def test_render_round_trips():
+    plan = parse_plan(PLAN, CREW)
+    again = parse_plan(plan.render(), CREW)
+    assert again.schedule() == plan.schedule()
+    assert [step.depends_on for step in again.steps] == [step.depends_on for step in plan.steps]
+    assert again.unparsed == []
+
+
+def test_lines_can_be_fed_one_at_a_time():
+    parser = PlanParser(["Saucier 1", "Sous Chef 1", "Sous Chef 2"])
+    tasks = [parser.feed(line) for line in ["T1: Prep", "- Saucier: Dice the shallots", "- Sous Chef: Season"]]
+    assert tasks[0] is None
+    assert (tasks[1].step, tasks[1].member) == (1, "Saucier 1")
+    # 'Sous Chef' is ambiguous with two of them
+    assert tasks[2] is None
+    assert parser.plan().unparsed[0].reason == "unknown team member 'Sous Chef'"
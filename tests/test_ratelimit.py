@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from brigade import ratelimit
+from brigade.ratelimit import DEFAULT, JUDGING, PLANNING, RequestScheduler, estimate_tokens
+
+
+def test_rpm_budget_delays_until_the_oldest_admission_leaves_the_window():
+    scheduler = RequestScheduler(rpm=2)
+    scheduler._admitted.extend([[100.0, 10], [130.0, 10]])
+    assert scheduler._delay(10, 140.0) == pytest.approx(20.0)
+    # The first admission has left the window
+    assert scheduler._delay(10, 161.0) == 0.0
+
+
+def test_tpm_budget_counts_reserved_tokens():
+    scheduler = RequestScheduler(tpm=1000)
+    reservation = scheduler.acquire(900)
+    now = time.monotonic()
+    assert scheduler._delay(200, now) > 0
+    # Settling with the tokens actually used frees the rest of the reservation
+    scheduler.settle(reservation, 100)
+    assert scheduler._delay(200, now) == 0.0
+
+
+def test_request_larger_than_the_tpm_budget_waits_for_an_empty_window():
+    scheduler = RequestScheduler(tpm=1000)
+    scheduler._admitted.append([100.0, 10])
+    assert scheduler._delay(5000, 110.0) == pytest.approx(50.0)
+    assert scheduler._delay(5000, 161.0) == 0.0
+
+
+def test_waiting_requests_are_admitted_by_priority(monkeypatch):
+    monkeypatch.setattr(ratelimit, "WINDOW_SECONDS", 0.3)
+    scheduler = RequestScheduler(rpm=1)
+    scheduler.acquire(1)
+
+    admitted = []
+
+    def request(priority):
+        scheduler.acquire(1, priority)
+        admitted.append(priority)
+
+    threads = [threading.Thread(target=request, args=(priority,)) for priority in (JUDGING, DEFAULT, PLANNING, DEFAULT)]
+    for thread in threads:
+        thread.start()
+    while scheduler.stats()["queue_depth"] < len(threads):
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    assert admitted == [PLANNING, DEFAULT, DEFAULT, JUDGING]
+
+
+def test_transient_errors_are_retried():
+    scheduler = RequestScheduler(backoff=0.0)
+    calls = []
+
+    def call():
+        calls.append(None)
+        if len(calls) < 3:
+            raise TimeoutError()
+        return "done"
+
+    assert scheduler.run(call, 10) == "done"
+    assert scheduler.stats()["retries"] == 2
+    assert scheduler.stats()["requests"] == 3
+
+
+def test_other_errors_are_not_retried():
+    scheduler = RequestScheduler(backoff=0.0)
+
+    def call():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        scheduler.run(call, 10)
+    assert (scheduler.stats()["retries"], scheduler.stats()["failures"]) == (0, 1)
+
+
+def test_reported_usage_settles_the_reservation():
+    scheduler = RequestScheduler(tpm=1000)
+
+    def call():
+        ratelimit.record_usage(prompt_tokens=30, completion_tokens=20)
+        return "done"
+
+    scheduler.run(call, 900)
+    assert [tokens for (_, tokens) in scheduler._admitted] == [50]
+
+
+def test_stream_settles_with_the_usage_reported_at_its_end():
+    scheduler = RequestScheduler(tpm=1000)
+
+    def start():
+        yield "a"
+        yield "b"
+        ratelimit.record_usage(prompt_tokens=30, completion_tokens=2)
+
+    assert list(scheduler.stream(start, 900)) == ["a", "b"]
+    assert [tokens for (_, tokens) in scheduler._admitted] == [32]
+
+
+def test_estimate_uses_the_completion_limit():
+    assert estimate_tokens("x" * 400, {"max_tokens": 50}) == 150
+    assert estimate_tokens("x" * 400, {}) == 100 + ratelimit.COMPLETION_TOKENS
@@ -0,0 +1,97 @@
+import pytest
+
+from brigade.plan import Plan, Step, Task
+from brigade.resources import ResourceLocks, contention_report, parse_inventory
+
+INGREDIENTS = """
+#### Ingredients:
+- 2 chicken breasts
+- 4 potatoes
+- 1/4 cup red wine
+- 1 1/2 cup chicken stock
+- Salt and pepper
+
+#### Utensils:
+- 3 paring knives
+- 1 9x13-inch roasting pan
+- Basting brush or spoon
+"""
+
+
+def test_counts_measures_and_plurals():
+    inventory = parse_inventory(INGREDIENTS)
+
+    assert inventory.capacity["paring knife"] == 3
+    assert inventory.capacity["potato"] == 4
+    assert inventory.capacity["chicken breast"] == 2
+    # Sizes and measures are not counts
+    assert inventory.capacity["roasting pan"] == 1
+    assert inventory.capacity["red wine"] == 1
+    assert inventory.capacity["chicken stock"] == 1
+    assert inventory.counted == {"paring knife", "potato", "chicken breast"}
+
+
+def test_or_and_list_two_resources_of_the_section_kind():
+    inventory = parse_inventory(INGREDIENTS)
+
+    assert inventory.kinds["salt"] == inventory.kinds["pepper"] == "ingredient"
+    assert inventory.kinds["basting brush"] == inventory.kinds["spoon"] == "utensil"
+
+
+def test_equipment_is_a_utensil_section():
+    inventory = parse_inventory("## Equipment\n- 2 skillets\n")
+    assert inventory.kinds == {"skillet": "utensil"}
+    assert inventory.capacity["skillet"] == 2
+
+
+def test_a_count_of_zero_is_an_error():
+    with pytest.raises(ValueError, match="count of 0"):
+        parse_inventory("#### Utensils:\n- 0 roasting pans\n")
+
+
+def test_tasks_use_the_longest_names_they_mention():
+    inventory = parse_inventory(INGREDIENTS)
+
+    assert inventory.uses("Whisk the chicken stock into the pan") == ("chicken stock", "roasting pan")
+    assert inventory.uses("Cut the potatoes using a knife") == ("paring knife", "potato")
+
+
+def test_only_utensils_are_locked():
+    inventory = parse_inventory(INGREDIENTS)
+    locks = ResourceLocks(inventory)
+
+    assert inventory.locked("Sear the chicken breasts in the roasting pan") == ("roasting pan",)
+    assert set(locks._semaphores) == {"paring knife", "roasting pan", "basting brush", "spoon"}
+
+
+def test_ingredients_do_not_serialize_a_step_but_utensils_do():
+    inventory = parse_inventory(INGREDIENTS)
+    step = Step(1, "Prep", [
+        Task(1, "Commis 1", "Season the chicken breasts", 1),
+        Task(1, "Commis 2", "Sear the chicken breasts", 2),
+        Task(1, "Cuisinier 1", "Roast the potatoes in the roasting pan", 3),
+        Task(1, "Cuisinier 2", "Roast the chicken breasts in the roasting pan", 4),
+    ])
+
+    report = contention_report(Plan([step]), inventory)
+
+    assert report["makespan"] == 1
+    assert report["limited_makespan"] == 2
+    assert [resource["resource"] for resource in report["resources"]] == ["roasting pan"]
+
+
+def test_ingredient_check_adds_up_the_counts_tasks_name():
+    inventory = parse_inventory(INGREDIENTS)
+    plan = Plan([
+        Step(1, "Prep", [Task(1, "Commis 1", "Peel 3 large potatoes", 1),
+                         Task(1, "Commis 2", "Trim 2 chicken breasts", 2)]),
+        Step(2, "Cook", [Task(2, "Cuisinier 1", "Roast 2 more potatoes", 3),
+                         Task(2, "Cuisinier 2", "Deglaze with 1/4 cup red wine", 4)]),
+    ])
+
+    check = {row["ingredient"]: row for row in contention_report(plan, inventory)["ingredients"]}
+
+    assert check["potato"]["needed"] == 5 and check["potato"]["short"]
+    assert check["chicken breast"]["needed"] == 2 and not check["chicken breast"]["short"]
+    # Measured ingredients are not counted
+    assert "red wine" not in check
@@ -0,0 +1,57 @@
+import pytest
+
+from brigade.lexical import build_lexical_index, tokenize
+from brigade.retrieval import RRF_K, fuse, search_ids
+
+RECIPES = [
+    "Roast chicken with root vegetables and thyme",
+    "Grilled cheese sandwich with gruyère",
+    "Tomato soup with basil",
+    "Chicken noodle soup",
+    "Chocolate cake",
+]
+
+
+@pytest.fixture
+def lexical(tmp_path):
+    index = build_lexical_index(str(tmp_path / "lexical.bin"), RECIPES, bytes(32))
+    yield index
+    index.close()
+
+
+def test_fuse_ranks_documents_found_by_both_rankings_first():
+    dense = [(1, 0.9), (2, 0.8), (3, 0.7)]
+    lexical = [(3, 12.0), (4, 9.0), (1, 3.0)]
+    fused = fuse([dense, lexical], 4)
+    assert [i for (i, _) in fused] == [1, 3, 2, 4]
+    assert fused[0][1] == pytest.approx((1 / (RRF_K + 1) + 1 / (RRF_K + 3)) / (2 / (RRF_K + 1)))
+
+
+def test_fuse_scores_first_in_every_ranking_as_one():
+    assert fuse([[(7, 0.5), (8, 0.4)], [(7, 3.0)]], 5)[0] == (7, 1.0)
+
+
+def test_fuse_ignores_empty_rankings():
+    assert fuse([[(1, 0.9), (2, 0.8)], []], 2) == fuse([[(1, 0.9), (2, 0.8)]], 2)
+    assert fuse([[], []], 2) == []
+
+
+def test_tokenize_folds_accents_and_plurals():
+    assert tokenize("Make me the Gruyère potatoes") == ["gruyere", "potato"]
+
+
+def test_lexical_search_finds_rare_words(lexical):
+    assert lexical.search("gruyere", 3)[0][0] == 1
+    # Both words beat either one
+    assert lexical.search("chicken soup", 5)[0][0] == 3
+
+
+def test_batched_search_matches_single_queries(lexical):
+    queries = ["chicken soup", "basil", "nothing matches this", "", "soup", "chicken"]
+    assert lexical.search_many(queries, 2) == [lexical.search_many([query], 2)[0] for query in queries]
+    assert lexical.search_many(queries, 2)[2:4] == [[], []]
+
+
+def test_tombstoned_rows_are_left_out(lexical):
+    hits = search_ids(None, None, ["soup"], 1, lexical=lexical, tombstones=frozenset({3}))
+    assert hits == [[(2, pytest.approx(lexical.search("soup", 2)[1][1]))]]
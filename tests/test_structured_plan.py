@@ -0,0 +1,86 @@
+from brigade.crew import Crew
+from brigade.structured_plan import MAX_ENUM_MEMBERS, generate_structured_plan, plan_schema
+
+CREW = Crew({"Saucier": [1, "Prepares sauces."], "Commis": [2, "Junior cook."]})
+
+
+class ScriptedLLM:
+    """Answers generate_json() calls with the given JSON answers in turn, recording the prompts."""
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.prompts = []
+
+    def generate_json(self, prompt, schema, name, priority=None):
+        self.prompts.append((name, prompt))
+        return self.answers.pop(0)
+
+
+def plan(*steps):
+    return {"steps": [{"step": number, "title": title, "after": after, "tasks": [
+        {"member": member, "task": task} for (member, task) in tasks
+    ]} for (number, title, after, tasks) in steps]}
+
+
+def test_a_valid_plan_is_not_repaired():
+    llm = ScriptedLLM(plan(
+        (1, "Prep", [], [("Commis 1", "Peel the shallots"), ("Commis 2", "Peel the potatoes")]),
+        (2, "Sauce", [1], [("Saucier 1", "Sweat the shallots")]),
+    ))
+    log = []
+
+    result = generate_structured_plan(llm, "Plan the dish", CREW, log=log)
+
+    assert [name for (name, _) in llm.prompts] == ["kitchen_plan"]
+    assert [(task.step, task.member, task.text) for task in result.tasks()] == [
+        (1, "Commis 1", "Peel the shallots"), (1, "Commis 2", "Peel the potatoes"), (2, "Saucier 1", "Sweat the shallots"),
+    ]
+    assert [step.depends_on for step in result.steps] == [(), (1,)]
+    assert result.unparsed == []
+    assert [stage for (stage, _, _) in log] == ["Planning"]
+
+
+def test_only_invalid_tasks_are_repaired():
+    llm = ScriptedLLM(
+        plan((1, "Prep", [], [("Commis 1", "Peel the shallots"), ("Poissonnier 1", "Fillet the sole"),
+                              ("Commis 2", "")])),
+        {"fixes": [{"id": 0, "member": "Commis 2", "task": "Fillet the sole"},
+                   {"id": 1, "member": "Commis 2", "task": "Wash the leeks"}]},
+    )
+
+    result = generate_structured_plan(llm, "Plan the dish", CREW)
+
+    (_, repair) = llm.prompts[1]
+    assert "'Poissonnier 1: Fillet the sole' (unknown team member 'Poissonnier 1')" in repair
+    assert "Peel the shallots" not in repair
+    assert [(task.member, task.text) for task in result.tasks()] == [
+        ("Commis 1", "Peel the shallots"), ("Commis 2", "Fillet the sole"), ("Commis 2", "Wash the leeks"),
+    ]
+    assert result.unparsed == []
+
+
+def test_tasks_still_invalid_after_the_last_repair_are_unparsed():
+    llm = ScriptedLLM(
+        plan((1, "Prep", [], [("Commis 1", "Peel the shallots"), ("Poissonnier 1", "Fillet the sole")])),
+        {"fixes": [{"id": 0, "member": "Poissonnier 2", "task": "Fillet the sole"}]},
+        {"fixes": []},
+    )
+
+    result = generate_structured_plan(llm, "Plan the dish", CREW, max_repairs=2)
+
+    assert [name for (name, _) in llm.prompts] == ["kitchen_plan", "kitchen_plan_fixes", "kitchen_plan_fixes"]
+    assert [task.text for task in result.tasks()] == ["Peel the shallots"]
+    assert [(item.text, item.reason) for item in result.unparsed] == [
+        ("T1: Poissonnier 2: Fillet the sole", "unknown team member 'Poissonnier 2'"),
+    ]
+
+
+def member_schema(crew) -> dict:
+    step = plan_schema(crew)["properties"]["steps"]["items"]
+    return step["properties"]["tasks"]["items"]["properties"]["member"]
+
+
+def test_large_crews_are_constrained_by_role_pattern():
+    crew = Crew({"Commis": [MAX_ENUM_MEMBERS + 1, "Junior cook."], "Saucier (Sauce)": [1, "Prepares sauces."]})
+
+    assert member_schema(crew) == {"type": "string", "pattern": r"^(?:Commis|Saucier \(Sauce\)) [1-9][0-9]*$"}
+    assert member_schema(CREW) == {"type": "string", "enum": ["Saucier 1", "Commis 1", "Commis 2"]}